@@ -0,0 +1,154 @@
+"""
+Audio ingest for the transcription API.
+
+Uploaded audio is decoded entirely in memory: the raw upload bytes are piped
+to ffmpeg over stdin and 16 kHz mono float32 PCM is read back from stdout,
+ready to hand straight to WhisperModel.transcribe. No temp files are written.
+StreamingDecoder does the same incrementally for live recordings.
+"""
+import asyncio
+import io
+import logging
+import subprocess
+from typing import Callable
+
+import numpy as np
+from faster_whisper import decode_audio
+
+logger = logging.getLogger(__name__)
+
+# Whisper models expect 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+
+class AudioDecodeError(Exception):
+    """Raised when an upload cannot be decoded into PCM audio."""
+
+
+def ffmpeg_decode_args(sample_rate: int = SAMPLE_RATE) -> list[str]:
+    """ffmpeg command reading any container on stdin, writing f32le PCM to stdout."""
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "f32le",
+        "-acodec", "pcm_f32le",
+        "-ar", str(sample_rate),
+        "-ac", "1",
+        "pipe:1",
+    ]
+
+
+def ffmpeg_pipe_decode(raw: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode audio bytes of any container format with ffmpeg over pipes.
+    Returns a float32 array in [-1, 1] at the requested sample rate.
+    """
+    try:
+        proc = subprocess.run(
+            ffmpeg_decode_args(sample_rate), input=raw, capture_output=True, check=False
+        )
+    except FileNotFoundError as e:
+        raise AudioDecodeError("ffmpeg is not installed") from e
+
+    if proc.returncode != 0 or not proc.stdout:
+        detail = proc.stderr.decode("utf-8", errors="replace").strip()
+        raise AudioDecodeError(detail or "ffmpeg produced no audio")
+
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+
+def decode_audio_bytes(raw: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode an upload into 16 kHz mono float32 PCM without touching disk.
+
+    ffmpeg reads from a non-seekable pipe, which fails for containers that
+    keep their index at the end of the file (e.g. MP4/M4A with a trailing
+    moov atom). Those fall back to PyAV decoding a seekable in-memory buffer.
+    """
+    if not raw:
+        raise AudioDecodeError("Empty audio upload")
+
+    try:
+        return ffmpeg_pipe_decode(raw, sample_rate)
+    except AudioDecodeError as e:
+        logger.info(f"ffmpeg pipe decode failed ({e}), retrying with in-memory PyAV decode")
+
+    try:
+        return decode_audio(io.BytesIO(raw), sampling_rate=sample_rate)
+    except Exception as e:
+        raise AudioDecodeError(f"Unsupported or corrupt audio: {e}") from e
+
+
+def pcm16_to_float32(raw: bytes) -> np.ndarray:
+    """Convert raw little-endian 16-bit PCM to float32 in [-1, 1]."""
+    usable = len(raw) - len(raw) % 2
+    return np.frombuffer(raw[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+
+
+class StreamingDecoder:
+    """
+    Incremental ffmpeg decode for live audio.
+
+    Container chunks (e.g. MediaRecorder's WebM/Opus timeslices) are fed to a
+    long-running ffmpeg process; PCM is passed to on_pcm as soon as ffmpeg
+    produces it, without waiting for the recording to end.
+    """
+
+    def __init__(self, on_pcm: Callable[[np.ndarray], None], sample_rate: int = SAMPLE_RATE):
+        self._on_pcm = on_pcm
+        self._sample_rate = sample_rate
+        self._proc = None
+        self._reader = None
+
+    async def start(self):
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                *ffmpeg_decode_args(self._sample_rate),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError as e:
+            raise AudioDecodeError("ffmpeg is not installed") from e
+        self._reader = asyncio.create_task(self._read_stdout())
+
+    async def feed(self, chunk: bytes):
+        try:
+            self._proc.stdin.write(chunk)
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise AudioDecodeError(await self._stderr() or "ffmpeg stopped accepting audio") from e
+
+    async def close(self):
+        """Signal end of input and wait for the remaining PCM to be delivered."""
+        if self._proc is None:
+            return
+        if not self._proc.stdin.is_closing():
+            self._proc.stdin.close()
+        await self._reader
+        returncode = await self._proc.wait()
+        if returncode != 0:
+            raise AudioDecodeError(await self._stderr() or f"ffmpeg exited with {returncode}")
+
+    def kill(self):
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+
+    async def _read_stdout(self):
+        pending = b""
+        while True:
+            data = await self._proc.stdout.read(65536)
+            if not data:
+                break
+            data = pending + data
+            # f32le samples are 4 bytes; carry a partial sample into the next read
+            usable = len(data) - len(data) % 4
+            pending = data[usable:]
+            if usable:
+                self._on_pcm(np.frombuffer(data[:usable], dtype=np.float32))
+
+    async def _stderr(self) -> str:
+        data = await self._proc.stderr.read()
+        return data.decode("utf-8", errors="replace").strip()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: in-memory ffmpeg pipe decode vs. the old temp-file path.
+
+The old /transcribe path wrote the upload to a temp .webm, had ffmpeg write a
+temp .wav, read it back, wrote it to another NamedTemporaryFile and let
+faster-whisper decode that file. The new path pipes bytes through ffmpeg and
+gets float32 PCM back directly.
+
+Usage (from backend/):
+    python benchmarks/bench_audio_ingest.py --seconds 30 --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faster_whisper import decode_audio  # noqa: E402
+
+from audio_ingest import SAMPLE_RATE, decode_audio_bytes  # noqa: E402
+
+# (container suffix, extra ffmpeg encoder args)
+FORMATS = [
+    (".webm", ["-c:a", "libopus"]),
+    (".ogg", ["-c:a", "libopus"]),
+    (".mp3", ["-c:a", "libmp3lame"]),
+    (".wav", ["-c:a", "pcm_s16le"]),
+]
+
+
+def make_sample(seconds: float, suffix: str, codec_args: list[str]) -> bytes:
+    """Synthesize a tone-plus-noise clip and encode it into the given container."""
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, f"sample{suffix}")
+        subprocess.run([
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}",
+            "-f", "lavfi", "-i", f"anoisesrc=duration={seconds}:amplitude=0.05",
+            "-filter_complex", "amix=inputs=2",
+            "-ar", "48000", "-ac", "1",
+            *codec_args, out_path, "-y",
+        ], check=True, capture_output=True)
+        with open(out_path, "rb") as f:
+            return f.read()
+
+
+def legacy_temp_file_path(raw: bytes, suffix: str):
+    """Reproduces the pre-pipe /transcribe ingest, up to the PCM whisper sees."""
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_in:
+        temp_in.write(raw)
+        temp_in_path = temp_in.name
+    temp_out_path = temp_in_path + ".wav"
+    try:
+        subprocess.run([
+            "ffmpeg", "-i", temp_in_path,
+            "-acodec", "pcm_s16le",
+            "-ar", str(SAMPLE_RATE),
+            "-ac", "1",
+            temp_out_path,
+            "-y",
+            "-loglevel", "error"
+        ], check=True, capture_output=True)
+        with open(temp_out_path, "rb") as f:
+            wav_data = f.read()
+    finally:
+        for path in (temp_in_path, temp_out_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+        tmp.write(wav_data)
+        tmp_path = tmp.name
+    try:
+        return decode_audio(tmp_path, sampling_rate=SAMPLE_RATE)
+    finally:
+        os.remove(tmp_path)
+
+
+def time_it(fn, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0, help="clip length in seconds")
+    parser.add_argument("--repeat", type=int, default=10, help="runs per format and path")
+    args = parser.parse_args()
+
+    print(f"Clip length: {args.seconds:.0f}s, {args.repeat} runs each\n")
+    print(f"{'format':<8}{'size KB':>10}{'temp-file ms':>16}{'pipe ms':>12}{'speedup':>10}")
+
+    for suffix, codec_args in FORMATS:
+        raw = make_sample(args.seconds, suffix, codec_args)
+
+        # Both paths must hand whisper the same number of samples
+        legacy = legacy_temp_file_path(raw, suffix)
+        piped = decode_audio_bytes(raw)
+        if abs(len(legacy) - len(piped)) > SAMPLE_RATE // 100:
+            print(f"warning: {suffix} sample count differs ({len(legacy)} vs {len(piped)})")
+
+        legacy_ms = statistics.median(time_it(lambda: legacy_temp_file_path(raw, suffix), args.repeat))
+        pipe_ms = statistics.median(time_it(lambda: decode_audio_bytes(raw), args.repeat))
+        print(f"{suffix:<8}{len(raw) / 1024:>10.1f}{legacy_ms:>16.1f}{pipe_ms:>12.1f}{legacy_ms / pipe_ms:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
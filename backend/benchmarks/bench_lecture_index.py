@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: lecture retrieval index build time, size and query latency.
+
+Synthesizes multi-hour lectures as /transcribe segments (about 150 words a
+minute, Zipf-distributed vocabulary), indexes each one and runs random
+queries drawn from its passages, reporting:
+    build     passage grouping, BM25 postings and writing the index
+    size      bytes of BM25 arrays and embedding matrix
+    load      reading the index back (the embedding matrix is memory-mapped)
+    query     p50/p95 search latency over --queries queries
+
+Embeddings are random --dimensions vectors by default, so the numbers cover
+storing and scanning the matrix but not the embedding model; pass
+--embed-model to embed with a local Ollama model instead (much slower to
+build). --no-embeddings benchmarks BM25 alone.
+
+Usage (from backend/):
+    python benchmarks/bench_lecture_index.py --hours 2 5 10
+    python benchmarks/bench_lecture_index.py --hours 2 --embed-model nomic-embed-text
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lecture_index import LectureIndex, LectureIndexStore, ollama_embed  # noqa: E402
+from llm_client import llm_client  # noqa: E402
+
+WORDS_PER_MINUTE = 150
+SEGMENT_WORDS = 12
+VOCABULARY = 20000
+
+
+def synthetic_segments(hours: float, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    words = int(hours * 60 * WORDS_PER_MINUTE)
+    ranks = np.minimum(rng.zipf(1.2, size=words), VOCABULARY)
+    seconds_per_word = 60 / WORDS_PER_MINUTE
+    segments = []
+    for i in range(0, words, SEGMENT_WORDS):
+        chunk = ranks[i:i + SEGMENT_WORDS]
+        segments.append({
+            "start": i * seconds_per_word,
+            "end": (i + len(chunk)) * seconds_per_word,
+            "text": " ".join(f"term{rank}" for rank in chunk),
+        })
+    return segments
+
+
+def random_embed(dimensions: int):
+    rng = np.random.default_rng(1)
+
+    async def embed(texts: list[str]) -> list[list[float]]:
+        return rng.standard_normal((len(texts), dimensions), dtype=np.float32).tolist()
+    return embed
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[int(fraction * (len(ordered) - 1))]
+
+
+async def run(hours: list[float], queries: int, dimensions: int, embed_model: str, embeddings: bool):
+    mode = "BM25 only" if not embeddings else (f"hybrid, {embed_model}" if embed_model else f"hybrid, random {dimensions}-d")
+    print(f"Retrieval index ({mode}), {queries} queries per lecture\n")
+    print(f"{'lecture':>8} {'passages':>9} {'terms':>7} {'build':>8} {'embed':>8} {'size':>9} {'load':>8} {'p50':>8} {'p95':>8}")
+    with tempfile.TemporaryDirectory() as index_dir:
+        store = LectureIndexStore(index_dir=index_dir, embed_model=embed_model, cache_size=1)
+        for h in hours:
+            segments = synthetic_segments(h)
+            lecture_id = f"bench-{h:g}h"
+            embed = None
+            if embeddings:
+                embed = ollama_embed(embed_model) if embed_model else random_embed(dimensions)
+            report = await store.build(lecture_id, f"{h:g} hour lecture", segments=segments, embed=embed)
+
+            started = time.monotonic()
+            index = LectureIndex.load(os.path.join(index_dir, lecture_id))
+            load = time.monotonic() - started
+
+            rng = np.random.default_rng(2)
+            dims = index.embeddings.shape[1] if index.embeddings is not None else 0
+            latencies = []
+            for _ in range(queries):
+                words = index.passages[int(rng.integers(len(index.passages)))]["text"].split()
+                query = " ".join(rng.choice(words, size=min(4, len(words)), replace=False))
+                vector = rng.standard_normal(dims).astype(np.float32) if dims else None
+                started = time.perf_counter()
+                index.search(query, 4, vector)
+                latencies.append(time.perf_counter() - started)
+
+            print(
+                f"{h:>7g}h {report['passages']:>9} {report['terms']:>7} {report['index_seconds']:>7.2f}s "
+                f"{report['embed_seconds']:>7.2f}s {report['index_bytes'] / 1e6:>7.2f}MB {load * 1000:>6.1f}ms "
+                f"{percentile(latencies, 0.5) * 1000:>6.2f}ms {percentile(latencies, 0.95) * 1000:>6.2f}ms"
+            )
+    await llm_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, nargs="+", default=[2, 5, 10], help="lecture lengths to index")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dimensions", type=int, default=768, help="random embedding width")
+    parser.add_argument("--embed-model", default="", help="embed with this Ollama model instead of random vectors")
+    parser.add_argument("--no-embeddings", action="store_true", help="BM25 only")
+    args = parser.parse_args()
+    asyncio.run(run(args.hours, args.queries, args.dimensions, args.embed_model, not args.no_embeddings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: one summarisation prompt vs. map-reduce over paragraph chunks.
+
+Needs a running Ollama with the model pulled. Reads a transcript from a text
+file (or synthesizes one) and times the /summarize prompt both ways.
+
+Usage (from backend/):
+    python benchmarks/bench_map_reduce.py --transcript lecture.txt
+    OLLAMA_MAX_CONCURRENCY=4 python benchmarks/bench_map_reduce.py --words 12000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import call_ollama, llm_client  # noqa: E402
+from long_transcript import LLM_MAP_CONCURRENCY, condense_transcript, estimate_tokens  # noqa: E402
+
+SYSTEM_PROMPT = """You are an expert at summarizing educational content.
+Create clear, concise summaries that capture the main ideas and key points.
+Use bullet points for clarity and organize by topic."""
+
+SENTENCES = [
+    "Entropy measures the number of microstates compatible with a macrostate.",
+    "The second law says the entropy of an isolated system never decreases.",
+    "A heat engine converts part of the heat it absorbs into work.",
+    "The Carnot cycle sets the upper bound on the efficiency of any heat engine.",
+    "Free energy tells us whether a process happens spontaneously at constant temperature.",
+    "Let's look at an example with an ideal gas expanding into a vacuum.",
+]
+
+
+def synthetic_transcript(words: int) -> str:
+    rng = random.Random(0)
+    out = []
+    count = 0
+    while count < words:
+        sentence = rng.choice(SENTENCES)
+        out.append(sentence)
+        count += len(sentence.split())
+    return " ".join(out)
+
+
+def summarize_prompt(text: str) -> str:
+    return f"Summarize this lecture transcription.\n\nTranscription:\n{text}\n\nFormat as a clear, structured summary."
+
+
+async def run(text: str, model: str):
+    print(f"Transcript: {len(text.split())} words, ~{estimate_tokens(text)} tokens; map concurrency {LLM_MAP_CONCURRENCY}\n")
+
+    started = time.monotonic()
+    await call_ollama(summarize_prompt(text), model, system=SYSTEM_PROMPT)
+    single = time.monotonic() - started
+    print(f"single prompt   {single:8.1f}s")
+
+    started = time.monotonic()
+    source = await condense_transcript(text, model)
+    await call_ollama(summarize_prompt(source.text), model, system=SYSTEM_PROMPT)
+    total = time.monotonic() - started
+    report = source.report()
+    print(
+        f"map-reduce      {total:8.1f}s  ({report['chunks']} chunks, {report['levels']} level(s), "
+        f"map wall {report['wall_seconds']}s vs {report['sequential_seconds']}s sequential)"
+    )
+    print(f"\nsaved vs single prompt: {single - total:.1f}s")
+    await llm_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcript", help="text file with a lecture transcript")
+    parser.add_argument("--words", type=int, default=12000, help="synthetic transcript length")
+    parser.add_argument("--model", default=os.getenv("OLLAMA_MODEL", "llama3.1"))
+    args = parser.parse_args()
+
+    if args.transcript:
+        with open(args.transcript) as f:
+            text = f.read()
+    else:
+        text = synthetic_transcript(args.words)
+    asyncio.run(run(text, args.model))
+
+
+if __name__ == "__main__":
+    main()
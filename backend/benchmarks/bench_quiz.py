@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the whole quiz in one prompt vs. sharded quiz generation.
+
+Needs a running Ollama with the model pulled. Reads a transcript from a text
+file (or synthesizes one), asks for --count questions both ways and reports
+the wall-clock time and how many unique, well-formed questions came back.
+
+Usage (from backend/):
+    python benchmarks/bench_quiz.py --transcript lecture.txt --count 50
+    OLLAMA_MAX_CONCURRENCY=4 QUIZ_SHARD_CONCURRENCY=4 python benchmarks/bench_quiz.py --words 6000
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_map_reduce import synthetic_transcript  # noqa: E402
+from lecture_prompts import quiz_prompt  # noqa: E402
+from llm_cache import llm_cache  # noqa: E402
+from llm_client import call_ollama, llm_client  # noqa: E402
+from long_transcript import condense_transcript  # noqa: E402
+from quiz_engine import QUIZ_SHARD_CONCURRENCY, QuestionSet, generate_sharded_quiz, ollama_complete  # noqa: E402
+
+
+def count_single_shot(quiz: str) -> tuple[int, int]:
+    """(questions, unique questions) in the Q1:/Correct: text format."""
+    questions = re.findall(r"^\s*Q\d+\s*[:.]\s*(.+)$", quiz, flags=re.MULTILINE)
+    unique = QuestionSet()
+    for question in questions:
+        unique.add({"question": question})
+    return len(questions), len(unique)
+
+
+async def run(text: str, count: int, model: str):
+    print(f"Transcript: {len(text.split())} words; {count} questions; shard concurrency {QUIZ_SHARD_CONCURRENCY}\n")
+    # Both paths must reach the model, not the response cache
+    llm_cache.ttl = 0
+
+    started = time.monotonic()
+    source = await condense_transcript(text, model)
+    system_prompt, prompt = quiz_prompt(source.text, "Benchmark lecture", count)
+    quiz = await call_ollama(prompt, model, system=system_prompt)
+    single = time.monotonic() - started
+    asked, unique = count_single_shot(quiz)
+    print(f"single prompt   {single:8.1f}s  {unique}/{count} unique questions ({asked} returned)")
+
+    started = time.monotonic()
+    questions, report = await generate_sharded_quiz(text, count, ollama_complete(model), title="Benchmark lecture")
+    sharded = time.monotonic() - started
+    print(
+        f"sharded         {sharded:8.1f}s  {len(questions)}/{count} unique questions "
+        f"({report['shards']} shards over {report['sections']} sections, {report['rounds']} round(s), "
+        f"{report['duplicates_removed']} duplicates and {report['invalid_removed']} malformed removed)"
+    )
+    print(f"\nsaved vs single prompt: {single - sharded:.1f}s")
+    await llm_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcript", help="text file with a lecture transcript")
+    parser.add_argument("--words", type=int, default=6000, help="synthetic transcript length")
+    parser.add_argument("--count", type=int, default=50, help="questions to generate")
+    parser.add_argument("--model", default=os.getenv("OLLAMA_MODEL", "llama3.1"))
+    args = parser.parse_args()
+
+    if args.transcript:
+        with open(args.transcript) as f:
+            text = f.read()
+    else:
+        text = synthetic_transcript(args.words)
+    asyncio.run(run(text, args.count, args.model))
+
+
+if __name__ == "__main__":
+    main()
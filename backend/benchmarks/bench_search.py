@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cross-lecture search ingest rate, index size and query latency.
+
+Builds a search index from synthetic one-hour lectures (150 words a minute in
+12-word segments, Zipf-distributed vocabulary, so a few terms occur in most
+segments and most terms are rare), then runs queries drawn from different
+frequency bands:
+    common    one of the 20 most frequent terms
+    mid       a term around rank 500
+    rare      a term around rank 20,000
+    2 terms   a common and a mid term
+    3 terms   three terms from random bands
+
+Lectures are added one at a time through the same path as /transcribe, so
+the ingest figure is the incremental cost per lecture-hour. With --sqlite-fts
+the same corpus is also loaded into an SQLite FTS5 table and queried with
+ORDER BY rank, for comparison.
+
+Usage (from backend/):
+    python benchmarks/bench_search.py --hours 1000
+    python benchmarks/bench_search.py --hours 10000 --db /tmp/search.db   # keep it for reruns with --reuse
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcript_search import TranscriptSearchIndex  # noqa: E402
+
+WORDS_PER_MINUTE = 150
+SEGMENT_WORDS = 12
+VOCABULARY = 50000
+BANDS = {"common": (1, 20), "mid": (400, 600), "rare": (15000, 25000)}
+
+
+def synthetic_lecture(rng: np.random.Generator, vocabulary: np.ndarray, minutes: int = 60) -> list[dict]:
+    words = minutes * WORDS_PER_MINUTE
+    ranks = np.minimum(rng.zipf(1.15, size=words), VOCABULARY - 1)
+    text = vocabulary[ranks]
+    seconds_per_word = 60 / WORDS_PER_MINUTE
+    return [
+        {
+            "start": round(i * seconds_per_word, 2),
+            "end": round(min(i + SEGMENT_WORDS, words) * seconds_per_word, 2),
+            "text": " ".join(text[i:i + SEGMENT_WORDS]),
+        }
+        for i in range(0, words, SEGMENT_WORDS)
+    ]
+
+
+def queries(rng: np.random.Generator, vocabulary: np.ndarray, count: int) -> dict[str, list[str]]:
+    def term(band: str) -> str:
+        low, high = BANDS[band]
+        return str(vocabulary[rng.integers(low, high)])
+
+    return {
+        "common": [term("common") for _ in range(count)],
+        "mid": [term("mid") for _ in range(count)],
+        "rare": [term("rare") for _ in range(count)],
+        "2 terms": [f"{term('common')} {term('mid')}" for _ in range(count)],
+        "3 terms": [" ".join(term(str(rng.choice(list(BANDS)))) for _ in range(3)) for _ in range(count)],
+    }
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[int(fraction * (len(ordered) - 1))]
+
+
+def report_latency(name: str, run, workload: dict[str, list[str]]):
+    for band, band_queries in workload.items():
+        latencies = []
+        for query in band_queries:
+            started = time.perf_counter()
+            run(query)
+            latencies.append(time.perf_counter() - started)
+        print(
+            f"  {name:<8} {band:<8} p50 {percentile(latencies, 0.5) * 1000:7.2f} ms"
+            f"   p95 {percentile(latencies, 0.95) * 1000:7.2f} ms   max {max(latencies) * 1000:7.2f} ms"
+        )
+
+
+def load_fts(path: str, lectures: list[list[dict]]):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE VIRTUAL TABLE segments USING fts5(text, lecture_id UNINDEXED, start UNINDEXED)")
+    with conn:
+        for n, lecture in enumerate(lectures):
+            conn.executemany(
+                "INSERT INTO segments (text, lecture_id, start) VALUES (?, ?, ?)",
+                ((segment["text"], f"lecture-{n}", segment["start"]) for segment in lecture),
+            )
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=int, default=1000, help="one-hour lectures in the corpus")
+    parser.add_argument("--queries", type=int, default=100, help="queries per band")
+    parser.add_argument("--db", help="index file (default: a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="query an index built by an earlier run")
+    parser.add_argument("--sqlite-fts", action="store_true", help="also time SQLite FTS5 on the same corpus")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"term{rank}" for rank in range(VOCABULARY)])
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = args.db or os.path.join(scratch, "search.db")
+        index = TranscriptSearchIndex(db_path)
+        kept = []
+        if not args.reuse:
+            ingest = []
+            started = time.monotonic()
+            for n in range(args.hours):
+                lecture = synthetic_lecture(rng, vocabulary)
+                if args.sqlite_fts:
+                    kept.append(lecture)
+                begun = time.perf_counter()
+                index.add_lecture(f"lecture-{n}", f"Lecture {n}", lecture, duration=3600)
+                ingest.append(time.perf_counter() - begun)
+                if (n + 1) % max(1, args.hours // 10) == 0:
+                    print(f"  {n + 1} lecture-hours indexed, last {ingest[-1] * 1000:.0f} ms", flush=True)
+            print(
+                f"\nIngest: {args.hours} lecture-hours in {time.monotonic() - started:.0f}s; per lecture-hour "
+                f"median {statistics.median(ingest) * 1000:.0f} ms, last 10% "
+                f"{statistics.mean(ingest[-max(1, args.hours // 10):]) * 1000:.0f} ms"
+            )
+        stats = index.stats()
+        print(
+            f"Index: {stats['lectures']} lectures, {stats['segments']:,} segments, {stats['terms']:,} terms, "
+            f"{stats['db_bytes'] / 1e9:.2f} GB\n"
+        )
+
+        workload = queries(np.random.default_rng(1), vocabulary, args.queries)
+        report_latency("index", lambda query: index.search(query, 10), workload)
+        if args.sqlite_fts and kept:
+            fts = load_fts(os.path.join(scratch, "fts.db"), kept)
+            report_latency(
+                "fts5",
+                lambda query: fts.execute(
+                    "SELECT lecture_id, start, snippet(segments, 0, '<mark>', '</mark>', '…', 16) "
+                    "FROM segments WHERE segments MATCH ? ORDER BY rank LIMIT 10",
+                    (" OR ".join(query.split()),),
+                ).fetchall(),
+                workload,
+            )
+
+
+if __name__ == "__main__":
+    main()
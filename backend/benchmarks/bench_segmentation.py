@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark: paragraph segmentation of long transcripts.
+
+Synthesizes multi-hour lectures as Whisper segments: topics of 8-30
+sentences with their own vocabulary, ordinary pauses between segments,
+and, at most topic changes, a long pause and/or a discourse marker ("Now,
+...", "Moving on, ..."), plus stray long pauses inside topics. Compares:
+    legacy     the original paragraphize_text (regexes compiled per call) on the joined text
+    text       paragraphize_text on the joined text
+    stream     ParagraphSegmenter fed one segment at a time
+"total" is all the CPU time spent; "ready" is the time between the last
+segment and the paragraphs being available (the whole pass for the text
+methods, flush() for the stream); "worst" is the slowest single feed(), the
+most a live session or decoding loop waits on segmentation. Also reports how many true topic changes land on a paragraph break
+(recall) and how many breaks are topic changes (precision).
+
+Usage (from backend/):
+    python benchmarks/bench_segmentation.py --hours 1 5 10
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segmentation import ParagraphSegmenter, paragraphize_text  # noqa: E402
+
+WORDS_PER_MINUTE = 150
+SEGMENT_WORDS = 12
+TOPIC_WORDS = 40
+FILLER = "the a of and to is in that it we this so you can be as for on with are".split()
+SHARED = "example value result case point idea problem question step part".split()
+MARKERS = ["Now,", "Next,", "Moving on,", "Okay so", "Alright,", "So now"]
+
+
+def legacy_paragraphize_text(text: str, sentences_per_paragraph: int = 4) -> list[str]:
+    """paragraphize_text as it was before ParagraphSegmenter, for comparison."""
+    text = re.sub(r"\s+([.,!?;:])", r"\1", text)
+    sentences = re.split(r"(?<=[.!?])\s+", text)
+    sentences = [s.strip() for s in sentences if s.strip()]
+    paragraphs = []
+    for i in range(0, len(sentences), sentences_per_paragraph):
+        paragraphs.append(" ".join(sentences[i:i + sentences_per_paragraph]))
+    return paragraphs
+
+
+def pseudo_word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfgklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+
+def synthetic_lecture(hours: float, seed: int = 0) -> tuple[list[dict], set[str]]:
+    """Segments, and the first sentence of each topic after the first."""
+    rng = random.Random(seed)
+    target_words = int(hours * 60 * WORDS_PER_MINUTE)
+    words: list[str] = []
+    pauses: dict[int, float] = {}  # word index -> pause before it
+    topic_starts: set[str] = set()
+    topic = 0
+    while len(words) < target_words:
+        vocabulary = [pseudo_word(rng) for _ in range(TOPIC_WORDS)]
+        long_pause, marker = rng.random() < 0.6, rng.random() < 0.5
+        for n in range(rng.randint(8, 30)):
+            sentence = []
+            for _ in range(rng.randint(8, 20)):
+                roll = rng.random()
+                pool = vocabulary if roll < 0.35 else SHARED if roll < 0.45 else FILLER
+                sentence.append(rng.choice(pool))
+            sentence[0] = sentence[0].capitalize()
+            sentence[-1] += "."
+            if n == 0 and topic:
+                if marker:
+                    sentence.insert(0, rng.choice(MARKERS))
+                if long_pause:
+                    pauses[len(words)] = rng.uniform(1.5, 4.0)
+                topic_starts.add(" ".join(sentence))
+            elif rng.random() < 0.05:
+                pauses[len(words)] = rng.uniform(1.0, 2.5)
+            words.extend(sentence)
+        topic += 1
+
+    segments, clock = [], 0.0
+    seconds_per_word = 60 / WORDS_PER_MINUTE
+    i = 0
+    while i < len(words):
+        size = rng.randint(SEGMENT_WORDS - 4, SEGMENT_WORDS + 4)
+        # Whisper tends to end segments at sentence ends
+        for j in range(i, min(i + size + 4, len(words))):
+            if j >= i + size - 4 and words[j].endswith("."):
+                size = j - i + 1
+                break
+        clock += pauses.get(i, rng.uniform(0.05, 0.5))
+        start = clock
+        clock += size * seconds_per_word
+        segments.append({"start": round(start, 2), "end": round(clock, 2), "text": " ".join(words[i:i + size])})
+        i += size
+    return segments, topic_starts
+
+
+def boundary_scores(paragraphs: list[str], topic_starts: set[str]) -> tuple[float, float]:
+    found = sum(1 for paragraph in paragraphs[1:] if paragraph.split(". ", 1)[0] + "." in topic_starts)
+    recall = found / len(topic_starts) if topic_starts else 1.0
+    precision = found / (len(paragraphs) - 1) if len(paragraphs) > 1 else 0.0
+    return recall, precision
+
+
+def best_of(repeat: int, fn):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def stream(segments: list[dict]) -> tuple[list[str], float, float]:
+    segmenter = ParagraphSegmenter()
+    worst = 0.0
+    for segment in segments:
+        started = time.perf_counter()
+        segmenter.feed(segment["text"], segment["start"], segment["end"])
+        worst = max(worst, time.perf_counter() - started)
+    started = time.perf_counter()
+    segmenter.flush()
+    return segmenter.paragraphs, time.perf_counter() - started, worst
+
+
+def run(hours: list[float], repeat: int):
+    print(f"Paragraph segmentation, best of {repeat}\n")
+    print(
+        f"{'lecture':>8} {'segments':>9} {'method':>7} {'total':>9} {'ready':>9} {'worst':>8} "
+        f"{'paras':>7} {'recall':>7} {'prec':>6}"
+    )
+    for h in hours:
+        segments, topic_starts = synthetic_lecture(h)
+        join = lambda: " ".join(s["text"] for s in segments)  # noqa: E731
+        rows = []
+        for name, paragraphize in (("legacy", legacy_paragraphize_text), ("text", paragraphize_text)):
+            seconds, paragraphs = best_of(repeat, lambda: paragraphize(join()))
+            rows.append((name, seconds, seconds, None, paragraphs))
+        seconds, (paragraphs, ready, worst) = best_of(repeat, lambda: stream(segments))
+        rows.append(("stream", seconds, ready, worst, paragraphs))
+        for name, seconds, ready, worst, paragraphs in rows:
+            recall, precision = boundary_scores(paragraphs, topic_starts)
+            worst_text = f"{worst * 1000:>6.2f}ms" if worst is not None else f"{'-':>8}"
+            print(
+                f"{h:>7g}h {len(segments):>9} {name:>7} {seconds * 1000:>7.1f}ms {ready * 1000:>7.3f}ms {worst_text} "
+                f"{len(paragraphs):>7} {recall:>7.0%} {precision:>6.0%}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 5, 10], help="lecture lengths to segment")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.hours, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark: transcript payload size and encode time per response format.
+
+Synthesizes a lecture's worth of faster-whisper segments with word timings
+and compares:
+    segments only    the /transcribe payload without words (current default)
+    nested dicts     words as a list of dicts inside every segment
+    json             segment dicts + columnar words (?words=true)
+    columnar         ?words=true&response_format=columnar
+    msgpack          ?words=true&response_format=msgpack
+
+"build" is the time to turn Whisper segments into the response dict, "encode"
+the time to serialize it.
+
+Usage (from backend/):
+    python benchmarks/bench_transcript_format.py --minutes 90 --repeat 5
+"""
+import argparse
+import gzip
+import os
+import random
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcript_format import encode_transcript  # noqa: E402
+from transcription import build_transcript  # noqa: E402
+
+VOCABULARY = (
+    "the of and to a in is that for it as was with be by on not this are or "
+    "which from but have an they one we all there their has been function "
+    "integral derivative equation theorem proof matrix vector entropy enzyme"
+).split()
+
+
+@dataclass
+class Word:
+    start: float
+    end: float
+    word: str
+    probability: float
+
+
+@dataclass
+class Segment:
+    start: float
+    end: float
+    text: str
+    words: list
+
+
+@dataclass
+class Info:
+    language: str
+    language_probability: float
+    duration: float
+
+
+def make_segments(minutes: float, words_per_minute: int = 150) -> tuple[list[Segment], Info]:
+    rng = random.Random(0)
+    step = 60.0 / words_per_minute
+    total = int(minutes * words_per_minute)
+    segments = []
+    t = 0.0
+    for first in range(0, total, 12):
+        words = []
+        for _ in range(min(12, total - first)):
+            # faster-whisper rounds word times to 10 ms
+            words.append(Word(round(t, 2), round(t + step * 0.8, 2), " " + rng.choice(VOCABULARY), rng.random()))
+            t += step
+        text = "".join(w.word for w in words)
+        segments.append(Segment(words[0].start, words[-1].end, text, words))
+    return segments, Info("en", 0.98, t)
+
+
+def build_nested(segments, info) -> dict:
+    """Words as dicts nested in every segment, the naive word_timestamps layout."""
+    seg_list = []
+    for s in segments:
+        seg_list.append({
+            "start": float(s.start),
+            "end": float(s.end),
+            "text": s.text.strip(),
+            "words": [
+                {
+                    "start": round(w.start, 2),
+                    "end": round(w.end, 2),
+                    "text": w.word.strip(),
+                    "probability": round(w.probability, 3),
+                }
+                for w in s.words
+            ],
+        })
+    result = build_transcript([], info)
+    result["segments"] = seg_list
+    return result
+
+
+def timed(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        timings.append(time.perf_counter() - started)
+    return value, statistics.median(timings)
+
+
+def strip_words(segments):
+    return [Segment(s.start, s.end, s.text, None) for s in segments]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    segments, info = make_segments(args.minutes)
+    word_count = sum(len(s.words) for s in segments)
+    print(f"{args.minutes:.0f} min lecture: {len(segments)} segments, {word_count} words\n")
+
+    plain_segments = strip_words(segments)
+    variants = [
+        ("segments only", lambda: build_transcript(plain_segments, info), "json"),
+        ("nested dicts", lambda: build_nested(segments, info), "json"),
+        ("json", lambda: build_transcript(segments, info, word_timestamps=True), "json"),
+        ("columnar", lambda: build_transcript(segments, info, word_timestamps=True), "columnar"),
+        ("msgpack", lambda: build_transcript(segments, info, word_timestamps=True), "msgpack"),
+    ]
+
+    print(f"{'format':<15}{'build ms':>10}{'encode ms':>11}{'bytes':>11}{'gzip bytes':>12}")
+    for name, build, fmt in variants:
+        result, build_s = timed(build, args.repeat)
+        (body, _), encode_s = timed(lambda: encode_transcript(result, fmt), args.repeat)
+        print(
+            f"{name:<15}{build_s * 1000:>10.1f}{encode_s * 1000:>11.1f}"
+            f"{len(body):>11,}{len(gzip.compress(body)):>12,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Server-side chat sessions with rolling history compaction.
+
+/chat used to take the whole conversation from the client on every turn, so
+each request, and the prompt built from it, grew with the length of the chat.
+A client can now send just a session_id and the new message. The server
+keeps the history in SQLite and builds the prompt from:
+
+- a rolling summary of the older turns, and
+- the turns since then, verbatim.
+
+Once the verbatim part is over CHAT_HISTORY_TOKENS, a background call folds
+all but the last CHAT_RECENT_MESSAGES messages into the summary. The prompt
+therefore levels off at about the system prompt, the summary, the history
+budget and the new message, however long the chat runs. Compaction runs at
+batch priority after the reply has been sent, so it never delays a turn. If
+it is behind or failing, the oldest verbatim messages are left out of the
+prompt once they pass twice the budget.
+
+Every turn records its prompt size and latency; GET /chat/sessions/{id} lists
+them per turn and GET /metrics/chat aggregates them.
+
+Configuration (environment variables):
+    CHAT_DB_PATH            SQLite file for sessions (default data/chat/chat.db)
+    CHAT_HISTORY_TOKENS     verbatim history kept before compacting (default 1500)
+    CHAT_RECENT_MESSAGES    latest messages never folded into the summary (default 4)
+    CHAT_SUMMARY_WORDS      target length of the rolling summary (default 250)
+    CHAT_SESSION_TTL_DAYS   idle sessions deleted at startup after this long (default 30)
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import statistics
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+
+from llm_scheduler import BATCH, llm_request
+from long_transcript import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+CHAT_DB_PATH = os.getenv(
+    "CHAT_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "chat", "chat.db")
+)
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1500"))
+CHAT_RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "4"))
+CHAT_SUMMARY_WORDS = int(os.getenv("CHAT_SUMMARY_WORDS", "250"))
+CHAT_SESSION_TTL_DAYS = float(os.getenv("CHAT_SESSION_TTL_DAYS", "30"))
+
+MAX_SESSION_ID_LENGTH = 128
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        summary TEXT NOT NULL DEFAULT '',
+        summarized_through INTEGER NOT NULL DEFAULT 0,
+        compactions INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        tokens INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (session_id, seq)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS turns (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        prompt_tokens INTEGER NOT NULL,
+        summary_tokens INTEGER NOT NULL,
+        history_tokens INTEGER NOT NULL,
+        history_messages INTEGER NOT NULL,
+        latency REAL NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (session_id, seq)
+    )
+    """,
+]
+
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of a conversation between a student and an academic tutor.
+Keep the student's goals, the topics covered and what was explained about them, facts about the student,
+tasks or deadlines they mentioned, and any open questions. Drop greetings and filler.
+Return only the summary."""
+
+# (system_prompt, prompt) -> reply text
+Summarize = Callable[[str, str], Awaitable[str]]
+
+
+class ChatSessionStore:
+    """
+    SQLite-backed sessions, their messages and per-turn prompt statistics.
+
+    Every call opens its own connection; call it through asyncio.to_thread
+    from the event loop.
+    """
+
+    def __init__(self, db_path: str = CHAT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def ensure(self, session_id: Optional[str]) -> str:
+        """The given session, created if new, or a fresh session when session_id is None."""
+        session_id = session_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+                (session_id, now, now),
+            )
+        return session_id
+
+    def context(self, session_id: str) -> tuple[str, int, list[dict]]:
+        """(summary, last summarized seq, messages after it) of a session."""
+        with self._connect() as conn:
+            session = conn.execute(
+                "SELECT summary, summarized_through FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if session is None:
+                return "", 0, []
+            rows = conn.execute(
+                "SELECT seq, role, content, tokens FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, session["summarized_through"]),
+            ).fetchall()
+        return session["summary"], session["summarized_through"], [dict(row) for row in rows]
+
+    def append_turn(self, session_id: str, message: str, reply: str, report: dict, latency: float):
+        """Store a completed exchange and the prompt statistics of the turn."""
+        now = time.time()
+        with self._connect() as conn:
+            # Take the write lock before reading the last seq, so concurrent turns on a session queue up
+            conn.execute("BEGIN IMMEDIATE")
+            last = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO messages (session_id, seq, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (session_id, last + 1, "user", message, estimate_tokens(message), now),
+                    (session_id, last + 2, "assistant", reply, estimate_tokens(reply), now),
+                ],
+            )
+            conn.execute(
+                "INSERT INTO turns (session_id, seq, prompt_tokens, summary_tokens, history_tokens, "
+                "history_messages, latency, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    session_id, last + 2, report["prompt_tokens"], report["summary_tokens"],
+                    report["history_tokens"], report["history_messages"], latency, now,
+                ),
+            )
+            conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (now, session_id))
+
+    def save_summary(self, session_id: str, summary: str, through: int) -> bool:
+        """Replace the summary if it covers more than the stored one; False if another compaction won."""
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE sessions SET summary = ?, summarized_through = ?, compactions = compactions + 1 "
+                "WHERE id = ? AND summarized_through < ?",
+                (summary, through, session_id, through),
+            ).rowcount
+        return updated > 0
+
+    def session(self, session_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            session = conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if session is None:
+                return None
+            messages = conn.execute(
+                "SELECT seq, role, content, created_at FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+            turns = conn.execute(
+                "SELECT seq, prompt_tokens, summary_tokens, history_tokens, history_messages, latency "
+                "FROM turns WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        return {
+            **dict(session),
+            "messages": [dict(row) for row in messages],
+            "turns": [{**dict(row), "turn": index + 1} for index, row in enumerate(turns)],
+        }
+
+    def delete(self, session_id: str) -> bool:
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        return deleted > 0
+
+    def purge_idle(self, max_age_seconds: float) -> int:
+        """Delete sessions idle for longer than max_age_seconds; returns how many."""
+        cutoff = time.time() - max_age_seconds
+        with self._connect() as conn:
+            ids = [row["id"] for row in conn.execute("SELECT id FROM sessions WHERE updated_at < ?", (cutoff,))]
+        for session_id in ids:
+            self.delete(session_id)
+        return len(ids)
+
+    def counts(self) -> dict:
+        with self._connect() as conn:
+            sessions, compactions = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(compactions), 0) FROM sessions"
+            ).fetchone()
+            messages = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {"sessions": sessions, "messages": messages, "compactions": compactions}
+
+
+class ChatMemory:
+    """Builds each turn's messages from a session and keeps its history compacted."""
+
+    def __init__(self, store: ChatSessionStore, summarize: Summarize):
+        self.store = store
+        self.summarize = summarize
+        self._compacting: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self.compaction_failures = 0
+        self.trimmed_turns = 0
+        self.prompt_tokens: deque = deque(maxlen=500)
+        self.latencies: deque = deque(maxlen=500)
+
+    async def open(self, session_id: Optional[str]) -> str:
+        if session_id is not None and not 0 < len(session_id) <= MAX_SESSION_ID_LENGTH:
+            raise HTTPException(status_code=400, detail=f"session_id must be 1-{MAX_SESSION_ID_LENGTH} characters")
+        return await asyncio.to_thread(self.store.ensure, session_id)
+
+    async def messages(self, session_id: str, system_prompt: str, message: str) -> tuple[list[dict], dict]:
+        """The messages to send for this turn (summary, recent history, new message) and their sizes."""
+        summary, _, history = await asyncio.to_thread(self.store.context, session_id)
+
+        # Compaction is behind: leave out the oldest messages past twice the budget
+        history_tokens = sum(row["tokens"] for row in history)
+        trimmed = 0
+        while len(history) > CHAT_RECENT_MESSAGES and history_tokens > 2 * CHAT_HISTORY_TOKENS:
+            history_tokens -= history.pop(0)["tokens"]
+            trimmed += 1
+        if trimmed:
+            self.trimmed_turns += 1
+            self._schedule_compaction(session_id)
+
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{summary}"})
+        messages += [{"role": row["role"], "content": row["content"]} for row in history]
+        messages.append({"role": "user", "content": message})
+
+        summary_tokens = estimate_tokens(summary) if summary else 0
+        report = {
+            "prompt_tokens": estimate_tokens(system_prompt) + summary_tokens + history_tokens + estimate_tokens(message),
+            "summary_tokens": summary_tokens,
+            "history_tokens": history_tokens,
+            "history_messages": len(history),
+            "trimmed_messages": trimmed,
+        }
+        return messages, report
+
+    async def record(self, session_id: str, message: str, reply: str, report: dict, latency: float):
+        """Store the exchange, then compact in the background if the history is over budget."""
+        await asyncio.to_thread(self.store.append_turn, session_id, message, reply, report, latency)
+        self.prompt_tokens.append(report["prompt_tokens"])
+        self.latencies.append(latency)
+        verbatim = report["history_tokens"] + estimate_tokens(message) + estimate_tokens(reply)
+        if verbatim > CHAT_HISTORY_TOKENS:
+            self._schedule_compaction(session_id)
+
+    def _schedule_compaction(self, session_id: str):
+        if session_id in self._compacting:
+            return
+        self._compacting.add(session_id)
+        task = asyncio.create_task(self._compact(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _compact(self, session_id: str):
+        # Runs after the reply; it shouldn't hold an interactive slot
+        llm_request.set((BATCH, session_id))
+        try:
+            summary, _, history = await asyncio.to_thread(self.store.context, session_id)
+            fold = history[:-CHAT_RECENT_MESSAGES] if CHAT_RECENT_MESSAGES > 0 else history
+            if not fold:
+                return
+            transcript = "\n\n".join(f"{row['role'].capitalize()}: {row['content']}" for row in fold)
+            prompt = f"""Current summary:
+{summary or "(none yet)"}
+
+New messages:
+{transcript}
+
+Write the updated summary in at most {CHAT_SUMMARY_WORDS} words."""
+            started = time.monotonic()
+            updated = (await self.summarize(SUMMARY_SYSTEM_PROMPT, prompt)).strip()
+            if updated and await asyncio.to_thread(self.store.save_summary, session_id, updated, fold[-1]["seq"]):
+                logger.info(
+                    f"Compacted {len(fold)} messages of chat {session_id} into a "
+                    f"{estimate_tokens(updated)}-token summary in {time.monotonic() - started:.1f}s"
+                )
+        except Exception as e:
+            self.compaction_failures += 1
+            logger.warning(f"Chat compaction for {session_id} failed: {e.detail if isinstance(e, HTTPException) else e}")
+        finally:
+            self._compacting.discard(session_id)
+
+    async def aclose(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+    def stats(self) -> dict:
+        def percentile(values: deque, fraction: float):
+            ordered = sorted(values)
+            return round(ordered[int(fraction * (len(ordered) - 1))], 3) if ordered else None
+
+        return {
+            **self.store.counts(),
+            "compacting": len(self._compacting),
+            "compaction_failures": self.compaction_failures,
+            "trimmed_turns": self.trimmed_turns,
+            "prompt_tokens_p50": round(statistics.median(self.prompt_tokens)) if self.prompt_tokens else None,
+            "prompt_tokens_max": max(self.prompt_tokens) if self.prompt_tokens else None,
+            "latency_p50": percentile(self.latencies, 0.5),
+            "latency_p95": percentile(self.latencies, 0.95),
+        }
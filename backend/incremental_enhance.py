@@ -0,0 +1,230 @@
+"""
+Incremental /enhance.
+
+/enhance used to send the whole transcript to the model in one prompt and
+echo it back as "original" beside the result. The frontend calls it again
+after small edits and whenever more audio has been transcribed, so every call
+re-enhanced and re-sent text that hadn't changed.
+
+The transcript is now split into chunks whose boundaries depend only on the
+text around them. Units (the transcript's paragraphs, or its sentences when
+it has none) are grouped until a chunk holds half of ENHANCE_CHUNK_TOKENS;
+from there a unit ends the chunk when a hash of its text falls below a
+threshold proportional to its length. Chunks average about
+ENHANCE_CHUNK_TOKENS and are cut at twice that. An edit changes the chunk it
+lands in (occasionally the next one as well) and appended text changes only
+the last chunk. Each chunk is named by a hash of its text.
+
+Chunks whose ids the client sends back in known_chunks are skipped entirely.
+The rest are looked up in the LLM response cache, and only the misses go to
+the model, ENHANCE_CONCURRENCY at a time. The response lists every chunk in
+order with its id and status, and carries enhanced text only for chunks the
+client doesn't already have.
+
+Configuration (environment variables):
+    ENHANCE_CHUNK_TOKENS   average chunk size in tokens (default 400)
+    ENHANCE_CONCURRENCY    chunks enhanced at once per request (default OLLAMA_MAX_CONCURRENCY)
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from typing import AsyncIterator, Iterable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from lecture_prompts import enhance_prompt
+from llm_client import OLLAMA_MAX_CONCURRENCY, call_ollama_cached, llm_client
+from llm_streaming import sse_event
+from long_transcript import estimate_tokens
+from segmentation import split_sentences
+
+logger = logging.getLogger(__name__)
+
+ENHANCE_CHUNK_TOKENS = int(os.getenv("ENHANCE_CHUNK_TOKENS", "400"))
+ENHANCE_CONCURRENCY = int(os.getenv("ENHANCE_CONCURRENCY", str(OLLAMA_MAX_CONCURRENCY)))
+
+_BLANK_LINE = re.compile(r"\n\s*\n")
+
+
+def chunk_id(text: str) -> str:
+    """Content hash naming a chunk; whitespace differences don't change it."""
+    return hashlib.blake2b(" ".join(text.split()).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def split_chunks(
+    text: str,
+    paragraphs: Optional[list[str]] = None,
+    target_tokens: int = ENHANCE_CHUNK_TOKENS,
+) -> tuple[list[str], str]:
+    """Content-defined chunks of the transcript, and the separator to join them with."""
+    units = [unit.strip() for unit in (paragraphs or _BLANK_LINE.split(text)) if unit.strip()]
+    separator = "\n\n"
+    if len(units) <= 1:
+        units, separator = split_sentences(" ".join(units)), " "
+
+    half = max(1, target_tokens // 2)
+    chunks: list[str] = []
+    current: list[str] = []
+    tokens = 0
+    for unit in units:
+        current.append(unit)
+        size = estimate_tokens(unit)
+        tokens += size
+        # Past the minimum, about one boundary per `half` tokens, chosen by the unit's own text
+        if tokens >= 2 * target_tokens or (tokens >= half and zlib.crc32(unit.encode("utf-8")) % half < size):
+            chunks.append(separator.join(current))
+            current, tokens = [], 0
+    if current:
+        chunks.append(separator.join(current))
+    return chunks, separator
+
+
+async def enhance_chunks(
+    chunks: list[str],
+    model: str,
+    known: Iterable[str] = (),
+    concurrency: int = ENHANCE_CONCURRENCY,
+    slots: Optional[asyncio.Semaphore] = None,
+) -> AsyncIterator[tuple[int, dict, Optional[HTTPException]]]:
+    """
+    Yield (index, entry, error) for every chunk: known chunks first, then the
+    others as their enhancement finishes. Identical chunks are enhanced once.
+    entry["status"] is "known", "cached", "enhanced" or "failed"; a failed
+    chunk keeps its original text. slots, if given, bounds the model calls
+    together with the caller's other work instead of concurrency.
+    """
+    known = set(known)
+    positions: dict[str, list[int]] = {}
+    for index, chunk in enumerate(chunks):
+        positions.setdefault(chunk_id(chunk), []).append(index)
+
+    for key, indexes in positions.items():
+        if key in known:
+            for index in indexes:
+                yield index, {"id": key, "status": "known"}, None
+
+    slots = slots or asyncio.Semaphore(max(1, concurrency))
+
+    async def enhance(key: str):
+        chunk = chunks[positions[key][0]]
+        system_prompt, prompt = enhance_prompt(chunk)
+        try:
+            async with slots:
+                text, cached = await call_ollama_cached(prompt, model, system=system_prompt)
+        except HTTPException as e:
+            logger.warning(f"Enhancing chunk {key} failed: {e.detail}")
+            return key, {"id": key, "status": "failed", "enhanced": chunk, "error": e.detail}, e
+        return key, {"id": key, "status": "cached" if cached else "enhanced", "enhanced": text.strip()}, None
+
+    tasks = [asyncio.create_task(enhance(key)) for key in positions if key not in known]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            key, entry, error = await finished
+            for index in positions[key]:
+                yield index, entry, error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def enhance_response(chunks: list[str], entries: list[dict], separator: str, known: Iterable[str], started: float) -> dict:
+    """The /enhance payload: the chunk map, ids the client can drop, and the full text when it's all here."""
+    ids = {entry["id"] for entry in entries}
+    response = {
+        "chunks": entries,
+        "separator": separator,
+        "removed": sorted(set(known) - ids),
+    }
+    if all("enhanced" in entry for entry in entries):
+        response["enhanced"] = separator.join(entry["enhanced"] for entry in entries)
+    counts = Counter(entry["status"] for entry in entries)
+    response["stats"] = {
+        "chunks": len(chunks),
+        **{status: counts[status] for status in ("known", "cached", "enhanced", "failed")},
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    return response
+
+
+def _nothing_enhanced(response: dict) -> bool:
+    stats = response["stats"]
+    return stats["failed"] == stats["chunks"] - stats["known"]
+
+
+async def enhance_transcript(
+    text: str,
+    model: str,
+    paragraphs: Optional[list[str]] = None,
+    known_chunks: Iterable[str] = (),
+) -> dict:
+    """
+    Enhance the chunks the client doesn't have. Fails only if every chunk
+    that needed the model failed.
+    """
+    started = time.monotonic()
+    known_chunks = list(known_chunks)
+    chunks, separator = split_chunks(text, paragraphs)
+    entries: list[dict] = [{}] * len(chunks)
+    failure: Optional[HTTPException] = None
+    async for index, entry, error in enhance_chunks(chunks, model, known_chunks):
+        entries[index] = entry
+        failure = failure or error
+
+    response = enhance_response(chunks, entries, separator, known_chunks, started)
+    if failure is not None and _nothing_enhanced(response):
+        raise failure
+    stats = response["stats"]
+    logger.info(
+        f"Enhanced {stats['chunks']} chunks in {stats['seconds']:.1f}s: {stats['known']} known, "
+        f"{stats['cached']} cached, {stats['enhanced']} enhanced, {stats['failed']} failed"
+    )
+    return response
+
+
+def stream_enhance_response(
+    text: str,
+    model: str,
+    paragraphs: Optional[list[str]] = None,
+    known_chunks: Iterable[str] = (),
+) -> StreamingResponse:
+    """
+    Relay /enhance over SSE chunk by chunk:
+
+        event: chunk   data: {"index": 3, "id": "...", "status": "enhanced", "enhanced": "..."}
+        event: done    data: {...the /enhance payload...}
+
+    An error event is sent instead of done when every chunk that needed the
+    model failed.
+    """
+    async def events():
+        started = time.monotonic()
+        known = list(known_chunks)
+        chunks, separator = split_chunks(text, paragraphs)
+        entries: list[dict] = [{}] * len(chunks)
+        failure: Optional[HTTPException] = None
+        first = True
+        async for index, entry, error in enhance_chunks(chunks, model, known):
+            if first and entry["status"] != "known":
+                first = False
+                llm_client.record_first_token("enhance", time.monotonic() - started)
+            entries[index] = entry
+            failure = failure or error
+            yield sse_event("chunk", {"index": index, **entry})
+
+        response = enhance_response(chunks, entries, separator, known, started)
+        if failure is not None and _nothing_enhanced(response):
+            yield sse_event("error", {"status": failure.status_code, "detail": failure.detail})
+            return
+        yield sse_event("done", response)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,198 @@
+"""
+Asynchronous transcription jobs.
+
+POST /jobs/transcribe stores the upload and returns a job id immediately; the
+job then runs on the transcription executor and records progress (processed
+audio seconds out of the total duration) as Whisper yields segments. Job state
+lives in SQLite and uploads are kept on disk until the job finishes, so jobs
+interrupted by a restart are picked up again on startup.
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from transcription import transcribe_upload
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "jobs"))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(JOBS_DIR, "jobs.db"))
+
+# Minimum seconds between progress writes while a job runs
+PROGRESS_WRITE_INTERVAL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    processed_seconds REAL NOT NULL DEFAULT 0,
+    duration REAL,
+    result TEXT,
+    error TEXT,
+    options TEXT,
+    lecture_id TEXT,
+    title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed job table plus the uploaded audio for unfinished jobs.
+
+    Every call opens its own connection, so the store is safe to use from the
+    event loop, executor threads and worker processes alike.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, audio_dir: str = JOBS_DIR):
+        self.db_path = db_path
+        self.audio_dir = audio_dir
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        os.makedirs(audio_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def audio_path(self, job_id: str) -> str:
+        return os.path.join(self.audio_dir, f"{job_id}.audio")
+
+    def create(
+        self,
+        raw: bytes,
+        filename: Optional[str],
+        options: Optional[dict] = None,
+        lecture_id: Optional[str] = None,
+        title: Optional[str] = None,
+    ) -> str:
+        """
+        Store an upload as a queued job; options are passed to transcribe_upload.
+        The transcript is searchable under lecture_id (default: the job id) once done.
+        """
+        job_id = uuid.uuid4().hex
+        with open(self.audio_path(job_id), "wb") as f:
+            f.write(raw)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, options, lecture_id, title, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, filename, json.dumps(options or {}), lecture_id or job_id, title or filename, now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def read_audio(self, job_id: str) -> bytes:
+        with open(self.audio_path(job_id), "rb") as f:
+            return f.read()
+
+    def mark_running(self, job_id: str):
+        self._update(job_id, status="running", processed_seconds=0.0, error=None)
+
+    def update_progress(self, job_id: str, processed_seconds: float, duration: Optional[float]):
+        self._update(job_id, processed_seconds=processed_seconds, duration=duration)
+
+    def complete(self, job_id: str, result: dict):
+        duration = result["metadata"]["duration"]
+        self._update(
+            job_id,
+            status="completed",
+            result=json.dumps(result),
+            processed_seconds=duration,
+            duration=duration,
+        )
+        self._drop_audio(job_id)
+
+    def fail(self, job_id: str, error: str):
+        self._update(job_id, status="failed", error=error)
+        self._drop_audio(job_id)
+
+    def requeue_interrupted(self) -> list[str]:
+        """Reset jobs left queued/running by a previous process; returns their ids."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        job_ids = []
+        for row in rows:
+            if os.path.exists(self.audio_path(row["id"])):
+                self._update(row["id"], status="queued", processed_seconds=0.0)
+                job_ids.append(row["id"])
+            else:
+                self.fail(row["id"], "Upload lost before the job could run")
+        return job_ids
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def _drop_audio(self, job_id: str):
+        path = self.audio_path(job_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def job_status(job: dict) -> dict:
+    """Public view of a job row for GET /jobs/{id}."""
+    duration = job["duration"]
+    processed = job["processed_seconds"] or 0.0
+    percent = round(min(100.0, processed / duration * 100), 1) if duration else 0.0
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "lecture_id": job["lecture_id"] or job["id"],
+        "progress": {
+            "processed_seconds": round(processed, 2),
+            "duration": duration,
+            "percent": percent,
+        },
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+def run_transcription_job(registry, job_id: str, db_path: str, audio_dir: str) -> dict:
+    """
+    Executor job: transcribe a stored upload, writing progress as segments arrive.
+    Opens its own JobStore so it also works inside a worker process.
+    """
+    store = JobStore(db_path, audio_dir)
+    store.mark_running(job_id)
+    raw = store.read_audio(job_id)
+    options = json.loads(store.get(job_id)["options"] or "{}")
+
+    last_write = 0.0
+
+    def on_progress(processed_seconds: float, duration: float):
+        nonlocal last_write
+        now = time.monotonic()
+        if now - last_write >= PROGRESS_WRITE_INTERVAL:
+            store.update_progress(job_id, processed_seconds, duration)
+            last_write = now
+
+    result = transcribe_upload(registry, raw, on_progress=on_progress, **options)
+    store.complete(job_id, result)
+    return result
@@ -0,0 +1,455 @@
+"""
+Per-lecture retrieval index for /chat.
+
+/chat could not see the lecture at all; the only way to ask about it was to
+paste the whole transcript into the message, which for a two-hour lecture is
+tens of thousands of tokens per turn. A lecture is now indexed once, from the
+segments and paragraphs /transcribe returned, and each chat turn gets only
+the LECTURE_RETRIEVAL_TOP_K passages most relevant to the question:
+
+- Passages are runs of consecutive segments of about LECTURE_PASSAGE_WORDS
+  words, so each carries the start and end time of the audio it came from
+  and the answer can cite it as [mm:ss]. Without segments the paragraphs are
+  used, without timestamps.
+- Passages are ranked with BM25. The postings are kept as flat NumPy arrays
+  (CSR layout: one offsets array into parallel passage-id and term-frequency
+  arrays), so a query is a handful of vectorised adds.
+- With LECTURE_EMBED_MODEL set, passages are also embedded by the local
+  Ollama model (CPU is fine, nothing leaves the machine) and stored as one
+  L2-normalised float16 matrix that is memory-mapped on load. The score is
+  then LECTURE_HYBRID_WEIGHT * cosine + (1 - weight) * BM25 scaled to the
+  best match. If the embedding model is unavailable, the index falls back to
+  BM25 alone.
+
+Each lecture is a directory under LECTURE_INDEX_DIR; the most recently used
+indexes are kept loaded.
+
+Configuration (environment variables):
+    LECTURE_INDEX_DIR         directory for lecture indexes (default data/lectures)
+    LECTURE_PASSAGE_WORDS     target passage length in words (default 120)
+    LECTURE_EMBED_MODEL       Ollama embedding model, e.g. nomic-embed-text (default none: BM25 only)
+    LECTURE_EMBED_BATCH       passages per embedding request (default 64)
+    LECTURE_HYBRID_WEIGHT     share of the embedding score in the hybrid score (default 0.5)
+    LECTURE_RETRIEVAL_TOP_K   passages given to /chat (default 4)
+    LECTURE_INDEX_CACHE       indexes kept loaded (default 8)
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+from fastapi import HTTPException
+
+from llm_client import embed_ollama
+from segmentation import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+LECTURE_INDEX_DIR = os.getenv(
+    "LECTURE_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "lectures")
+)
+LECTURE_PASSAGE_WORDS = int(os.getenv("LECTURE_PASSAGE_WORDS", "120"))
+LECTURE_EMBED_MODEL = os.getenv("LECTURE_EMBED_MODEL", "")
+LECTURE_EMBED_BATCH = int(os.getenv("LECTURE_EMBED_BATCH", "64"))
+LECTURE_HYBRID_WEIGHT = float(os.getenv("LECTURE_HYBRID_WEIGHT", "0.5"))
+LECTURE_RETRIEVAL_TOP_K = int(os.getenv("LECTURE_RETRIEVAL_TOP_K", "4"))
+LECTURE_INDEX_CACHE = int(os.getenv("LECTURE_INDEX_CACHE", "8"))
+
+# BM25 parameters (the usual defaults)
+_K1 = 1.2
+_B = 0.75
+
+# Embedding rows scored per block
+_COSINE_BLOCK = 256
+
+_LECTURE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# texts -> one vector per text
+Embed = Callable[[list[str]], Awaitable[list[list[float]]]]
+
+
+def check_lecture_id(lecture_id: str) -> str:
+    if not _LECTURE_ID.match(lecture_id):
+        raise HTTPException(status_code=400, detail="lecture_id must be 1-64 letters, digits, '-' or '_'")
+    return lecture_id
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def format_timestamp(seconds: float) -> str:
+    """1:02:03 past the hour, 02:03 before it."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+def segment_rows(segments) -> list[dict]:
+    """Segments as a list of dicts, accepting the columnar /transcribe shape too."""
+    if isinstance(segments, dict):
+        return [
+            {"start": start, "end": end, "text": text}
+            for start, end, text in zip(segments.get("start", []), segments.get("end", []), segments.get("text", []))
+        ]
+    return list(segments or [])
+
+
+def build_passages(segments=None, paragraphs: Optional[list[str]] = None, words: int = LECTURE_PASSAGE_WORDS) -> list[dict]:
+    """Consecutive segments grouped into passages of about `words` words, or the paragraphs if there are no segments."""
+    passages = []
+    rows = segment_rows(segments)
+    if rows:
+        current: list[dict] = []
+        size = 0
+        for row in rows:
+            text = str(row.get("text") or "").strip()
+            if not text:
+                continue
+            current.append(row)
+            size += len(text.split())
+            if size >= words:
+                passages.append(current)
+                current, size = [], 0
+        if current:
+            if passages and size < words // 3:
+                # A short tail reads better as part of the passage before it
+                passages[-1].extend(current)
+            else:
+                passages.append(current)
+        return [
+            {
+                "text": " ".join(str(row["text"]).strip() for row in group if str(row.get("text") or "").strip()),
+                "start": float(group[0]["start"]),
+                "end": float(group[-1]["end"]),
+            }
+            for group in passages
+        ]
+
+    for paragraph in paragraphs or []:
+        paragraph_words = paragraph.split()
+        for i in range(0, len(paragraph_words), max(1, words)):
+            passages.append({"text": " ".join(paragraph_words[i:i + words]), "start": None, "end": None})
+    return passages
+
+
+class LectureIndex:
+    """BM25 postings and optional passage embeddings for one lecture."""
+
+    def __init__(
+        self,
+        meta: dict,
+        passages: list[dict],
+        vocabulary: dict[str, int],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        embeddings: Optional[np.ndarray] = None,
+    ):
+        self.meta = meta
+        self.passages = passages
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.embeddings = embeddings
+        # Precomputed per passage: k1 * (1 - b + b * dl / avgdl)
+        avgdl = float(doc_len.mean()) if len(doc_len) else 1.0
+        self._norm = (_K1 * (1 - _B + _B * doc_len / max(avgdl, 1e-9))).astype(np.float32)
+        df = np.diff(offsets).astype(np.float32)
+        n = len(passages)
+        self._idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    @classmethod
+    def build(cls, meta: dict, passages: list[dict], embeddings: Optional[np.ndarray] = None) -> "LectureIndex":
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_len = np.zeros(len(passages), dtype=np.float32)
+        for doc, passage in enumerate(passages):
+            counts = Counter(tokenize(passage["text"]))
+            doc_len[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc, tf))
+
+        terms = sorted(postings)
+        vocabulary = {term: i for i, term in enumerate(terms)}
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+        doc_ids = np.empty(int(offsets[-1]), dtype=np.int32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.float32)
+        for i, term in enumerate(terms):
+            entries = np.asarray(postings[term], dtype=np.int64)
+            doc_ids[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            tfs[offsets[i]:offsets[i + 1]] = entries[:, 1]
+
+        if embeddings is not None:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = (embeddings / np.maximum(norms, 1e-12)).astype(np.float16)
+        return cls(meta, passages, vocabulary, offsets, doc_ids, tfs, doc_len, embeddings)
+
+    def save(self, directory: str):
+        """Write the index to a fresh directory, then swap it in place of any previous one."""
+        staging = f"{directory}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        np.savez(
+            os.path.join(staging, "bm25.npz"),
+            offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs, doc_len=self.doc_len,
+        )
+        if self.embeddings is not None:
+            np.save(os.path.join(staging, "embeddings.npy"), self.embeddings)
+        with open(os.path.join(staging, "passages.json"), "w") as f:
+            json.dump({"vocabulary": list(self.vocabulary), "passages": self.passages}, f)
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "LectureIndex":
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, "passages.json")) as f:
+            stored = json.load(f)
+        with np.load(os.path.join(directory, "bm25.npz")) as arrays:
+            offsets, doc_ids, tfs, doc_len = (arrays[name] for name in ("offsets", "doc_ids", "tfs", "doc_len"))
+        embeddings = None
+        embeddings_path = os.path.join(directory, "embeddings.npy")
+        if os.path.exists(embeddings_path):
+            # Paged in as queries touch it rather than read up front
+            embeddings = np.load(embeddings_path, mmap_mode="r")
+        vocabulary = {term: i for i, term in enumerate(stored["vocabulary"])}
+        return cls(meta, stored["passages"], vocabulary, offsets, doc_ids, tfs, doc_len, embeddings)
+
+    def bm25(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.vocabulary.get(term)
+            if i is None:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            tf = self.tfs[start:end]
+            docs = self.doc_ids[start:end]
+            scores[docs] += self._idf[i] * tf * (_K1 + 1) / (tf + self._norm[docs])
+        return scores
+
+    def search(self, query: str, k: int = LECTURE_RETRIEVAL_TOP_K, query_vector: Optional[np.ndarray] = None) -> list[dict]:
+        """The k best passages for the query, best first."""
+        if not self.passages:
+            return []
+        lexical = self.bm25(query)
+        best = float(lexical.max())
+        scores = lexical / best if best > 0 else lexical
+        if query_vector is not None and self.embeddings is not None:
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+            query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+            cosine = np.clip(self._cosine(query_vector), 0, None)
+            scores = LECTURE_HYBRID_WEIGHT * cosine + (1 - LECTURE_HYBRID_WEIGHT) * scores
+        elif best <= 0:
+            return []
+
+        k = max(1, min(k, len(scores)))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = []
+        for doc in top:
+            if scores[doc] <= 0:
+                break
+            passage = self.passages[doc]
+            hits.append({
+                "passage": int(doc),
+                "score": round(float(scores[doc]), 4),
+                "text": passage["text"],
+                "start": passage["start"],
+                "end": passage["end"],
+                "citation": format_timestamp(passage["start"]) if passage["start"] is not None else None,
+            })
+        return hits
+
+    def _cosine(self, query_vector: np.ndarray) -> np.ndarray:
+        # NumPy has no fast float16 matmul; upcast a cache-sized block of rows at a time instead
+        return np.concatenate([
+            self.embeddings[i:i + _COSINE_BLOCK].astype(np.float32) @ query_vector
+            for i in range(0, len(self.embeddings), _COSINE_BLOCK)
+        ])
+
+    def size_bytes(self) -> int:
+        arrays = (self.offsets, self.doc_ids, self.tfs, self.doc_len)
+        size = sum(array.nbytes for array in arrays)
+        return size + (self.embeddings.nbytes if self.embeddings is not None else 0)
+
+
+def ollama_embed(model: str) -> Embed:
+    """Embeddings from a local Ollama model, for indexing and queries."""
+    async def embed(texts: list[str]) -> list[list[float]]:
+        return await embed_ollama(texts, model)
+    return embed
+
+
+def retrieval_message(title: str, hits: list[dict]) -> str:
+    """The system message giving /chat the retrieved passages, each headed by its timestamp."""
+    excerpts = "\n\n".join(
+        f"[{hit['citation']}] {hit['text']}" if hit["citation"] else hit["text"] for hit in hits
+    )
+    return f"""Excerpts from the lecture "{title}" relevant to the student's question:
+
+{excerpts}
+
+Answer from these excerpts where they cover the question, and cite the timestamps in square brackets, e.g. [12:34]. Say so if the excerpts don't cover it."""
+
+
+class LectureIndexStore:
+    """Lecture indexes on disk, with the most recently used kept loaded."""
+
+    def __init__(
+        self,
+        index_dir: str = LECTURE_INDEX_DIR,
+        embed_model: str = LECTURE_EMBED_MODEL,
+        cache_size: int = LECTURE_INDEX_CACHE,
+    ):
+        self.index_dir = index_dir
+        self.embed_model = embed_model
+        self.cache_size = max(1, cache_size)
+        self._loaded: OrderedDict[str, LectureIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.search_seconds = 0.0
+        self.embedding_fallbacks = 0
+        os.makedirs(index_dir, exist_ok=True)
+
+    def _path(self, lecture_id: str) -> str:
+        return os.path.join(self.index_dir, check_lecture_id(lecture_id))
+
+    async def build(
+        self,
+        lecture_id: str,
+        title: str,
+        segments=None,
+        paragraphs: Optional[list[str]] = None,
+        embed: Optional[Embed] = None,
+    ) -> dict:
+        """Index a lecture, replacing any previous index; returns its size and the build timings."""
+        directory = self._path(lecture_id)
+        started = time.monotonic()
+        passages = await asyncio.to_thread(build_passages, segments, paragraphs)
+        if not passages:
+            raise HTTPException(status_code=400, detail="Nothing to index: segments and paragraphs are empty")
+
+        if embed is None and self.embed_model:
+            embed = ollama_embed(self.embed_model)
+        embeddings = None
+        embedding_error = None
+        embed_seconds = 0.0
+        if embed is not None:
+            embed_started = time.monotonic()
+            try:
+                vectors = []
+                for i in range(0, len(passages), LECTURE_EMBED_BATCH):
+                    vectors += await embed([passage["text"] for passage in passages[i:i + LECTURE_EMBED_BATCH]])
+                embeddings = np.asarray(vectors, dtype=np.float32)
+            except HTTPException as e:
+                embedding_error = str(e.detail)
+                logger.warning(f"Embedding lecture {lecture_id} failed, indexing with BM25 only: {e.detail}")
+            embed_seconds = time.monotonic() - embed_started
+
+        meta = {
+            "lecture_id": lecture_id,
+            "title": title,
+            "passages": len(passages),
+            "timestamps": passages[0]["start"] is not None,
+            "embed_model": (self.embed_model or None) if embeddings is not None else None,
+            "dimensions": int(embeddings.shape[1]) if embeddings is not None else None,
+            "created_at": time.time(),
+        }
+
+        def write() -> LectureIndex:
+            index = LectureIndex.build(meta, passages, embeddings)
+            index.save(directory)
+            return index
+
+        bm25_started = time.monotonic()
+        index = await asyncio.to_thread(write)
+        with self._lock:
+            self._remember(lecture_id, index)
+        report = {
+            **meta,
+            "terms": len(index.vocabulary),
+            "index_bytes": index.size_bytes(),
+            "embedding_error": embedding_error,
+            "embed_seconds": round(embed_seconds, 3),
+            "index_seconds": round(time.monotonic() - bm25_started, 3),
+            "build_seconds": round(time.monotonic() - started, 3),
+        }
+        logger.info(f"Indexed lecture {lecture_id}: {len(passages)} passages in {report['build_seconds']}s")
+        return report
+
+    def _remember(self, lecture_id: str, index: LectureIndex):
+        self._loaded[lecture_id] = index
+        self._loaded.move_to_end(lecture_id)
+        while len(self._loaded) > self.cache_size:
+            self._loaded.popitem(last=False)
+
+    def get(self, lecture_id: str) -> Optional[LectureIndex]:
+        """The lecture's index, loading it from disk if needed; None if it was never built."""
+        directory = self._path(lecture_id)
+        with self._lock:
+            index = self._loaded.get(lecture_id)
+            if index is not None:
+                self._loaded.move_to_end(lecture_id)
+                return index
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            return None
+        index = LectureIndex.load(directory)
+        with self._lock:
+            self._remember(lecture_id, index)
+        return index
+
+    async def search(self, lecture_id: str, query: str, k: int = LECTURE_RETRIEVAL_TOP_K) -> tuple[LectureIndex, list[dict]]:
+        index = await asyncio.to_thread(self.get, lecture_id)
+        if index is None:
+            raise HTTPException(status_code=404, detail=f"Lecture {lecture_id} has not been indexed")
+        started = time.monotonic()
+        query_vector = None
+        model = index.meta.get("embed_model")
+        if model and index.embeddings is not None:
+            try:
+                query_vector = (await embed_ollama([query], model))[0]
+            except HTTPException as e:
+                self.embedding_fallbacks += 1
+                logger.warning(f"Query embedding failed, ranking lecture {lecture_id} with BM25 only: {e.detail}")
+        hits = await asyncio.to_thread(index.search, query, k, query_vector)
+        self.searches += 1
+        self.search_seconds += time.monotonic() - started
+        return index, hits
+
+    def delete(self, lecture_id: str) -> bool:
+        directory = self._path(lecture_id)
+        with self._lock:
+            self._loaded.pop(lecture_id, None)
+        if not os.path.exists(directory):
+            return False
+        shutil.rmtree(directory)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "indexed_lectures": sum(
+                1 for name in os.listdir(self.index_dir) if os.path.exists(os.path.join(self.index_dir, name, "meta.json"))
+            ),
+            "loaded": len(self._loaded),
+            "searches": self.searches,
+            "avg_search_ms": round(1000 * self.search_seconds / self.searches, 2) if self.searches else None,
+            "embedding_fallbacks": self.embedding_fallbacks,
+            "embed_model": self.embed_model or None,
+        }
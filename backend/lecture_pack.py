@@ -0,0 +1,141 @@
+"""
+All lecture artifacts from one request.
+
+The frontend used to call /enhance, /summarize, /key-points, /study-guide and
+/quiz one after another, sending the transcript five times and condensing a
+long transcript four times. /lecture-pack takes the transcript once, condenses
+it once (long_transcript.condense_transcript) and runs the five generations
+concurrently. The map calls and the generations share one semaphore, so a pack
+never has more than LECTURE_PACK_CONCURRENCY calls in flight; the LLM client's
+per-backend limit still applies across all requests.
+
+Enhancement works on the raw transcript and starts right away. It goes
+through the same content-hashed chunks as /enhance (incremental_enhance), so
+long transcripts never overflow one prompt and chunks either endpoint has
+already enhanced come from the response cache. Its chunk calls share the
+pack's semaphore. The other four artifacts wait for the condensed text, which
+for short transcripts is the transcript itself.
+
+Configuration (environment variables):
+    LECTURE_PACK_CONCURRENCY  LLM calls in flight per pack (default OLLAMA_MAX_CONCURRENCY)
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+from incremental_enhance import enhance_chunks, split_chunks
+from lecture_prompts import (
+    key_points_prompt,
+    parse_key_points,
+    quiz_prompt,
+    study_guide_prompt,
+    summary_prompt,
+)
+from llm_client import OLLAMA_MAX_CONCURRENCY, call_ollama
+from long_transcript import condense_transcript
+
+logger = logging.getLogger(__name__)
+
+LECTURE_PACK_CONCURRENCY = int(os.getenv("LECTURE_PACK_CONCURRENCY", str(OLLAMA_MAX_CONCURRENCY)))
+
+ARTIFACTS = ("enhanced", "summary", "key_points", "study_guide", "quiz")
+
+
+async def build_lecture_pack(
+    text: str,
+    title: str,
+    model: str,
+    paragraphs: Optional[list[str]] = None,
+) -> dict:
+    """
+    Generate every artifact and return them with per-artifact timings.
+    An artifact that fails is None and its error is listed under "errors";
+    the request only fails if every artifact does.
+    """
+    started = time.monotonic()
+    slots = asyncio.Semaphore(max(1, LECTURE_PACK_CONCURRENCY))
+    timings: dict[str, float] = {}
+
+    async def generate(name: str, prompts: tuple[str, str]) -> str:
+        system_prompt, prompt = prompts
+        async with slots:
+            call_started = time.monotonic()
+            output = await call_ollama(prompt, model, system=system_prompt)
+            timings[name] = time.monotonic() - call_started
+        return output.strip()
+
+    async def enhance() -> str:
+        call_started = time.monotonic()
+        chunks, separator = split_chunks(text, paragraphs)
+        parts = list(chunks)
+        failures = []
+        async for index, entry, error in enhance_chunks(chunks, model, slots=slots):
+            parts[index] = entry["enhanced"]
+            if error is not None:
+                failures.append(error)
+        if failures and len(failures) == len(chunks):
+            raise failures[0]
+        if failures:
+            logger.warning(f"Lecture pack: {len(failures)} of {len(chunks)} enhance chunks kept their original text")
+        # Wall time of the chunk calls, which run concurrently
+        timings["enhanced"] = time.monotonic() - call_started
+        return separator.join(parts)
+
+    condensing = asyncio.create_task(condense_transcript(text, model, paragraphs, slots=slots))
+
+    async def from_source(name: str, build_prompts: Callable[[str], tuple[str, str]]) -> str:
+        source = await condensing
+        return await generate(name, build_prompts(source.text))
+
+    try:
+        results = await asyncio.gather(
+            enhance(),
+            from_source("summary", summary_prompt),
+            from_source("key_points", key_points_prompt),
+            from_source("study_guide", lambda source_text: study_guide_prompt(source_text, title)),
+            from_source("quiz", lambda source_text: quiz_prompt(source_text, title)),
+            return_exceptions=True,
+        )
+    finally:
+        condensing.cancel()
+
+    pack: dict = {"title": title}
+    errors: dict[str, str] = {}
+    for name, result in zip(ARTIFACTS, results):
+        if isinstance(result, BaseException):
+            errors[name] = result.detail if isinstance(result, HTTPException) else (str(result) or type(result).__name__)
+            pack[name] = None
+        else:
+            pack[name] = result
+
+    if len(errors) == len(ARTIFACTS):
+        first = results[0]
+        if isinstance(first, HTTPException):
+            raise first
+        raise HTTPException(status_code=502, detail=f"Lecture pack failed: {errors['enhanced']}")
+
+    if pack["key_points"] is not None:
+        pack["key_points"] = parse_key_points(pack["key_points"])
+    pack["word_count"] = len(text.split())
+    pack["paragraph_count"] = len(paragraphs or [])
+
+    total = time.monotonic() - started
+    sequential = sum(timings.values())
+    report = {name: round(seconds, 2) for name, seconds in timings.items()}
+    if condensing.done() and not condensing.cancelled() and condensing.exception() is None:
+        source = condensing.result()
+        source.annotate(pack)
+        report["condense"] = round(source.wall_seconds, 2)
+        sequential += source.sequential_seconds
+    report["total_seconds"] = round(total, 2)
+    # Summed LLM call time, i.e. the wall-clock time of making the calls one at a time
+    report["sequential_seconds"] = round(sequential, 2)
+    pack["timings"] = report
+    pack["errors"] = errors
+
+    logger.info(f"Lecture pack for '{title}' in {total:.1f}s ({sequential:.1f}s of LLM calls), errors: {list(errors)}")
+    return pack
@@ -0,0 +1,226 @@
+"""
+Prompts for the lecture artifacts (enhanced text, summary, key points, study
+guide, quiz) and /notes, shared by main.py, main_ai_only.py, /lecture-pack
+and the sharded quiz generator. Each builder returns (system_prompt, prompt).
+"""
+
+ENHANCE_SYSTEM_PROMPT = """You are a professional transcription editor.
+Your task is to clean up and enhance lecture transcriptions while maintaining the original meaning and content.
+Fix grammar, add proper punctuation, correct obvious errors, but don't add new information.
+Keep the lecture's natural flow and conversational tone."""
+
+SUMMARY_SYSTEM_PROMPT = """You are an expert at summarizing educational content.
+Create clear, concise summaries that capture the main ideas and key points.
+Use bullet points for clarity and organize by topic."""
+
+KEY_POINTS_SYSTEM_PROMPT = """You are an educational content analyst.
+Extract the most important points from lectures in a clear, organized manner."""
+
+STUDY_GUIDE_SYSTEM_PROMPT = """You are an expert educator creating study materials.
+Generate comprehensive study guides that help students learn and retain information."""
+
+QUIZ_SYSTEM_PROMPT = """You are an expert at creating educational assessments.
+Generate clear, fair quiz questions that test understanding of key concepts."""
+
+QUIZ_SHARD_SYSTEM_PROMPT = """You are an expert at creating educational assessments.
+You write multiple-choice questions about one section of a lecture at a time.
+Return ONLY valid JSON, no prose, no extra text."""
+
+
+def enhance_prompt(text: str) -> tuple[str, str]:
+    prompt = f"""Please enhance this lecture transcription by fixing grammar, punctuation, and clarity:
+
+{text}
+
+Return only the enhanced text, no explanations."""
+    return ENHANCE_SYSTEM_PROMPT, prompt
+
+
+def summary_prompt(text: str) -> tuple[str, str]:
+    prompt = f"""Summarize this lecture transcription. Include:
+1. Main topic and objectives
+2. Key concepts covered
+3. Important details and examples
+4. Conclusions or takeaways
+
+Transcription:
+{text}
+
+Format as a clear, structured summary."""
+    return SUMMARY_SYSTEM_PROMPT, prompt
+
+
+def key_points_prompt(text: str) -> tuple[str, str]:
+    prompt = f"""Extract the key points from this lecture. Format as a numbered list.
+Focus on main concepts, important facts, and critical information students should remember.
+
+Lecture:
+{text}
+
+Return only the key points list, no introduction."""
+    return KEY_POINTS_SYSTEM_PROMPT, prompt
+
+
+def study_guide_prompt(text: str, title: str) -> tuple[str, str]:
+    prompt = f"""Create a study guide for this lecture titled "{title}".
+
+Include:
+1. **Overview**: Brief summary of the topic
+2. **Key Concepts**: Main ideas with explanations
+3. **Important Terms**: Definitions of key terms
+4. **Practice Questions**: 5-7 questions to test understanding
+5. **Study Tips**: How to best learn this material
+
+Lecture Content:
+{text}
+
+Format as a well-structured study guide."""
+    return STUDY_GUIDE_SYSTEM_PROMPT, prompt
+
+
+def quiz_prompt(text: str, title: str, count: int = 10) -> tuple[str, str]:
+    prompt = f"""Create a quiz with {count} multiple-choice questions based on this lecture: "{title}"
+
+For each question:
+- Write a clear question
+- Provide 4 options (A, B, C, D)
+- Mark the correct answer
+- Add a brief explanation
+
+Lecture:
+{text}
+
+Format as:
+Q1: [question]
+A) [option]
+B) [option]
+C) [option]
+D) [option]
+Correct: [letter]
+Explanation: [brief explanation]"""
+    return QUIZ_SYSTEM_PROMPT, prompt
+
+
+NOTES_QUIZ_COUNT = 50
+
+NOTES_STRUCTURE = """notes_markdown structure (use markdown):
+## 1. INTRODUCTION
+- Clear overview of topic
+
+## 2. EXPLANATION WITH SIDE HEADINGS
+Break into numbered sections (e.g., "### 2.1 Topic Name"):
+- **Definition:** Clear definition with key terms **bolded**
+- **Explanation:** Detailed explanation
+- Bullet points with examples
+- **Example:** Real-world example
+
+## 3. SHORT NOTES
+- Concise bullet points of key facts
+
+## 4. IMPORTANT TOPICS
+- **Topic 1:** Brief explanation
+- **Topic 2:** Brief explanation
+
+## 5. REAL-LIFE EXAMPLE
+- Comprehensive scenario with bullets
+
+## 6. TABLES
+Use markdown tables for comparisons (| Header 1 | Header 2 |)
+
+## 7. CHARTS
+Include at least one chart as JSON code block:
+```json
+{
+  "type": "bar|line|pie",
+  "title": "Chart Title",
+  "data": [{"name": "Label", "value": 100}],
+  "xKey": "name",
+  "yKey": "value"
+}
+```
+
+## 8. WEB LINKS
+- List 5-10 high-quality academic URLs
+
+Return ONLY this JSON object, fully filled out."""
+
+
+def notes_prompt(transcript: str, topic: str, include_quiz: bool = True) -> tuple[str, str]:
+    """
+    The /notes prompt. With include_quiz=False the model is asked for an empty
+    quiz, for when the questions are generated separately (quiz_engine).
+    """
+    if include_quiz:
+        quiz_key = (
+            f"array of EXACTLY {NOTES_QUIZ_COUNT} unique quiz objects, "
+            "each with: question, options {A,B,C,D}, answer, explanation"
+        )
+        quiz_rules = f"""- ALWAYS return exactly {NOTES_QUIZ_COUNT} quiz questions, never fewer
+- If transcript lacks {NOTES_QUIZ_COUNT} distinct points, create additional relevant questions
+- Return ONLY valid JSON, no prose, no extra text
+- Never repeat quiz questions"""
+        quiz_fields = "quiz (array of objects with fields: question, options (A-D), answer, explanation)"
+    else:
+        quiz_key = "always an empty array; the quiz is generated separately"
+        quiz_rules = "- Return ONLY valid JSON, no prose, no extra text"
+        quiz_fields = "quiz (an empty array)"
+
+    system_prompt = f"""You are an expert academic note generator. Given a lecture transcript, you MUST return a single, valid JSON object with these exact keys:
+{{
+  "notes_markdown": (string, strict markdown with ALL sections below),
+  "summary_bullets": (array of 10-20 concise English summary points),
+  "charts_embedded": (boolean, true if any chart JSON is present),
+  "web_links": (array of at least 5 real .edu/.gov/journal URLs),
+  "quiz": ({quiz_key})
+}}
+
+CRITICAL RULES:
+{quiz_rules}
+
+""" + NOTES_STRUCTURE
+
+    prompt = f"""Topic: {topic}
+
+Transcript:
+{transcript}
+
+Return a JSON object with keys: notes_markdown, summary_bullets (array of strings), charts_embedded (boolean), web_links (array of url strings), {quiz_fields}.
+Ensure notes_markdown includes tables and chart JSON blocks when relevant.
+"""
+    return system_prompt, prompt
+
+
+def quiz_shard_prompt(section: str, title: str, count: int, focus: str, avoid: list[str]) -> tuple[str, str]:
+    avoid_block = ""
+    if avoid:
+        listed = "\n".join(f"- {question}" for question in avoid)
+        avoid_block = f"""
+These questions already exist; do not repeat or rephrase them:
+{listed}
+"""
+    prompt = f"""Write {count} multiple-choice questions about this section of the lecture "{title}".
+Focus on {focus}. Every question must be answerable from the section.
+{avoid_block}
+Section:
+{section}
+
+Return a JSON object: {{"quiz": [{{"question": "...", "options": {{"A": "...", "B": "...", "C": "...", "D": "..."}}, "answer": "A", "explanation": "..."}}]}}"""
+    return QUIZ_SHARD_SYSTEM_PROMPT, prompt
+
+
+def format_quiz(questions: list[dict]) -> str:
+    """Render quiz objects in the text format quiz_prompt asks the model for."""
+    blocks = []
+    for number, item in enumerate(questions, 1):
+        lines = [f"Q{number}: {item['question']}"]
+        lines += [f"{letter}) {option}" for letter, option in item["options"].items()]
+        lines.append(f"Correct: {item['answer']}")
+        if item.get("explanation"):
+            lines.append(f"Explanation: {item['explanation']}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def parse_key_points(key_points: str) -> list[str]:
+    """Split the model's numbered list into one entry per line."""
+    return [line.strip() for line in key_points.strip().split('\n') if line.strip()]
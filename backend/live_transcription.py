@@ -0,0 +1,275 @@
+"""
+Live transcription over WebSocket.
+
+The client streams audio while recording; the server runs Silero VAD over the
+buffered audio and, as soon as a speech region is followed by enough silence,
+transcribes that window on the transcription executor and pushes the final
+segments back. The unfinished tail is periodically transcribed as a partial
+result. When the client sends {"type": "stop"}, only the last window is left
+to transcribe. Final segments are fed to a ParagraphSegmenter, and each
+"final" message carries the paragraphs that closed with it ("paragraphs" is
+often empty: a paragraph stays open until a later pause or topic shift).
+
+Protocol:
+    client -> server   binary frames: audio chunks. Container data (WebM/Opus
+                       from MediaRecorder, Ogg, ...) by default, or raw 16 kHz
+                       mono 16-bit PCM when connected with ?format=pcm_s16le
+                       text frame {"type": "stop"}: end of recording
+    server -> client   {"type": "partial", "segments": [...]}
+                       {"type": "final", "segments": [...], "paragraphs": [...]}
+                       {"type": "done", "text", "paragraphs", "segments", "metadata"}
+                       {"type": "error", "detail": "..."}
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from audio_ingest import SAMPLE_RATE, AudioDecodeError, StreamingDecoder, pcm16_to_float32
+from segmentation import ParagraphSegmenter
+from transcription import transcribe_window
+from transcription_executor import QueueFullError, TranscriptionExecutor
+
+logger = logging.getLogger(__name__)
+
+# Silence after speech that closes a window
+LIVE_MIN_SILENCE_MS = int(os.getenv("LIVE_MIN_SILENCE_MS", "600"))
+# Force a window closed if nobody pauses for this long
+LIVE_MAX_WINDOW_S = float(os.getenv("LIVE_MAX_WINDOW_S", "30"))
+# New audio between partial results; 0 disables partials
+LIVE_PARTIAL_INTERVAL_S = float(os.getenv("LIVE_PARTIAL_INTERVAL_S", "3"))
+
+# Silence kept at the head of the buffer so speech onsets aren't clipped
+_LEAD_IN_SAMPLES = SAMPLE_RATE // 2
+
+
+class LiveTranscriptionSession:
+    """One recording streamed over one WebSocket."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        executor: TranscriptionExecutor,
+        input_format: str = "container",
+        model_size: Optional[str] = None,
+        compute_type: Optional[str] = None,
+    ):
+        self.websocket = websocket
+        self.executor = executor
+        self.input_format = input_format
+        self.model_size = model_size
+        self.compute_type = compute_type
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._offset = 0  # samples already consumed from the start of the recording
+        self._since_partial = 0
+        self._segments: list[dict] = []
+        self._segmenter = ParagraphSegmenter()
+        self._language: Optional[str] = None
+        self._language_probability = 0.0
+        self._new_audio = asyncio.Event()
+        self._input_done = False
+
+        self._vad_options = VadOptions(min_silence_duration_ms=LIVE_MIN_SILENCE_MS, speech_pad_ms=200)
+        self._min_silence = LIVE_MIN_SILENCE_MS * SAMPLE_RATE // 1000
+        self._max_window = int(LIVE_MAX_WINDOW_S * SAMPLE_RATE)
+        self._partial_interval = int(LIVE_PARTIAL_INTERVAL_S * SAMPLE_RATE)
+
+    async def run(self):
+        decoder = None
+        if self.input_format != "pcm_s16le":
+            decoder = StreamingDecoder(self._add_pcm)
+            try:
+                await decoder.start()
+            except AudioDecodeError as e:
+                await self._unsupported_audio(e)
+                return
+
+        worker = asyncio.create_task(self._process_loop())
+        receiver = asyncio.create_task(self._receive_loop(decoder))
+        try:
+            await asyncio.wait({receiver, worker}, return_when=asyncio.FIRST_COMPLETED)
+            if worker.done():
+                # The worker only returns after stop, so it failed; stop taking audio
+                receiver.cancel()
+                if decoder:
+                    decoder.kill()
+                await self._fail(worker.exception())
+                return
+            await receiver
+            if decoder:
+                await decoder.close()
+        except WebSocketDisconnect:
+            logger.info("Live transcription client disconnected")
+            worker.cancel()
+            if decoder:
+                decoder.kill()
+            return
+        except AudioDecodeError as e:
+            worker.cancel()
+            if decoder:
+                decoder.kill()
+            await self._unsupported_audio(e)
+            return
+        finally:
+            receiver.cancel()
+
+        self._input_done = True
+        self._new_audio.set()
+        try:
+            await worker
+        except Exception as e:
+            await self._fail(e)
+            return
+        await self.websocket.close()
+
+    async def _unsupported_audio(self, error: AudioDecodeError):
+        """Tell the client its audio can't be decoded and close with the unsupported-data code."""
+        await self._send({"type": "error", "detail": f"Unsupported audio: {error}"})
+        await self.websocket.close(code=1003)
+
+    async def _fail(self, error: BaseException):
+        """Report a transcription failure to the client and close with an internal-error code."""
+        detail = error.detail if isinstance(error, HTTPException) else (str(error) or type(error).__name__)
+        logger.error(f"Live transcription failed: {detail}", exc_info=error)
+        await self._send({"type": "error", "detail": f"Transcription failed: {detail}"})
+        try:
+            await self.websocket.close(code=1011)
+        except RuntimeError:
+            pass
+
+    async def _receive_loop(self, decoder: Optional[StreamingDecoder]):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            if message.get("bytes"):
+                if decoder:
+                    await decoder.feed(message["bytes"])
+                else:
+                    self._add_pcm(pcm16_to_float32(message["bytes"]))
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except json.JSONDecodeError:
+                    continue
+                if control.get("type") == "stop":
+                    return
+
+    def _add_pcm(self, samples: np.ndarray):
+        self._buffer = np.concatenate([self._buffer, samples])
+        self._since_partial += len(samples)
+        self._new_audio.set()
+
+    def _consume(self, count: int):
+        self._buffer = self._buffer[count:]
+        self._offset += count
+
+    async def _process_loop(self):
+        while True:
+            await self._new_audio.wait()
+            self._new_audio.clear()
+            while await self._step():
+                pass
+            if self._input_done:
+                await self._finish()
+                return
+
+    async def _step(self) -> bool:
+        """Transcribe the next finished VAD window, if any. Returns True if one was consumed."""
+        buffer = self._buffer
+        if len(buffer) < SAMPLE_RATE // 2:
+            return False
+
+        speech = await asyncio.to_thread(get_speech_timestamps, buffer, self._vad_options)
+        if not speech:
+            # Pure silence: drop it, keeping a short lead-in for the next utterance
+            if len(buffer) > _LEAD_IN_SAMPLES:
+                self._consume(len(buffer) - _LEAD_IN_SAMPLES)
+            return False
+
+        finished = [chunk for chunk in speech if chunk["end"] + self._min_silence <= len(buffer)]
+        if finished:
+            cut = finished[-1]["end"]
+        elif len(buffer) >= self._max_window:
+            # Nobody paused: cut before the speech in progress, or everything if it fills the window
+            cut = speech[-1]["start"] if speech[-1]["start"] > SAMPLE_RATE else len(buffer)
+        else:
+            await self._maybe_partial()
+            return False
+
+        return await self._finalize(cut)
+
+    async def _finalize(self, cut: int) -> bool:
+        result = await self._transcribe(self._buffer[:cut])
+        if result is None:
+            return False
+
+        self._consume(cut)
+        self._since_partial = 0
+        self._segments.extend(result["segments"])
+        if self._language is None and result["segments"]:
+            self._language = result["language"]
+            self._language_probability = result["language_probability"]
+        if result["segments"]:
+            paragraphs = [
+                paragraph
+                for seg in result["segments"]
+                for paragraph in self._segmenter.feed(seg["text"], seg["start"], seg["end"])
+            ]
+            await self._send({"type": "final", "segments": result["segments"], "paragraphs": paragraphs})
+        return True
+
+    async def _maybe_partial(self):
+        if not self._partial_interval or self._since_partial < self._partial_interval:
+            return
+        result = await self._transcribe(self._buffer)
+        if result is None:
+            return
+        self._since_partial = 0
+        await self._send({"type": "partial", "segments": result["segments"]})
+
+    async def _transcribe(self, audio: np.ndarray) -> Optional[dict]:
+        try:
+            return await self.executor.submit(
+                transcribe_window,
+                audio,
+                self._offset / SAMPLE_RATE,
+                model_size=self.model_size,
+                compute_type=self.compute_type,
+            )
+        except QueueFullError:
+            # Keep the audio buffered and try again when more arrives
+            logger.warning("Transcription queue full, deferring live window")
+            return None
+
+    async def _finish(self):
+        """Transcribe whatever is left and send the complete transcript."""
+        while len(self._buffer) and not await self._finalize(len(self._buffer)):
+            await asyncio.sleep(1)
+
+        self._segmenter.flush()
+        full_text = " ".join(s["text"] for s in self._segments)
+        await self._send({
+            "type": "done",
+            "text": full_text.strip(),
+            "paragraphs": self._segmenter.paragraphs,
+            "segments": self._segments,
+            "metadata": {
+                "language": self._language,
+                "language_probability": self._language_probability,
+                "duration": self._offset / SAMPLE_RATE
+            }
+        })
+
+    async def _send(self, payload: dict):
+        try:
+            await self.websocket.send_json(payload)
+        except (WebSocketDisconnect, RuntimeError):
+            logger.info("Live transcription client went away before receiving results")
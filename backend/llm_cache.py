@@ -0,0 +1,289 @@
+"""
+Cache of LLM responses keyed by what determines the output.
+
+The same /summarize, /study-guide or /quiz call for one lecture comes in again
+and again (page reloads, several students in one class, retries), and each one
+used to run a full generation. Responses are now keyed by a hash of the
+backend, model, system prompt, user prompt and sampling options, with line
+endings, trailing whitespace and runs of blank lines normalised so cosmetic
+differences still hit.
+
+Two tiers: an in-process LRU for hot entries and SQLite (data/cache/llm.db) so
+entries survive restarts. Both expire entries after LLM_CACHE_TTL seconds; the
+disk tier evicts least-recently-used entries beyond LLM_CACHE_MAX_MB.
+
+A request sent with "X-LLM-Cache: bypass" skips the lookup and regenerates,
+then stores the fresh response in place of the old one.
+
+Configuration (environment variables):
+    LLM_CACHE_TTL             seconds a response stays valid (default 86400, 0 disables caching)
+    LLM_CACHE_MEMORY_ENTRIES  responses kept in memory (default 256)
+    LLM_CACHE_MAX_MB          size budget of the disk tier (default 128, 0 disables it)
+    LLM_CACHE_DIR             directory for llm.db (default data/cache)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "128"))
+LLM_CACHE_DIR = os.getenv(
+    "LLM_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache")
+)
+
+BYPASS_HEADER = "x-llm-cache"
+
+# Set per request by LLMCacheBypassMiddleware; copied into tasks the request spawns
+cache_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)",
+]
+
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def _normalise(value: Any) -> Any:
+    if isinstance(value, str):
+        lines = value.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        return _BLANK_LINES.sub("\n\n", "\n".join(line.rstrip() for line in lines)).strip()
+    if isinstance(value, list):
+        return [_normalise(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _normalise(item) for key, item in value.items()}
+    return value
+
+
+def llm_cache_key(backend: str, model: str, system: Optional[str], prompt: Any, options: dict) -> str:
+    """Hash of everything that shapes a response; prompt is a string or a list of chat messages."""
+    material = {
+        "backend": backend,
+        "model": model,
+        "system": _normalise(system or ""),
+        "prompt": _normalise(prompt),
+        "options": options,
+    }
+    digest = hashlib.blake2b(json.dumps(material, sort_keys=True).encode("utf-8"), digest_size=20)
+    return digest.hexdigest()
+
+
+class LLMCacheBypassMiddleware:
+    """Marks requests sent with "X-LLM-Cache: bypass" (or "no-cache") so their LLM calls skip the lookup."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        value = dict(scope["headers"]).get(BYPASS_HEADER.encode(), b"").decode().strip().lower()
+        token = cache_bypass.set(value in ("bypass", "no-cache"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            cache_bypass.reset(token)
+
+
+class LLMResponseCache:
+    """In-memory LRU in front of a size-bounded SQLite store, both with a TTL."""
+
+    def __init__(
+        self,
+        ttl: float = LLM_CACHE_TTL,
+        memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+        max_bytes: int = int(LLM_CACHE_MAX_MB * 1024 * 1024),
+        cache_dir: str = LLM_CACHE_DIR,
+    ):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(cache_dir, "llm.db")
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._db_ready = False
+        self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_served = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @property
+    def disk_enabled(self) -> bool:
+        return self.enabled and self.max_bytes > 0
+
+    async def get(self, key: str) -> Optional[str]:
+        """Cached response for key, or None on a miss, an expired entry or a bypassed request."""
+        if not self.enabled:
+            return None
+        if cache_bypass.get():
+            self.bypassed += 1
+            return None
+
+        response = self._memory_get(key)
+        if response is not None:
+            self.memory_hits += 1
+        elif self.disk_enabled:
+            response = await asyncio.to_thread(self._disk_get, key)
+            if response is not None:
+                self.disk_hits += 1
+                self._memory_put(key, response, time.time())
+
+        if response is None:
+            self.misses += 1
+            return None
+        self.bytes_served += len(response.encode("utf-8"))
+        return response
+
+    async def put(self, key: str, response: str):
+        if not self.enabled or not response:
+            return
+        now = time.time()
+        self._memory_put(key, response, now)
+        self.stores += 1
+        if self.disk_enabled:
+            await asyncio.to_thread(self._disk_put, key, response, now)
+
+    def purge(self) -> int:
+        """Drop every cached response. Returns disk entries removed."""
+        self._memory.clear()
+        if not self.disk_enabled:
+            return 0
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM responses").rowcount
+        with self._connect() as conn:
+            conn.execute("VACUUM")
+        return removed
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "memory_entries": len(self._memory),
+            "max_memory_entries": self.memory_entries,
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "bytes_served": self.bytes_served,
+        }
+        if self.disk_enabled:
+            with self._connect() as conn:
+                entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            stats.update({"disk_entries": entries, "disk_bytes": total, "max_disk_bytes": self.max_bytes})
+        return stats
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        response, created_at = entry
+        if time.time() - created_at > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return response
+
+    def _memory_put(self, key: str, response: str, created_at: float):
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    @contextmanager
+    def _connect(self):
+        with self._db_lock:
+            if not self._db_ready:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=10)
+                try:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    for statement in _SCHEMA:
+                        conn.execute(statement)
+                    conn.commit()
+                finally:
+                    conn.close()
+                self._db_ready = True
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def _disk_put(self, key: str, response: str, now: float):
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now: float):
+        evicted = conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        if evicted:
+            self.evictions += evicted
+            logger.info(f"LLM cache evicted {evicted} entries")
+
+
+llm_cache = LLMResponseCache()
@@ -0,0 +1,535 @@
+"""
+Shared async client for the LLM backends (Ollama and OpenRouter).
+
+All LLM calls go through one pooled httpx.AsyncClient, so connections to
+Ollama and OpenRouter are kept alive between requests instead of paying a new
+TCP/TLS handshake per call, and nothing blocks the event loop while a model
+generates. Each backend has its own concurrency limit: calls beyond it wait
+for a slot rather than piling onto a local Ollama that can only run a couple
+of generations at once. Slots are handed out by priority class and session
+(see llm_scheduler).
+
+Configuration (environment variables):
+    OLLAMA_HOST                 Ollama base URL (default http://localhost:11434)
+    OLLAMA_MAX_CONCURRENCY      concurrent Ollama calls (default 2)
+    OPENROUTER_MAX_CONCURRENCY  concurrent OpenRouter calls (default 8)
+    LLM_CONNECT_TIMEOUT         seconds to establish a connection (default 5)
+    LLM_READ_TIMEOUT            seconds to wait for a response (default 120)
+    LLM_MAX_CONNECTIONS         pooled connections across backends (default 20)
+"""
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+import httpx
+from fastapi import HTTPException, Request
+
+from llm_cache import llm_cache, llm_cache_key
+from llm_scheduler import LLMScheduler
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
+OLLAMA_GENERATE_URL = f"{OLLAMA_HOST}/api/generate"
+OLLAMA_TAGS_URL = f"{OLLAMA_HOST}/api/tags"
+OLLAMA_EMBED_URL = f"{OLLAMA_HOST}/api/embed"
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+OPENROUTER_MODEL = "anthropic/claude-3.5-sonnet"  # Using Claude for better educational responses
+
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+OPENROUTER_MAX_CONCURRENCY = int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "8"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+
+# How often a waiting endpoint checks whether its client went away
+DISCONNECT_POLL_INTERVAL = 0.5
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(HTTPException):
+    """The caller went away before the LLM answered; nobody will read the response."""
+
+    def __init__(self):
+        super().__init__(status_code=499, detail="Client closed request")
+
+
+class _Preempted(Exception):
+    """A borrowed slot was taken back for an interactive call."""
+
+
+class _Backend:
+    """Concurrency limit, scheduler and counters for one LLM backend."""
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.scheduler = LLMScheduler(name, self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.preempted = 0
+        self.total_seconds = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "preempted": self.preempted,
+            "avg_seconds": round(self.total_seconds / self.completed, 3) if self.completed else None,
+            "scheduler": self.scheduler.stats(),
+        }
+
+
+class LLMClient:
+    """Pooled HTTP client with per-backend concurrency limits."""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.ollama = _Backend("ollama", OLLAMA_MAX_CONCURRENCY)
+        self.openrouter = _Backend("openrouter", OPENROUTER_MAX_CONCURRENCY)
+        # Recent time-to-first-token per streaming endpoint
+        self._first_token: dict[str, deque] = {}
+        # Called when Ollama refuses a connection or errors, e.g. to refresh cached availability
+        self.on_ollama_failure: Optional[Callable[[], None]] = None
+        # Identical generations in progress, shared by every caller asking for them
+        self.flights = SingleFlight()
+
+    def ollama_failed(self):
+        if self.on_ollama_failure is not None:
+            self.on_ollama_failure()
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                ),
+            )
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self, backend: _Backend, preemptible: bool = False, since: Optional[float] = None):
+        """Hold one of the backend's concurrency slots for a call, as granted by its scheduler."""
+        backend.waiting += 1
+        try:
+            lease = await backend.scheduler.acquire(preemptible, since)
+        finally:
+            backend.waiting -= 1
+        backend.in_flight += 1
+        started = time.monotonic()
+        seconds = None
+        try:
+            yield lease
+            seconds = time.monotonic() - started
+            backend.completed += 1
+            backend.total_seconds += seconds
+        except _Preempted:
+            backend.preempted += 1
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            backend.cancelled += 1
+            raise
+        except Exception:
+            seconds = time.monotonic() - started
+            backend.failed += 1
+            raise
+        finally:
+            backend.in_flight -= 1
+            backend.scheduler.release(lease, seconds)
+
+    async def post_json(self, backend: _Backend, url: str, payload: dict, headers: Optional[dict] = None) -> httpx.Response:
+        """
+        POST within the backend's concurrency limit. A call running on a
+        borrowed slot is cancelled if the slot is taken back, then queued again
+        at the front with its original deadline; it doesn't borrow a second time.
+        """
+        preemptible, since = True, None
+        queued_at = time.monotonic()
+        while True:
+            try:
+                async with self._slot(backend, preemptible, since) as lease:
+                    if lease.preempted is None:
+                        return await self.http.post(url, json=payload, headers=headers)
+                    return await _unless_preempted(self.http.post(url, json=payload, headers=headers), lease.preempted)
+            except _Preempted:
+                logger.info(f"{backend.name}: batch call preempted by an interactive call, queueing it again")
+                preemptible, since = False, queued_at
+
+    @asynccontextmanager
+    async def stream_post(self, backend: _Backend, url: str, payload: dict, headers: Optional[dict] = None):
+        """POST and stream the response body, holding a slot until the stream is closed."""
+        async with self._slot(backend):
+            async with self.http.stream("POST", url, json=payload, headers=headers) as response:
+                yield response
+
+    def record_first_token(self, endpoint: str, seconds: float):
+        self._first_token.setdefault(endpoint, deque(maxlen=200)).append(seconds)
+
+    def _first_token_stats(self) -> dict:
+        stats = {}
+        for endpoint, samples in self._first_token.items():
+            ordered = sorted(samples)
+            stats[endpoint] = {
+                "samples": len(ordered),
+                "p50_seconds": round(statistics.median(ordered), 3),
+                "p95_seconds": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "last_seconds": round(samples[-1], 3),
+            }
+        return stats
+
+    def stats(self) -> dict:
+        return {
+            "connect_timeout": LLM_CONNECT_TIMEOUT,
+            "read_timeout": LLM_READ_TIMEOUT,
+            "max_connections": LLM_MAX_CONNECTIONS,
+            "backends": {
+                "ollama": self.ollama.stats(),
+                "openrouter": self.openrouter.stats(),
+            },
+            "time_to_first_token": self._first_token_stats(),
+            "coalescing": self.flights.stats(),
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+llm_client = LLMClient()
+
+
+async def _unless_preempted(call: Awaitable[T], preempted: asyncio.Future) -> T:
+    """Await call, cancelling it and raising _Preempted if preempted resolves first."""
+    task = asyncio.ensure_future(call)
+    try:
+        await asyncio.wait({task, preempted}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        raise _Preempted()
+    return task.result()
+
+
+async def list_ollama_models() -> list[str]:
+    """Names of the models Ollama has pulled. Raises on connection/HTTP errors."""
+    response = await llm_client.http.get(OLLAMA_TAGS_URL, timeout=httpx.Timeout(2.0))
+    response.raise_for_status()
+    return [m['name'] for m in response.json().get('models', [])]
+
+
+@contextmanager
+def _ollama_errors():
+    """Map transport failures of an Ollama call to HTTP errors."""
+    try:
+        yield
+    except HTTPException:
+        raise
+    except httpx.TimeoutException:
+        logger.error("Ollama request timed out")
+        raise HTTPException(status_code=504, detail="LLM processing timed out")
+    except httpx.ConnectError:
+        logger.error("Could not connect to Ollama")
+        llm_client.ollama_failed()
+        raise HTTPException(status_code=503, detail="Ollama service unavailable")
+    except Exception as e:
+        logger.error(f"Ollama error: {e}")
+        raise HTTPException(status_code=500, detail=f"LLM processing failed: {str(e)}")
+
+
+def _ollama_payload(prompt: str, model: str, system: Optional[str], stream: bool) -> dict:
+    # Build the prompt with system message if provided
+    full_prompt = prompt
+    if system:
+        full_prompt = f"System: {system}\n\nUser: {prompt}"
+
+    return {
+        "model": model,
+        "prompt": full_prompt,
+        "stream": stream,
+        "options": {
+            "temperature": 0.7
+        }
+    }
+
+
+async def call_ollama(prompt: str, model: str, system: Optional[str] = None) -> str:
+    """
+    Call Ollama's generate endpoint and return the response text, from the
+    response cache when possible or from an identical call already in flight.
+    """
+    text, _ = await call_ollama_cached(prompt, model, system)
+    return text
+
+
+async def call_ollama_cached(prompt: str, model: str, system: Optional[str] = None) -> tuple[str, bool]:
+    """call_ollama, also returning whether the text came from the response cache."""
+    payload = _ollama_payload(prompt, model, system, stream=False)
+    cache_key = llm_cache_key("ollama", model, system, prompt, payload["options"])
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        return cached, True
+    return await llm_client.flights.call(cache_key, lambda: _generate_ollama(payload, cache_key)), False
+
+
+async def _generate_ollama(payload: dict, cache_key: str) -> str:
+    with _ollama_errors():
+        response = await llm_client.post_json(llm_client.ollama, OLLAMA_GENERATE_URL, payload)
+
+        if response.status_code != 200:
+            llm_client.ollama_failed()
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Ollama API error: {response.text}"
+            )
+
+        result = response.json()
+        text = result.get('response', '').strip()
+        await llm_cache.put(cache_key, text)
+        return text
+
+
+async def stream_ollama(prompt: str, model: str, system: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Yield response tokens from Ollama's NDJSON stream as they are generated.
+    A cached response is yielded as a single token; joining an identical call
+    already in flight replays its tokens so far, then follows it.
+    """
+    payload = _ollama_payload(prompt, model, system, stream=True)
+    cache_key = llm_cache_key("ollama", model, system, prompt, payload["options"])
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+    async for token in llm_client.flights.stream(cache_key, lambda: _stream_ollama(payload, cache_key)):
+        yield token
+
+
+async def embed_ollama(texts: list[str], model: str) -> list[list[float]]:
+    """Embedding vectors for texts from an Ollama embedding model (not cached)."""
+    with _ollama_errors():
+        response = await llm_client.post_json(llm_client.ollama, OLLAMA_EMBED_URL, {"model": model, "input": texts})
+
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Ollama embedding error: {response.text}"
+            )
+
+        embeddings = response.json().get("embeddings") or []
+        if len(embeddings) != len(texts):
+            raise HTTPException(status_code=502, detail="Ollama returned the wrong number of embeddings")
+        return embeddings
+
+
+async def _stream_ollama(payload: dict, cache_key: str) -> AsyncIterator[str]:
+    with _ollama_errors():
+        parts = []
+        async with llm_client.stream_post(llm_client.ollama, OLLAMA_GENERATE_URL, payload) as response:
+            if response.status_code != 200:
+                llm_client.ollama_failed()
+                body = (await response.aread()).decode(errors="replace")
+                raise HTTPException(status_code=response.status_code, detail=f"Ollama API error: {body}")
+
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise HTTPException(status_code=500, detail=f"Ollama API error: {chunk['error']}")
+                if chunk.get("response"):
+                    parts.append(chunk["response"])
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    await llm_cache.put(cache_key, "".join(parts).strip())
+                    return
+
+
+@contextmanager
+def _openrouter_errors():
+    """Map transport failures of an OpenRouter call to HTTP errors."""
+    try:
+        yield
+    except HTTPException:
+        raise
+    except httpx.TimeoutException:
+        logger.error("OpenRouter request timed out")
+        raise HTTPException(status_code=504, detail="Chat request timed out")
+    except httpx.ConnectError:
+        logger.error("Could not connect to OpenRouter")
+        raise HTTPException(status_code=503, detail="Chat service unavailable")
+    except Exception as e:
+        logger.error(f"OpenRouter error: {e}")
+        raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
+
+
+def _openrouter_request(messages: list[dict], system_prompt: str, api_key: str, stream: bool) -> tuple[dict, dict]:
+    # Prepare messages with system prompt
+    full_messages = [{"role": "system", "content": system_prompt}] + messages
+
+    payload = {
+        "model": OPENROUTER_MODEL,
+        "messages": full_messages,
+        "temperature": 0.7,
+        "max_tokens": 4000,  # Allow for detailed, long responses
+    }
+    if stream:
+        payload["stream"] = True
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "http://localhost:4000",
+        "X-Title": "ClassNote AI"
+    }
+    return payload, headers
+
+
+def _openrouter_cache_key(payload: dict, system_prompt: str, messages: list[dict]) -> str:
+    # The API key and stream flag don't change the reply
+    options = {"temperature": payload["temperature"], "max_tokens": payload["max_tokens"]}
+    return llm_cache_key("openrouter", payload["model"], system_prompt, messages, options)
+
+
+async def call_openrouter(messages: list[dict], system_prompt: str, api_key: str) -> str:
+    """
+    Call OpenRouter chat completions and return the reply text, from the
+    response cache when possible or from an identical call already in flight.
+    """
+    payload, headers = _openrouter_request(messages, system_prompt, api_key, stream=False)
+    cache_key = _openrouter_cache_key(payload, system_prompt, messages)
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    return await llm_client.flights.call(cache_key, lambda: _generate_openrouter(payload, headers, cache_key))
+
+
+def openrouter_cache_key(messages: list[dict], system_prompt: str) -> str:
+    payload, _ = _openrouter_request(messages, system_prompt, "", stream=False)
+    return _openrouter_cache_key(payload, system_prompt, messages)
+
+
+async def request_openrouter(messages: list[dict], system_prompt: str, api_key: str) -> str:
+    """One OpenRouter call with this key, bypassing the response cache and coalescing (see llm_providers)."""
+    payload, headers = _openrouter_request(messages, system_prompt, api_key, stream=False)
+    return await _generate_openrouter(payload, headers, None)
+
+
+async def _generate_openrouter(payload: dict, headers: dict, cache_key: Optional[str]) -> str:
+    with _openrouter_errors():
+        response = await llm_client.post_json(llm_client.openrouter, OPENROUTER_API_URL, payload, headers)
+
+        if response.status_code != 200:
+            logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Chat API error: {response.text}"
+            )
+
+        result = response.json()
+
+        if "choices" not in result or len(result["choices"]) == 0:
+            raise HTTPException(
+                status_code=500,
+                detail="No response from chat API"
+            )
+
+        text = result["choices"][0]["message"]["content"].strip()
+        if cache_key is not None:
+            await llm_cache.put(cache_key, text)
+        return text
+
+
+async def stream_openrouter(messages: list[dict], system_prompt: str, api_key: str) -> AsyncIterator[str]:
+    """
+    Yield reply tokens from OpenRouter's SSE stream as they are generated.
+    A cached reply is yielded as a single token; joining an identical call
+    already in flight replays its tokens so far, then follows it.
+    """
+    payload, headers = _openrouter_request(messages, system_prompt, api_key, stream=True)
+    cache_key = _openrouter_cache_key(payload, system_prompt, messages)
+    cached = await llm_cache.get(cache_key)
+    if cached is not None:
+        yield cached
+        return
+    async for token in llm_client.flights.stream(cache_key, lambda: _stream_openrouter(payload, headers, cache_key)):
+        yield token
+
+
+def stream_request_openrouter(messages: list[dict], system_prompt: str, api_key: str) -> AsyncIterator[str]:
+    """One streamed OpenRouter call with this key, bypassing the response cache and coalescing (see llm_providers)."""
+    payload, headers = _openrouter_request(messages, system_prompt, api_key, stream=True)
+    return _stream_openrouter(payload, headers, None)
+
+
+async def _stream_openrouter(payload: dict, headers: dict, cache_key: Optional[str]) -> AsyncIterator[str]:
+    with _openrouter_errors():
+        parts = []
+        async with llm_client.stream_post(llm_client.openrouter, OPENROUTER_API_URL, payload, headers) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode(errors="replace")
+                logger.error(f"OpenRouter API error: {response.status_code} - {body}")
+                raise HTTPException(status_code=response.status_code, detail=f"Chat API error: {body}")
+
+            async for line in response.aiter_lines():
+                # Skip blank separators and ": OPENROUTER PROCESSING" keep-alive comments
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    if cache_key is not None:
+                        await llm_cache.put(cache_key, "".join(parts).strip())
+                    return
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise HTTPException(status_code=500, detail=f"Chat API error: {chunk['error']}")
+                choices = chunk.get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    parts.append(content)
+                    yield content
+
+
+async def cancel_on_disconnect(request: Request, call: Awaitable[T]) -> T:
+    """
+    Await an LLM call, cancelling it if the HTTP client disconnects first so
+    the backend slot and connection are freed for someone still waiting.
+    """
+    task = asyncio.ensure_future(call)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path}, cancelling LLM call")
+                task.cancel()
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,373 @@
+"""
+Failover across OpenRouter keys and the local Ollama backend.
+
+/notes and /quiz/validate used to try the primary OpenRouter key and only move
+to the backup after the primary had failed outright, which could take the
+full 120 s read timeout, and every request went down the same slow path again
+for as long as the outage lasted. A ProviderPool tries an ordered list of
+providers (the OpenRouter keys, then Ollama) instead:
+
+- Each provider has a circuit breaker. After LLM_BREAKER_FAILURES consecutive
+  failures it opens and the provider is skipped for LLM_BREAKER_COOLDOWN
+  seconds. One probe request is then let through, and its success closes the
+  circuit again.
+- A failed call moves on to the next provider at once. Only failures of the
+  provider count: 5xx, 429, rejected credentials (401, 402, 403) and transport
+  errors. Other 4xx responses are faults of the request itself (e.g. a prompt
+  over the context limit); they are returned to the caller as they are,
+  without touching the circuit or trying another provider.
+- A call still running after its provider's LLM_HEDGE_PERCENTILE latency is
+  hedged: the next provider starts too and the first answer wins.
+- Ollama comes last, so a full OpenRouter outage degrades to the local model.
+
+Responses are cached and identical calls coalesced as for call_openrouter,
+except that answers from a fallback to Ollama are not cached, so the better
+model's answer replaces them once OpenRouter recovers.
+
+Configuration (environment variables):
+    LLM_BREAKER_FAILURES   consecutive failures that open a provider's circuit (default 3)
+    LLM_BREAKER_COOLDOWN   seconds an open circuit waits before a probe (default 30)
+    LLM_HEDGE_PERCENTILE   latency percentile after which a call is hedged (default 0.95)
+    LLM_HEDGE_MIN_SAMPLES  latencies a provider needs before the percentile is used (default 20)
+    LLM_HEDGE_DELAY        hedge delay until then (default 30)
+"""
+import asyncio
+import logging
+import os
+import statistics
+import time
+from collections import Counter, deque
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+
+from llm_cache import llm_cache
+from llm_client import (
+    call_ollama,
+    llm_client,
+    openrouter_cache_key,
+    request_openrouter,
+    stream_ollama,
+    stream_request_openrouter,
+)
+from llm_scheduler import LLMOverloaded
+
+logger = logging.getLogger(__name__)
+
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "30"))
+
+# 4xx statuses that mean the provider (or its key) can't serve anyone right now
+_PROVIDER_FAULT_STATUSES = frozenset({401, 402, 403, 429})
+
+
+def provider_fault(error: BaseException) -> bool:
+    """Whether error means the provider is unhealthy, rather than the request being bad."""
+    if not isinstance(error, HTTPException):
+        return True
+    return error.status_code >= 500 or error.status_code in _PROVIDER_FAULT_STATUSES
+
+
+class CircuitBreaker:
+    """Closed (calls allowed), open (calls skipped) or half-open (one probe allowed)."""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.opened = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state this claims the single probe."""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return self.state != "open"
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        """The call ended without a verdict (cancelled or shed locally)."""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "reopens_in": (
+                round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 1)
+                if self.state == "open" else None
+            ),
+        }
+
+
+class Provider:
+    """One key or backend the pool can send a call to, with its health and latency record."""
+
+    kind = "provider"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self.latencies: deque = deque(maxlen=200)
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.last_error: Optional[str] = None
+
+    async def _call(self, messages: list[dict], system_prompt: str) -> str:
+        raise NotImplementedError
+
+    def _stream_call(self, messages: list[dict], system_prompt: str) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def complete(self, messages: list[dict], system_prompt: str) -> str:
+        self.requests += 1
+        started = time.monotonic()
+        try:
+            text = await self._call(messages, system_prompt)
+        except (asyncio.CancelledError, LLMOverloaded):
+            self.cancelled += 1
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self._failed(e)
+            raise
+        self.latencies.append(time.monotonic() - started)
+        self.breaker.record_success()
+        return text
+
+    async def stream(self, messages: list[dict], system_prompt: str) -> AsyncIterator[str]:
+        """Like complete(), but yields tokens; the latency recorded is that of the whole stream."""
+        self.requests += 1
+        started = time.monotonic()
+        try:
+            async for token in self._stream_call(messages, system_prompt):
+                yield token
+        except (asyncio.CancelledError, GeneratorExit, LLMOverloaded):
+            self.cancelled += 1
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self._failed(e)
+            raise
+        self.latencies.append(time.monotonic() - started)
+        self.breaker.record_success()
+
+    def _failed(self, error: Exception):
+        self.last_error = error.detail if isinstance(error, HTTPException) else str(error)
+        if provider_fault(error):
+            self.errors += 1
+            self.breaker.record_failure()
+        else:
+            # The request was at fault; the provider answered, so it says nothing about health
+            self.rejected += 1
+            self.breaker.release()
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for this provider before hedging with the next one."""
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        return self._percentile(LLM_HEDGE_PERCENTILE)
+
+    def _percentile(self, fraction: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[int(fraction * (len(ordered) - 1))]
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            **self.breaker.stats(),
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "error_rate": round(self.errors / self.requests, 3) if self.requests else 0.0,
+            "latency_p50": round(statistics.median(self.latencies), 3) if self.latencies else None,
+            "latency_p95": round(self._percentile(0.95), 3) if self.latencies else None,
+            "hedge_delay": round(self.hedge_delay(), 3),
+            "last_error": self.last_error,
+        }
+
+
+class OpenRouterProvider(Provider):
+    kind = "openrouter"
+
+    def __init__(self, name: str, api_key: str):
+        super().__init__(name)
+        self.api_key = api_key
+
+    async def _call(self, messages: list[dict], system_prompt: str) -> str:
+        return await request_openrouter(messages, system_prompt, self.api_key)
+
+    def _stream_call(self, messages: list[dict], system_prompt: str) -> AsyncIterator[str]:
+        return stream_request_openrouter(messages, system_prompt, self.api_key)
+
+
+class OllamaProvider(Provider):
+    kind = "ollama"
+
+    def __init__(self, name: str, model: str):
+        super().__init__(name)
+        self.model = model
+
+    async def _call(self, messages: list[dict], system_prompt: str) -> str:
+        return await call_ollama(self._prompt(messages), self.model, system=system_prompt)
+
+    def _stream_call(self, messages: list[dict], system_prompt: str) -> AsyncIterator[str]:
+        return stream_ollama(self._prompt(messages), self.model, system=system_prompt)
+
+    @staticmethod
+    def _prompt(messages: list[dict]) -> str:
+        if len(messages) == 1:
+            return messages[0]["content"]
+        return "\n\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+
+
+class ProviderPool:
+    """Ordered providers tried with circuit breaking, immediate failover and hedging."""
+
+    def __init__(self, providers: list[Provider]):
+        self.providers = providers
+        self.hedges = 0
+        self.failovers = 0
+        self.served_by: Counter = Counter()
+
+    async def complete(self, messages: list[dict], system_prompt: str) -> str:
+        """Reply text from the first provider to answer, from the response cache when possible."""
+        cache_key = openrouter_cache_key(messages, system_prompt)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        return await llm_client.flights.call(cache_key, lambda: self._complete(messages, system_prompt, cache_key))
+
+    async def stream(self, messages: list[dict], system_prompt: str) -> AsyncIterator[str]:
+        """
+        Yield reply tokens from the first provider that starts answering. Streams
+        aren't hedged; a provider that fails before its first token is skipped,
+        one that fails after it ends the stream with its error. A request
+        error (see provider_fault) ends it at once.
+        """
+        cache_key = openrouter_cache_key(messages, system_prompt)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        async for token in llm_client.flights.stream(cache_key, lambda: self._stream(messages, system_prompt, cache_key)):
+            yield token
+
+    async def _stream(self, messages: list[dict], system_prompt: str, cache_key: str) -> AsyncIterator[str]:
+        tried: list[Provider] = []
+        errors: list[str] = []
+        while True:
+            provider = next((p for p in self.providers if p not in tried and p.breaker.allow()), None)
+            if provider is None:
+                raise HTTPException(status_code=502, detail=f"All LLM providers failed. {'; '.join(errors)}")
+            if tried:
+                self.failovers += 1
+            tried.append(provider)
+            parts = []
+            try:
+                async for token in provider.stream(messages, system_prompt):
+                    parts.append(token)
+                    yield token
+            except HTTPException as e:
+                if parts or not provider_fault(e):
+                    raise
+                errors.append(f"{provider.name}: {e.detail}")
+                logger.warning(f"LLM provider {provider.name} failed: {e.detail}")
+                continue
+            await self._served(provider, "".join(parts).strip(), cache_key)
+            return
+
+    async def _complete(self, messages: list[dict], system_prompt: str, cache_key: str) -> str:
+        tried: list[Provider] = []
+        running: dict[asyncio.Task, Provider] = {}
+        errors: list[str] = []
+        overloaded: Optional[LLMOverloaded] = None
+
+        def launch() -> Optional[Provider]:
+            for provider in self.providers:
+                if provider not in tried and provider.breaker.allow():
+                    tried.append(provider)
+                    running[asyncio.create_task(provider.complete(messages, system_prompt))] = provider
+                    return provider
+            return None
+
+        latest = launch()
+        if latest is None:
+            raise HTTPException(status_code=503, detail="All LLM providers are unavailable (circuits open)")
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, timeout=latest.hedge_delay(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge = launch()
+                    if hedge is not None:
+                        self.hedges += 1
+                        logger.info(f"{latest.name} slower than {latest.hedge_delay():.1f}s, hedging with {hedge.name}")
+                        latest = hedge
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    if task.exception() is None:
+                        return await self._served(provider, task.result(), cache_key)
+                    error = task.exception()
+                    if not provider_fault(error):
+                        # Another provider would reject the same request
+                        raise error
+                    if isinstance(error, LLMOverloaded):
+                        overloaded = error
+                    detail = error.detail if isinstance(error, HTTPException) else str(error)
+                    errors.append(f"{provider.name}: {detail}")
+                    logger.warning(f"LLM provider {provider.name} failed: {detail}")
+
+                if not running:
+                    latest = launch()
+                    if latest is None:
+                        break
+                    self.failovers += 1
+        finally:
+            for task in running:
+                task.cancel()
+
+        if overloaded is not None and len(errors) == 1:
+            raise overloaded
+        raise HTTPException(status_code=502, detail=f"All LLM providers failed. {'; '.join(errors)}")
+
+    async def _served(self, provider: Provider, text: str, cache_key: str) -> str:
+        self.served_by[provider.name] += 1
+        if provider.kind != "ollama":
+            await llm_cache.put(cache_key, text)
+        return text
+
+    def stats(self) -> dict:
+        return {
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "served_by": dict(self.served_by),
+            "providers": {provider.name: provider.stats() for provider in self.providers},
+        }
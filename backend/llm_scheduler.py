@@ -0,0 +1,357 @@
+"""
+Priority scheduling and admission control for LLM calls.
+
+Interactive calls (/chat turns, /quiz/validate checks) used to queue behind
+heavy /notes generations for the same backend slots, so chat latency fell apart
+under load. Each backend's slots are now handed out by an LLMScheduler:
+
+- Two priority classes. A free slot always goes to a waiting interactive call
+  first, and batch work may not take the last LLM_INTERACTIVE_RESERVED slots,
+  so an interactive call never waits for a long generation to finish. Slots
+  are only held back once an app registers interactive paths; main.py has
+  none, so its batch work gets every slot.
+- Borrowing: while no interactive call is waiting, a non-streaming batch call
+  may run on a reserved slot. When an interactive call arrives, the borrowed
+  call is preempted (its request cancelled) and queued again, so the slot is
+  free within moments instead of after a whole generation. It goes back to the
+  front of its session's queue with its original deadline, and won't borrow
+  again, so a call is preempted at most once.
+- Fair queuing within a class: waiters are grouped by session (X-Session-Id
+  header, else the client address) and sessions take turns, so one user
+  queueing many generations can't starve the others.
+- Queue-time deadlines: a call that can't start within its class deadline is
+  shed with 503 and Retry-After instead of being answered too late. A call is
+  rejected up front if the queue ahead of it is already expected to take
+  longer than that.
+
+LLMPriorityMiddleware puts the class and session of each HTTP request in a
+context variable, which the LLM calls made while serving it (including
+map-reduce chunks and lecture-pack fan-out) read. Calls made outside a request
+are batch work.
+
+Configuration (environment variables):
+    LLM_INTERACTIVE_RESERVED        slots per backend that batch work can only borrow (default 1)
+    LLM_INTERACTIVE_QUEUE_DEADLINE  seconds an interactive call may wait for a slot (default 15)
+    LLM_BATCH_QUEUE_DEADLINE        seconds a batch call may wait for a slot (default 300)
+"""
+import asyncio
+import logging
+import math
+import os
+import statistics
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+LLM_INTERACTIVE_RESERVED = int(os.getenv("LLM_INTERACTIVE_RESERVED", "1"))
+LLM_INTERACTIVE_QUEUE_DEADLINE = float(os.getenv("LLM_INTERACTIVE_QUEUE_DEADLINE", "15"))
+LLM_BATCH_QUEUE_DEADLINE = float(os.getenv("LLM_BATCH_QUEUE_DEADLINE", "300"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# Highest priority first
+PRIORITIES = (INTERACTIVE, BATCH)
+
+SESSION_HEADER = "x-session-id"
+
+# Set once an app registers interactive paths; until then no slots are held back for them
+_interactive_paths_registered = False
+
+# (priority class, session) of the request being served
+llm_request: ContextVar[tuple[str, str]] = ContextVar("llm_request", default=(BATCH, "background"))
+
+
+class LLMOverloaded(HTTPException):
+    """The call would not get a backend slot within its class deadline."""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+class LLMPriorityMiddleware:
+    """Tags each HTTP request with its priority class (by path) and session."""
+
+    def __init__(self, app, interactive_paths: Iterable[str] = ()):
+        global _interactive_paths_registered
+        self.app = app
+        self.interactive_paths = frozenset(interactive_paths)
+        if self.interactive_paths:
+            _interactive_paths_registered = True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        priority = INTERACTIVE if scope["path"] in self.interactive_paths else BATCH
+        session = dict(scope["headers"]).get(SESSION_HEADER.encode(), b"").decode().strip()
+        if not session:
+            client = scope.get("client")
+            session = client[0] if client else "anonymous"
+        token = llm_request.set((priority, session))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            llm_request.reset(token)
+
+
+class SlotLease:
+    """
+    A granted slot. A borrowed one has a preempted future, resolved when an
+    interactive call needs the slot back.
+    """
+
+    __slots__ = ("priority", "preempted")
+
+    def __init__(self, priority: str, borrowed: bool = False):
+        self.priority = priority
+        self.preempted: Optional[asyncio.Future] = (
+            asyncio.get_running_loop().create_future() if borrowed else None
+        )
+
+
+class _Waiter:
+    __slots__ = ("priority", "session", "preemptible", "granted", "enqueued_at", "deadline")
+
+    def __init__(self, priority: str, session: str, preemptible: bool, deadline: float):
+        self.priority = priority
+        self.session = session
+        self.preemptible = preemptible
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.deadline = deadline
+
+
+class _ClassState:
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.running = 0
+        # session -> its waiters in arrival order; sessions are served round-robin
+        self.queues: OrderedDict[str, deque] = OrderedDict()
+        self.admitted = 0
+        self.shed = 0
+        self.waits: deque = deque(maxlen=200)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def push(self, waiter: _Waiter, front: bool = False):
+        queue = self.queues.setdefault(waiter.session, deque())
+        if front:
+            queue.appendleft(waiter)
+            self.queues.move_to_end(waiter.session, last=False)
+        else:
+            queue.append(waiter)
+
+    def pop(self, eligible: Optional[Callable[[_Waiter], bool]] = None) -> Optional[_Waiter]:
+        """Next waiter (the next eligible one, if given), taking sessions in turn."""
+        for session, queue in self.queues.items():
+            if eligible is None or eligible(queue[0]):
+                break
+        else:
+            return None
+        waiter = queue.popleft()
+        if queue:
+            self.queues.move_to_end(session)
+        else:
+            del self.queues[session]
+        return waiter
+
+    def remove(self, waiter: _Waiter):
+        queue = self.queues.get(waiter.session)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[waiter.session]
+
+    def stats(self, limit: int) -> dict:
+        waits = sorted(self.waits)
+        return {
+            "limit": limit,
+            "running": self.running,
+            "queued": self.queued,
+            "sessions_queued": len(self.queues),
+            "deadline_seconds": self.deadline,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_p50": round(statistics.median(waits), 3) if waits else None,
+            "wait_p95": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else None,
+        }
+
+
+class LLMScheduler:
+    """Hands out one backend's concurrency slots by priority class and session."""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        reserved: int = LLM_INTERACTIVE_RESERVED,
+        interactive_deadline: float = LLM_INTERACTIVE_QUEUE_DEADLINE,
+        batch_deadline: float = LLM_BATCH_QUEUE_DEADLINE,
+    ):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.reserved_limit = max(1, self.max_concurrency - max(0, reserved))
+        self.classes = {
+            INTERACTIVE: _ClassState(interactive_deadline),
+            BATCH: _ClassState(batch_deadline),
+        }
+        self._service_times: deque = deque(maxlen=50)
+        # Batch calls running on reserved slots
+        self._borrowed: list[SlotLease] = []
+        self.borrows = 0
+        self.preemptions = 0
+
+    @property
+    def running(self) -> int:
+        return sum(state.running for state in self.classes.values())
+
+    async def acquire(self, preemptible: bool = False, since: Optional[float] = None) -> SlotLease:
+        """
+        Wait for a slot for the current request's class; pass the lease to
+        release(). A preemptible batch call may be given a borrowed slot.
+        since is when a preempted call first queued: it waits at the front of
+        its session's queue until the deadline counted from then.
+        """
+        priority, session = llm_request.get()
+        state = self.classes[priority]
+
+        if self._can_start(priority) and not self._queued_from(priority):
+            self._start(state, 0.0)
+            return SlotLease(priority)
+        if preemptible and self._can_borrow(priority) and not self._queued_from(priority):
+            return self._borrow(state, 0.0)
+
+        requeued = since is not None
+        if not requeued:
+            estimate = self._estimated_wait(priority)
+            if estimate is not None and estimate > state.deadline:
+                raise self._shed(priority, estimate, f"~{estimate:.0f}s queue ahead")
+            since = time.monotonic()
+        timeout = since + state.deadline - time.monotonic()
+        if timeout <= 0:
+            raise self._shed(priority, state.deadline, f"no slot within {state.deadline:.0f}s")
+
+        waiter = _Waiter(priority, session, preemptible, since + state.deadline)
+        state.push(waiter, front=requeued)
+        if priority == INTERACTIVE:
+            self._preempt()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.granted), timeout)
+        except asyncio.TimeoutError:
+            if not waiter.granted.done():
+                state.remove(waiter)
+                raise self._shed(priority, state.deadline, f"no slot within {state.deadline:.0f}s")
+        except asyncio.CancelledError:
+            if waiter.granted.done():
+                # Granted just as the caller went away; hand the slot on
+                self.release(waiter.granted.result())
+            else:
+                state.remove(waiter)
+            raise
+        return waiter.granted.result()
+
+    def release(self, lease: SlotLease, seconds: Optional[float] = None):
+        self.classes[lease.priority].running -= 1
+        if lease in self._borrowed:
+            self._borrowed.remove(lease)
+        if seconds is not None:
+            self._service_times.append(seconds)
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "borrowed": len(self._borrowed),
+            "borrows": self.borrows,
+            "preemptions": self.preemptions,
+            "avg_service_seconds": round(statistics.mean(self._service_times), 3) if self._service_times else None,
+            "classes": {priority: state.stats(self._limit(priority)) for priority, state in self.classes.items()},
+        }
+
+    def _limit(self, priority: str) -> int:
+        if priority == BATCH and _interactive_paths_registered:
+            return self.reserved_limit
+        return self.max_concurrency
+
+    def _can_start(self, priority: str) -> bool:
+        return self.running < self.max_concurrency and self.classes[priority].running < self._limit(priority)
+
+    def _can_borrow(self, priority: str) -> bool:
+        return priority == BATCH and self.running < self.max_concurrency and not self.classes[INTERACTIVE].queued
+
+    def _borrow(self, state: _ClassState, waited: float) -> SlotLease:
+        self._start(state, waited)
+        lease = SlotLease(BATCH, borrowed=True)
+        self._borrowed.append(lease)
+        self.borrows += 1
+        return lease
+
+    def _preempt(self):
+        """Take back a borrowed slot for each interactive waiter that doesn't have one coming."""
+        returning = sum(1 for lease in self._borrowed if lease.preempted.done())
+        for lease in reversed(self._borrowed):
+            if returning >= self.classes[INTERACTIVE].queued:
+                return
+            if not lease.preempted.done():
+                lease.preempted.set_result(None)
+                self.preemptions += 1
+                returning += 1
+
+    def _queued_from(self, priority: str) -> int:
+        """Waiters of this class or a higher one, all of which go first."""
+        queued = 0
+        for other in PRIORITIES:
+            queued += self.classes[other].queued
+            if other == priority:
+                return queued
+        return queued
+
+    def _estimated_wait(self, priority: str) -> Optional[float]:
+        if not self._service_times:
+            return None
+        ahead = self._queued_from(priority)
+        return ahead * statistics.mean(self._service_times) / self._limit(priority)
+
+    def _start(self, state: _ClassState, waited: float):
+        state.running += 1
+        state.admitted += 1
+        state.waits.append(waited)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        for priority in PRIORITIES:
+            state = self.classes[priority]
+            while self._can_start(priority):
+                waiter = state.pop()
+                if waiter is None:
+                    break
+                if waiter.granted.done() or waiter.deadline <= now:
+                    # Timed out or cancelled; acquire() sheds it
+                    continue
+                self._start(state, now - waiter.enqueued_at)
+                waiter.granted.set_result(SlotLease(priority))
+        # Reserved slots left idle go to preemptible batch waiters
+        batch = self.classes[BATCH]
+        while self._can_borrow(BATCH):
+            waiter = batch.pop(lambda queued: queued.preemptible)
+            if waiter is None:
+                break
+            if waiter.granted.done() or waiter.deadline <= now:
+                continue
+            waiter.granted.set_result(self._borrow(batch, now - waiter.enqueued_at))
+
+    def _shed(self, priority: str, wait: float, reason: str) -> LLMOverloaded:
+        self.classes[priority].shed += 1
+        logger.warning(f"Shedding {priority} {self.name} call: {reason}")
+        return LLMOverloaded(
+            f"LLM {self.name} is overloaded ({reason}); try again shortly",
+            retry_after=max(1, math.ceil(wait)),
+        )
@@ -0,0 +1,70 @@
+"""
+Server-Sent Events relay for LLM endpoints.
+
+Text-generating endpoints answer with one JSON object by default. With
+?stream=true (or an "Accept: text/event-stream" header) they relay tokens as
+the backend produces them instead:
+
+    event: token
+    data: {"text": "..."}
+
+    event: done
+    data: {...the same JSON object the non-streaming endpoint returns...}
+
+    event: error
+    data: {"status": 503, "detail": "..."}
+
+Time to first token is recorded per endpoint and reported by GET /metrics/llm.
+"""
+import json
+import logging
+import time
+from typing import AsyncIterator, Callable
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from llm_client import llm_client
+
+logger = logging.getLogger(__name__)
+
+
+def wants_stream(request: Request, stream: bool) -> bool:
+    return stream or "text/event-stream" in request.headers.get("accept", "")
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_llm_response(
+    endpoint: str,
+    tokens: AsyncIterator[str],
+    build_response: Callable[[str], dict],
+) -> StreamingResponse:
+    """
+    Relay tokens over SSE, then send build_response(full_text) as the done
+    event. If the client disconnects, Starlette cancels the stream, which
+    closes the upstream request and frees its backend slot.
+    """
+    async def events():
+        started = time.monotonic()
+        parts = []
+        try:
+            async for token in tokens:
+                if not parts:
+                    ttft = time.monotonic() - started
+                    llm_client.record_first_token(endpoint, ttft)
+                    logger.info(f"{endpoint}: first token after {ttft:.2f}s")
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+            yield sse_event("done", build_response("".join(parts)))
+        except HTTPException as e:
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,220 @@
+"""
+Parallel transcription for long lectures.
+
+A single model.transcribe() pass over a 90-minute lecture keeps one core busy
+for a long time. Here the decoded PCM is split at silences found by VAD into
+chunks of roughly LONG_AUDIO_CHUNK_S seconds, the chunks are transcribed in
+parallel on a pool of WhisperModel replicas leased from the model registry
+(sized to the CPU count and capped by the memory budget), and the results are
+stitched back onto the global timeline with boundary duplicates removed.
+
+Configuration (environment variables):
+    LONG_AUDIO_MIN_SECONDS       audio at least this long uses the parallel path in
+                                 "auto" mode (default 600, 0 disables auto)
+    LONG_AUDIO_CHUNK_S           target chunk length (default 120)
+    LONG_AUDIO_MAX_CHUNK_S       hard cut if no pause is found (default 180)
+    LONG_AUDIO_THREADS_PER_MODEL CPU threads per model instance (default 2)
+    LONG_AUDIO_POOL_SIZE         model replicas (default cpu_count // threads)
+"""
+import logging
+import os
+import queue
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Optional
+
+import numpy as np
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from audio_ingest import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+LONG_AUDIO_MIN_SECONDS = float(os.getenv("LONG_AUDIO_MIN_SECONDS", "600"))
+LONG_AUDIO_CHUNK_S = float(os.getenv("LONG_AUDIO_CHUNK_S", "120"))
+LONG_AUDIO_MAX_CHUNK_S = float(os.getenv("LONG_AUDIO_MAX_CHUNK_S", "180"))
+LONG_AUDIO_THREADS_PER_MODEL = int(os.getenv("LONG_AUDIO_THREADS_PER_MODEL", "2"))
+LONG_AUDIO_POOL_SIZE = int(os.getenv(
+    "LONG_AUDIO_POOL_SIZE",
+    str(max(1, (os.cpu_count() or 1) // LONG_AUDIO_THREADS_PER_MODEL))
+))
+
+# Overlap added around hard cuts so words straddling the cut aren't lost
+_HARD_CUT_OVERLAP_S = 1.0
+
+
+def use_parallel(mode: str, duration: float) -> bool:
+    """Whether a transcription of this length should take the parallel path."""
+    if mode == "parallel":
+        return True
+    if mode == "single":
+        return False
+    return LONG_AUDIO_MIN_SECONDS > 0 and duration >= LONG_AUDIO_MIN_SECONDS
+
+
+def split_at_silence(
+    audio: np.ndarray,
+    chunk_s: float = LONG_AUDIO_CHUNK_S,
+    max_chunk_s: float = LONG_AUDIO_MAX_CHUNK_S,
+) -> list[tuple[int, int]]:
+    """
+    Split audio into [start, end) sample ranges, cutting in the middle of the
+    silence gap closest to every chunk_s seconds. Falls back to a hard cut
+    with a small overlap when nobody pauses for max_chunk_s.
+    """
+    total = len(audio)
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=500, speech_pad_ms=100))
+
+    # Candidate cut points: midpoints of the gaps between speech regions
+    gaps = [(a["end"] + b["start"]) // 2 for a, b in zip(speech, speech[1:])]
+
+    target = int(chunk_s * SAMPLE_RATE)
+    limit = int(max_chunk_s * SAMPLE_RATE)
+    overlap = int(_HARD_CUT_OVERLAP_S * SAMPLE_RATE)
+
+    chunks = []
+    start = 0
+    while total - start > limit:
+        candidates = [g for g in gaps if start < g <= start + limit]
+        if candidates:
+            cut = min(candidates, key=lambda g: abs(g - (start + target)))
+            chunks.append((start, cut))
+            start = cut
+        else:
+            cut = start + target
+            chunks.append((start, cut + overlap))
+            start = cut - overlap
+    chunks.append((start, total))
+    return chunks
+
+
+class WhisperModelPool:
+    """A fixed set of WhisperModel instances handed out one chunk at a time."""
+
+    def __init__(self, models: list):
+        self.size = len(models)
+        self._free: queue.Queue = queue.Queue()
+        for m in models:
+            self._free.put(m)
+
+    @contextmanager
+    def acquire(self):
+        model = self._free.get()
+        try:
+            yield model
+        finally:
+            self._free.put(model)
+
+
+@contextmanager
+def lease_model_pool(registry, model_size: str, compute_type: str):
+    """Lease replicas of one model from the registry for a long transcription."""
+    size = max(1, min(LONG_AUDIO_POOL_SIZE, registry.max_replicas(model_size, compute_type)))
+    with ExitStack() as stack:
+        models = [
+            stack.enter_context(registry.acquire(model_size, compute_type, replica=i))
+            for i in range(size)
+        ]
+        yield WhisperModelPool(models)
+
+
+def _transcribe_chunk(
+    pool: WhisperModelPool,
+    audio: np.ndarray,
+    start: int,
+    end: int,
+    word_timestamps: bool = False,
+) -> dict:
+    offset = start / SAMPLE_RATE
+    chunk_end = end / SAMPLE_RATE
+    with pool.acquire() as model:
+        segments, info = model.transcribe(audio[start:end], vad_filter=True, word_timestamps=word_timestamps)
+        seg_list = []
+        for s in segments:
+            text = s.text.strip()
+            if text:
+                seg = {
+                    "start": offset + float(s.start),
+                    "end": min(chunk_end, offset + float(s.end)),
+                    "text": text
+                }
+                if s.words:
+                    # Chunk-relative words; placed on the timeline when the transcript is assembled
+                    seg["_words"] = (offset, s.words)
+                seg_list.append(seg)
+    return {
+        "segments": seg_list,
+        "language": info.language,
+        "language_probability": float(info.language_probability),
+        "seconds": chunk_end - offset,
+    }
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^\w\s]", "", text.lower()).strip()
+
+
+def stitch_segments(chunk_segments: list[list[dict]]) -> list[dict]:
+    """
+    Merge per-chunk segments (already on the global timeline) in order,
+    dropping segments repeated across a chunk boundary.
+    """
+    merged: list[dict] = []
+    for segments in chunk_segments:
+        for seg in segments:
+            if merged:
+                prev = merged[-1]
+                # Entirely inside time already covered (hard-cut overlap)
+                if seg["end"] <= prev["end"]:
+                    continue
+                # Same words re-emitted right after the boundary
+                if _normalize(seg["text"]) == _normalize(prev["text"]) and seg["start"] - prev["end"] < 1.0:
+                    continue
+                if seg["start"] < prev["end"]:
+                    seg = {**seg, "start": prev["end"]}
+            merged.append(seg)
+    return merged
+
+
+def transcribe_long_audio(
+    audio: np.ndarray,
+    pool: WhisperModelPool,
+    on_progress: Optional[Callable[[float, float], None]] = None,
+    word_timestamps: bool = False,
+) -> tuple[list[dict], str, float]:
+    """
+    Transcribe long audio in parallel chunks.
+    Returns (segments, language, language_probability).
+    """
+    duration = len(audio) / SAMPLE_RATE
+    chunks = split_at_silence(audio)
+    logger.info(f"Long-audio mode: {duration:.0f}s in {len(chunks)} chunks on {pool.size} models")
+
+    if on_progress:
+        on_progress(0.0, duration)
+
+    results: list[Optional[dict]] = [None] * len(chunks)
+    processed = 0.0
+    with ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="long-audio") as chunk_pool:
+        futures = {
+            chunk_pool.submit(_transcribe_chunk, pool, audio, start, end, word_timestamps): i
+            for i, (start, end) in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            processed += result["seconds"]
+            if on_progress:
+                on_progress(min(processed, duration), duration)
+
+    # Language by the amount of audio each chunk detected it in
+    votes: Counter = Counter()
+    for r in results:
+        votes[r["language"]] += r["seconds"]
+    language = votes.most_common(1)[0][0]
+    probability = max(r["language_probability"] for r in results if r["language"] == language)
+
+    segments = stitch_segments([r["segments"] for r in results])
+    return segments, language, probability
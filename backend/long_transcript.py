@@ -0,0 +1,175 @@
+"""
+Map-reduce condensing for transcripts longer than the LLM context.
+
+A 90-minute lecture is ~15k words, far more than llama3.1 sees with Ollama's
+default context, so a single prompt is silently truncated or crawls. Long
+transcripts are instead split on the paragraphs paragraphize_text produces
+into chunks of about LLM_CHUNK_TOKENS, each chunk is condensed into detailed
+notes concurrently (map), and the notes, condensed again if they are still too
+long, replace the transcript in the endpoint's own prompt (reduce).
+
+The chunk notes are generic, so /summarize, /key-points, /study-guide and
+/quiz can all build on the same condensed text.
+
+Configuration (environment variables):
+    LLM_SINGLE_PROMPT_TOKENS  transcripts up to this size go into one prompt (default 3000)
+    LLM_CHUNK_TOKENS          target size of a map chunk (default 1500)
+    LLM_MAP_CONCURRENCY       chunks condensed at once (default OLLAMA_MAX_CONCURRENCY)
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from llm_client import OLLAMA_MAX_CONCURRENCY, call_ollama
+from segmentation import paragraphize_text
+
+logger = logging.getLogger(__name__)
+
+LLM_SINGLE_PROMPT_TOKENS = int(os.getenv("LLM_SINGLE_PROMPT_TOKENS", "3000"))
+LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "1500"))
+LLM_MAP_CONCURRENCY = int(os.getenv("LLM_MAP_CONCURRENCY", str(OLLAMA_MAX_CONCURRENCY)))
+
+# Give up condensing further after this many rounds and use what we have
+_MAX_LEVELS = 3
+
+CHUNK_SYSTEM_PROMPT = """You are condensing one part of a long lecture transcription into study notes.
+Keep every concept, definition, formula, example, name, date and number that appears.
+Drop filler and repetition. Do not add information that is not in the text."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def chunk_paragraphs(paragraphs: list[str], max_tokens: int = LLM_CHUNK_TOKENS) -> list[str]:
+    """Group consecutive paragraphs into chunks of at most ~max_tokens; oversized paragraphs are split on words."""
+    chunks = []
+    buffer: list[str] = []
+    size = 0
+    for paragraph in paragraphs:
+        for piece in _split_oversized(paragraph, max_tokens):
+            piece_size = estimate_tokens(piece)
+            if buffer and size + piece_size > max_tokens:
+                chunks.append("\n\n".join(buffer))
+                buffer, size = [], 0
+            buffer.append(piece)
+            size += piece_size
+    if buffer:
+        chunks.append("\n\n".join(buffer))
+    return chunks
+
+
+def _split_oversized(paragraph: str, max_tokens: int) -> list[str]:
+    if estimate_tokens(paragraph) <= max_tokens:
+        return [paragraph]
+    words = paragraph.split()
+    per_piece = max(1, max_tokens * 4 // 6)  # ~6 characters per word including the space
+    return [" ".join(words[i:i + per_piece]) for i in range(0, len(words), per_piece)]
+
+
+class CondensedTranscript:
+    """The text an endpoint should prompt with, plus how it was produced."""
+
+    def __init__(self, text: str, chunks: int = 1, levels: int = 0,
+                 wall_seconds: float = 0.0, sequential_seconds: float = 0.0):
+        self.text = text
+        self.chunks = chunks
+        self.levels = levels
+        self.wall_seconds = wall_seconds
+        self.sequential_seconds = sequential_seconds
+
+    @property
+    def condensed(self) -> bool:
+        return self.levels > 0
+
+    def annotate(self, response: dict) -> dict:
+        """Add the map-reduce report to an endpoint response when condensing was used."""
+        if self.condensed:
+            response["map_reduce"] = self.report()
+        return response
+
+    def report(self) -> dict:
+        """
+        Chunk count and timings. sequential_seconds is the sum of the map
+        calls, i.e. what processing the chunks one after another would take;
+        saved_seconds is that minus the actual wall-clock time.
+        """
+        return {
+            "chunks": self.chunks,
+            "levels": self.levels,
+            "wall_seconds": round(self.wall_seconds, 2),
+            "sequential_seconds": round(self.sequential_seconds, 2),
+            "saved_seconds": round(max(0.0, self.sequential_seconds - self.wall_seconds), 2),
+        }
+
+
+async def _condense_chunks(chunks: list[str], model: str, slots: asyncio.Semaphore) -> tuple[list[str], float]:
+    """Map step: condense every chunk, as many at a time as slots allows. Returns (notes, summed call time)."""
+    busy = 0.0
+
+    async def condense(index: int, chunk: str) -> str:
+        nonlocal busy
+        async with slots:
+            started = time.monotonic()
+            notes = await call_ollama(
+                f"Part {index + 1} of {len(chunks)} of the lecture:\n\n{chunk}\n\nWrite the condensed notes for this part.",
+                model,
+                system=CHUNK_SYSTEM_PROMPT,
+            )
+            busy += time.monotonic() - started
+            return notes
+
+    notes = await asyncio.gather(*(condense(i, c) for i, c in enumerate(chunks)))
+    return list(notes), busy
+
+
+async def condense_transcript(
+    text: str,
+    model: str,
+    paragraphs: Optional[list[str]] = None,
+    slots: Optional[asyncio.Semaphore] = None,
+) -> CondensedTranscript:
+    """
+    Return the transcript unchanged if it fits in one prompt, otherwise the
+    map-reduced notes. paragraphs defaults to paragraphize_text(text). slots
+    bounds the map calls; pass a caller's semaphore to share its budget,
+    otherwise LLM_MAP_CONCURRENCY applies.
+    """
+    if estimate_tokens(text) <= LLM_SINGLE_PROMPT_TOKENS:
+        return CondensedTranscript(text)
+
+    started = time.monotonic()
+    slots = slots or asyncio.Semaphore(max(1, LLM_MAP_CONCURRENCY))
+    units = paragraphs or paragraphize_text(text)
+    first_chunks = 0
+    sequential = 0.0
+    levels = 0
+    current = text
+
+    while estimate_tokens(current) > LLM_SINGLE_PROMPT_TOKENS and levels < _MAX_LEVELS:
+        chunks = chunk_paragraphs(units)
+        if levels > 0 and len(chunks) == 1:
+            # Notes fit in one chunk but not one prompt; nothing left to merge
+            break
+        notes, busy = await _condense_chunks(chunks, model, slots)
+        levels += 1
+        first_chunks = first_chunks or len(chunks)
+        sequential += busy
+        units = notes
+        current = "\n\n".join(notes)
+
+    condensed = CondensedTranscript(
+        current,
+        chunks=first_chunks,
+        levels=levels,
+        wall_seconds=time.monotonic() - started,
+        sequential_seconds=sequential,
+    )
+    logger.info(
+        f"Condensed {estimate_tokens(text)} tokens to {estimate_tokens(current)} "
+        f"via {first_chunks} chunks in {levels} level(s): {condensed.report()}"
+    )
+    return condensed
@@ -1,19 +1,61 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from faster_whisper import WhisperModel
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-import tempfile
+import asyncio
+import hashlib
 import os
 import io
-import re
 import logging
-import subprocess
+import time
 
-import requests
 import json
 from typing import Optional
 
+from audio_ingest import AudioDecodeError
+from incremental_enhance import enhance_transcript, stream_enhance_response
+from jobs import JobStore, job_status, run_transcription_job
+from lecture_index import check_lecture_id
+from lecture_pack import build_lecture_pack
+from lecture_prompts import (
+    format_quiz,
+    key_points_prompt,
+    parse_key_points,
+    quiz_prompt,
+    study_guide_prompt,
+    summary_prompt,
+)
+from live_transcription import LiveTranscriptionSession
+from llm_cache import LLMCacheBypassMiddleware, llm_cache
+from llm_client import (
+    call_ollama,
+    cancel_on_disconnect,
+    llm_client,
+    stream_ollama,
+)
+from llm_scheduler import LLMPriorityMiddleware
+from llm_streaming import stream_llm_response, wants_stream
+from long_audio import LONG_AUDIO_THREADS_PER_MODEL
+from long_transcript import condense_transcript
+from model_registry import (
+    WHISPER_WARM_MODELS,
+    ModelRegistry,
+    parse_model_list,
+    validate_model_choice,
+)
+from ollama_monitor import ollama_monitor
+from quiz_engine import generate_sharded_quiz, ollama_complete
+from transcript_cache import get_transcript_cache
+from transcript_format import TRANSCRIPT_FORMATS, encode_transcript
+from transcript_search import SEARCH_INDEX_TRANSCRIPTS, TranscriptSearchIndex
+from transcription import transcribe_upload
+from transcription_executor import (
+    EXECUTOR_KIND,
+    EXECUTOR_WORKERS,
+    QueueFullError,
+    TranscriptionExecutor,
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,20 +76,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load Whisper model on startup
-logger.info("Loading Whisper model...")
-model = WhisperModel("small", compute_type="int8")  # free, local
-logger.info("Whisper model loaded successfully")
+# Honour "X-LLM-Cache: bypass" on any request that reaches an LLM
+app.add_middleware(LLMCacheBypassMiddleware)
+# Share LLM slots fairly between sessions; every endpoint here is batch work
+app.add_middleware(LLMPriorityMiddleware)
+
+# Whisper models load lazily on first use, or warm in the background after
+# startup, so the API serves /health right away
+if EXECUTOR_KIND == "thread":
+    # num_workers lets concurrent transcribe() calls from pool threads run in parallel
+    model_registry = ModelRegistry(num_workers=EXECUTOR_WORKERS, replica_threads=LONG_AUDIO_THREADS_PER_MODEL)
+else:
+    model_registry = None  # each worker process has its own registry
+
+# Decoding and inference run here, never on the event loop
+transcription_executor = TranscriptionExecutor(
+    model_registry,
+    warm_models=parse_model_list(WHISPER_WARM_MODELS),
+    registry_options={"replica_threads": LONG_AUDIO_THREADS_PER_MODEL},
+)
+_warmup_task: Optional[asyncio.Task] = None
+
+TRANSCRIBE_MODES = ("auto", "single", "parallel")
+DEFAULT_WHISPER_MODEL, DEFAULT_WHISPER_COMPUTE_TYPE = validate_model_choice(None, None)
+
+# Persistent store for asynchronous transcription jobs
+job_store = JobStore()
+_job_tasks: set[asyncio.Task] = set()
+
+# Every finished transcript is added to the cross-lecture search index
+search_index = TranscriptSearchIndex()
 
 # Ollama configuration
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/chat")
-OLLAMA_GENERATE_URL = "http://localhost:11434/api/generate"
-OLLAMA_TAGS_URL = "http://localhost:11434/api/tags"
 DEFAULT_LLM_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
 
 # Pydantic models for AI requests
 class EnhanceRequest(BaseModel):
     text: str
+    # Chunk on these (e.g. /transcribe paragraphs) instead of the text's own paragraphs or sentences
+    paragraphs: list[str] = []
+    # Chunk ids from an earlier response whose enhanced text the client still has
+    known_chunks: list[str] = []
     
 class SummarizeRequest(BaseModel):
     text: str
@@ -57,71 +127,17 @@ class StudyGuideRequest(BaseModel):
     text: str
     title: str
 
-
-def webm_to_wav_bytes(raw: bytes) -> bytes:
-    """
-    Convert WebM audio to WAV format using ffmpeg directly.
-    Requires ffmpeg to be installed on the system.
-    """
-    # Create temp files for input and output
-    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_in:
-        temp_in.write(raw)
-        temp_in_path = temp_in.name
-    
-    temp_out_path = temp_in_path.replace(".webm", ".wav")
-    
-    try:
-        # Use ffmpeg to convert
-        subprocess.run([
-            "ffmpeg", "-i", temp_in_path,
-            "-acodec", "pcm_s16le",
-            "-ar", "16000",
-            "-ac", "1",
-            temp_out_path,
-            "-y",  # Overwrite output
-            "-loglevel", "error"
-        ], check=True, capture_output=True)
-        
-        # Read the converted file
-        with open(temp_out_path, "rb") as f:
-            wav_data = f.read()
-        
-        return wav_data
-    finally:
-        # Cleanup temp files
-        if os.path.exists(temp_in_path):
-            os.remove(temp_in_path)
-        if os.path.exists(temp_out_path):
-            os.remove(temp_out_path)
-
-
-def paragraphize_text(text: str, sentences_per_paragraph: int = 4) -> list[str]:
-    """
-    Split transcribed text into paragraphs.
-    Groups sentences together for better readability.
-    """
-    # Fix common spacing/punctuation issues
-    text = re.sub(r"\s+([.,!?;:])", r"\1", text)
-    
-    # Split into sentences
-    sentences = re.split(r"(?<=[.!?])\s+", text)
-    
-    paragraphs = []
-    buffer = []
-    
-    for sentence in sentences:
-        if sentence.strip():
-            buffer.append(sentence.strip())
-        
-        if len(buffer) >= sentences_per_paragraph:
-            paragraphs.append(" ".join(buffer))
-            buffer = []
-    
-    # Add remaining sentences as final paragraph
-    if buffer:
-        paragraphs.append(" ".join(buffer))
+class QuizRequest(BaseModel):
+    text: str
+    title: str
+    count: int = 10
+    # Generate in concurrent shards per lecture section; False asks for the whole quiz in one call
+    sharded: bool = True
     
-    return paragraphs
+class LecturePackRequest(BaseModel):
+    text: str
+    title: str
+    paragraphs: list[str] = []
 
 
 @app.get("/")
@@ -130,105 +146,141 @@ async def root():
     return {"status": "healthy", "service": "ClassNote AI Transcription API"}
 
 
+def whisper_status() -> dict:
+    """Default model and, in thread mode, what the registry has loaded."""
+    if model_registry is None:
+        return {
+            "model": DEFAULT_WHISPER_MODEL,
+            "compute_type": DEFAULT_WHISPER_COMPUTE_TYPE,
+            "status": "per_worker"
+        }
+    registry = model_registry.stats()
+    return {
+        "model": DEFAULT_WHISPER_MODEL,
+        "compute_type": DEFAULT_WHISPER_COMPUTE_TYPE,
+        "status": model_registry.state(),
+        "loaded": registry["models"]
+    }
+
+
 @app.get("/health")
 async def health_check():
     """Detailed health check with model status."""
-    ollama_status = "unavailable"
-    ollama_models = []
-    
-    try:
-        # Check Ollama availability via API
-        response = requests.get(OLLAMA_TAGS_URL, timeout=2)
-        if response.status_code == 200:
-            models_data = response.json()
-            ollama_models = [m['name'] for m in models_data.get('models', [])]
-            ollama_status = "available" if ollama_models else "no_models"
-        else:
-            ollama_status = "error"
-    except Exception as e:
-        logger.warning(f"Ollama check failed: {e}")
-        ollama_status = "unavailable"
-    
     return {
         "status": "healthy",
-        "whisper": {
-            "model": "small",
-            "compute_type": "int8",
-            "status": "requires_python_3.11"
-        },
+        "whisper": whisper_status(),
+        "executor": transcription_executor.stats(),
         "ollama": {
-            "status": ollama_status,
-            "models": ollama_models,
+            **ollama_monitor.snapshot(),
             "url": OLLAMA_URL
         }
     }
 
 
+def transcribe_options(mode: str, model: Optional[str], compute_type: Optional[str], words: bool) -> dict:
+    """Validate per-request transcription options into transcribe_upload kwargs."""
+    if mode not in TRANSCRIBE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(TRANSCRIBE_MODES)}")
+    try:
+        model_size, compute_type = validate_model_choice(model, compute_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"mode": mode, "model_size": model_size, "compute_type": compute_type, "word_timestamps": words}
+
+
+def check_response_format(response_format: str):
+    if response_format not in TRANSCRIPT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"response_format must be one of {', '.join(TRANSCRIPT_FORMATS)}"
+        )
+
+
+def transcript_response(result: dict, response_format: str) -> Response:
+    """Encode a transcript in the requested format."""
+    if response_format == "json":
+        return JSONResponse(result)
+    body, media_type = encode_transcript(result, response_format)
+    return Response(content=body, media_type=media_type)
+
+
+def transcript_lecture_id(result: dict) -> str:
+    """Default lecture id: a hash of the transcript text, so re-uploads replace rather than duplicate."""
+    return hashlib.blake2b(result["text"].encode("utf-8"), digest_size=8).hexdigest()
+
+
+async def index_transcript(lecture_id: str, title: str, result: dict):
+    """Add a finished transcript to the search index; failures are logged, never raised."""
+    if not SEARCH_INDEX_TRANSCRIPTS:
+        return
+    try:
+        await asyncio.to_thread(
+            search_index.add_lecture, lecture_id, title, result["segments"], result["metadata"].get("duration")
+        )
+    except Exception as e:
+        logger.warning(f"Could not add lecture {lecture_id} to the search index: {e}")
+
+
 @app.post("/transcribe")
-async def transcribe(file: UploadFile = File(...)):
+async def transcribe(
+    file: UploadFile = File(...),
+    mode: str = "auto",
+    model: Optional[str] = None,
+    compute_type: Optional[str] = None,
+    words: bool = False,
+    response_format: str = "json",
+    lecture_id: Optional[str] = None,
+    title: Optional[str] = None
+):
     """
     Transcribe audio file to text with timestamps and paragraphs.
     
     Supports: WAV, WebM, MP3, and other audio formats.
     Returns: Full text, paragraphs, and timestamped segments.
+    mode: "single", "parallel" (chunked across cores) or "auto" (parallel for long lectures).
+    model/compute_type: pick a Whisper model per request, e.g. model=tiny for quick previews.
+    words: add word-level timestamps as parallel arrays under "words".
+    response_format: "json", "columnar" (segments as parallel arrays) or "msgpack".
+    lecture_id/title: how the transcript is filed in GET /search (default: a hash of the text, the filename).
     """
+    options = transcribe_options(mode, model, compute_type, words)
+    check_response_format(response_format)
+    if lecture_id is not None:
+        check_lecture_id(lecture_id)
+    
     try:
         logger.info(f"Processing file: {file.filename}")
         
         # Read uploaded file
         raw = await file.read()
         
-        # Convert to WAV if needed
-        if file.filename and file.filename.endswith(".webm"):
-            logger.info("Converting WebM to WAV")
-            raw = webm_to_wav_bytes(raw)
+        result = await transcription_executor.submit(transcribe_upload, raw, **options)
         
-        # Create temporary file for processing
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            tmp.write(raw)
-            tmp_path = tmp.name
+        lecture_id = lecture_id or transcript_lecture_id(result)
+        await index_transcript(lecture_id, title or file.filename or lecture_id, result)
         
-        # Transcribe with Faster-Whisper
-        logger.info("Starting transcription...")
-        segments, info = model.transcribe(
-            tmp_path, 
-            vad_filter=True,  # Voice Activity Detection for better segmentation
-            word_timestamps=False
+        return transcript_response({**result, "lecture_id": lecture_id}, response_format)
+    
+    except QueueFullError as e:
+        logger.warning(f"Rejecting {file.filename}: {e}")
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+            content={
+                "error": "Transcription queue full",
+                "detail": str(e)
+            }
         )
-        
-        # Clean up temp file
-        os.remove(tmp_path)
-        
-        # Process segments
-        seg_list = []
-        full_text_parts = []
-        
-        for s in segments:
-            seg_list.append({
-                "start": float(s.start),
-                "end": float(s.end),
-                "text": s.text.strip()
-            })
-            full_text_parts.append(s.text.strip())
-        
-        # Join and format text
-        full_text = " ".join(full_text_parts)
-        
-        # Create paragraphs
-        paragraphs = paragraphize_text(full_text)
-        
-        logger.info(f"Transcription complete: {len(seg_list)} segments, {len(paragraphs)} paragraphs")
-        
-        return JSONResponse({
-            "text": full_text.strip(),
-            "paragraphs": paragraphs,
-            "segments": seg_list,
-            "metadata": {
-                "language": info.language,
-                "language_probability": float(info.language_probability),
-                "duration": float(info.duration)
+    
+    except AudioDecodeError as e:
+        logger.warning(f"Audio decode failed for {file.filename}: {e}")
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": "Unsupported audio",
+                "detail": str(e)
             }
-        })
+        )
     
     except Exception as e:
         logger.error(f"Transcription error: {str(e)}", exc_info=True)
@@ -241,240 +293,452 @@ async def transcribe(file: UploadFile = File(...)):
         )
 
 
-def check_ollama_model(model_name: str = DEFAULT_LLM_MODEL) -> bool:
-    """Check if specified Ollama model is available via API."""
-    try:
-        response = requests.get(OLLAMA_TAGS_URL, timeout=2)
-        if response.status_code == 200:
-            models_data = response.json()
-            available_models = [m['name'] for m in models_data.get('models', [])]
-            # Check for exact match or partial match (e.g., llama3.1 matches llama3.1:latest)
-            return any(model_name in model or model in model_name for model in available_models)
-        return False
-    except Exception as e:
-        logger.error(f"Ollama model check failed: {e}")
-        return False
+async def run_job(job_id: str):
+    """Run a stored job on the executor, waiting for queue space if needed."""
+    while True:
+        try:
+            result = await transcription_executor.submit(
+                run_transcription_job, job_id, job_store.db_path, job_store.audio_dir
+            )
+            logger.info(f"Job {job_id} completed")
+            job = await asyncio.to_thread(job_store.get, job_id)
+            await index_transcript(job["lecture_id"] or job_id, job["title"] or job["filename"] or job_id, result)
+            return
+        except QueueFullError as e:
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            await asyncio.to_thread(job_store.fail, job_id, str(e))
+            return
+
+
+def schedule_job(job_id: str):
+    task = asyncio.create_task(run_job(job_id))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+
+
+@app.post("/jobs/transcribe", status_code=202)
+async def create_transcription_job(
+    file: UploadFile = File(...),
+    mode: str = "auto",
+    model: Optional[str] = None,
+    compute_type: Optional[str] = None,
+    words: bool = False,
+    lecture_id: Optional[str] = None,
+    title: Optional[str] = None
+):
+    """
+    Queue an upload for transcription and return a job id right away.
+    Poll GET /jobs/{id} for progress and fetch GET /jobs/{id}/result when done.
+    Accepts the same mode/model/compute_type/words options as POST /transcribe;
+    the transcript is searchable under lecture_id (default: the job id).
+    """
+    options = transcribe_options(mode, model, compute_type, words)
+    if lecture_id is not None:
+        check_lecture_id(lecture_id)
+    raw = await file.read()
+    # Writing the upload to disk and the SQLite insert stay off the event loop
+    job_id = await asyncio.to_thread(
+        job_store.create, raw, file.filename, options, lecture_id=lecture_id, title=title
+    )
+    schedule_job(job_id)
+    logger.info(f"Queued job {job_id} for {file.filename}")
+    return JSONResponse(
+        status_code=202,
+        content=job_status(await asyncio.to_thread(job_store.get, job_id))
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_transcription_job(job_id: str):
+    """Job status with progress as processed audio seconds out of the duration."""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_transcription_job_result(job_id: str, response_format: str = "json"):
+    """The finished transcript, in the same shape and formats as POST /transcribe."""
+    check_response_format(response_format)
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Transcription failed: {job['error']}")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return transcript_response({**json.loads(job["result"]), "lecture_id": job["lecture_id"] or job_id}, response_format)
+
+
+@app.get("/search")
+async def search_transcripts(q: str, k: int = 10, lecture_id: Optional[str] = None):
+    """
+    Search every indexed lecture (or just lecture_id) for q. Returns the best
+    segments with lecture id, timestamps and a snippet with matches in <mark>.
+    """
+    return await asyncio.to_thread(search_index.search, q, k, lecture_id)
+
+
+@app.get("/search/lectures")
+async def list_searchable_lectures():
+    """Lectures in the search index, most recently indexed first."""
+    return {"lectures": await asyncio.to_thread(search_index.lectures)}
+
+
+@app.delete("/search/lectures/{lecture_id}")
+async def delete_searchable_lecture(lecture_id: str):
+    if not await asyncio.to_thread(search_index.delete_lecture, lecture_id):
+        raise HTTPException(status_code=404, detail="Lecture not in the search index")
+    return {"deleted": lecture_id}
+
+
+@app.get("/metrics/search")
+async def search_metrics():
+    """Indexed lectures, segments and terms, index size and average query latency."""
+    return await asyncio.to_thread(search_index.stats)
 
 
-def call_ollama(prompt: str, model: str = DEFAULT_LLM_MODEL, system: Optional[str] = None) -> str:
-    """Call Ollama API directly and return the response."""
+@app.on_event("startup")
+async def warm_whisper_models():
+    """Load the configured models in the background so startup isn't blocked."""
+    global _warmup_task
+    if model_registry is not None:
+        _warmup_task = asyncio.create_task(
+            asyncio.to_thread(model_registry.warm, parse_model_list(WHISPER_WARM_MODELS))
+        )
+
+
+@app.get("/metrics/models")
+async def model_metrics():
+    """Loaded Whisper models, their estimated memory and the budget."""
+    if model_registry is None:
+        return {"kind": "process", "detail": "Each worker process keeps its own registry"}
+    return model_registry.stats()
+
+
+@app.on_event("startup")
+async def resume_jobs():
+    """Pick up jobs interrupted by a restart."""
+    for job_id in await asyncio.to_thread(job_store.requeue_interrupted):
+        logger.info(f"Resuming job {job_id}")
+        schedule_job(job_id)
+
+
+@app.websocket("/ws/transcribe")
+async def live_transcribe(websocket: WebSocket):
+    """
+    Live transcription while recording.
+    Stream audio chunks in; VAD-delimited windows are transcribed as they
+    finish and partial/final segments are pushed back with timestamps.
+    Connect with ?format=pcm_s16le to send raw 16 kHz mono PCM instead of
+    container chunks.
+    """
+    await websocket.accept()
     try:
-        # Build the prompt with system message if provided
-        full_prompt = prompt
-        if system:
-            full_prompt = f"System: {system}\n\nUser: {prompt}"
-        
-        # Use the generate endpoint for simpler streaming
-        payload = {
-            "model": model,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.7
-            }
-        }
-        
-        response = requests.post(
-            OLLAMA_GENERATE_URL,
-            json=payload,
-            timeout=120  # 2 minutes timeout for longer responses
+        model_size, compute_type = validate_model_choice(
+            websocket.query_params.get("model"),
+            websocket.query_params.get("compute_type")
         )
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Ollama API error: {response.text}"
-            )
-        
-        result = response.json()
-        return result.get('response', '').strip()
-        
-    except requests.exceptions.Timeout:
-        logger.error("Ollama request timed out")
-        raise HTTPException(status_code=504, detail="LLM processing timed out")
-    except requests.exceptions.ConnectionError:
-        logger.error("Could not connect to Ollama")
-        raise HTTPException(status_code=503, detail="Ollama service unavailable")
-    except Exception as e:
-        logger.error(f"Ollama error: {e}")
-        raise HTTPException(status_code=500, detail=f"LLM processing failed: {str(e)}")
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1008)
+        return
+    session = LiveTranscriptionSession(
+        websocket,
+        transcription_executor,
+        input_format=websocket.query_params.get("format", "container"),
+        model_size=model_size,
+        compute_type=compute_type
+    )
+    await session.run()
+
+
+@app.get("/metrics/executor")
+async def executor_metrics():
+    """Transcription queue depth and worker utilisation."""
+    return transcription_executor.stats()
+
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """Transcript cache size, hit/miss counters and hit ratio."""
+    cache = get_transcript_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.delete("/admin/cache/transcripts")
+async def purge_transcript_cache():
+    """Drop every cached transcript."""
+    cache = get_transcript_cache()
+    removed = await asyncio.to_thread(cache.purge) if cache else 0
+    return {"removed": removed}
+
+
+@app.delete("/admin/cache/transcripts/{cache_key}")
+async def purge_transcript_cache_entry(cache_key: str):
+    """Drop one cached transcript by the metadata.cache_key it was returned with."""
+    cache = get_transcript_cache()
+    removed = await asyncio.to_thread(cache.purge, cache_key) if cache else 0
+    if not removed:
+        raise HTTPException(status_code=404, detail="Cache entry not found")
+    return {"removed": removed}
+
+
+@app.get("/metrics/llm")
+async def llm_metrics():
+    """In-flight and queued LLM calls per backend, and response cache hit ratio."""
+    return {**llm_client.stats(), "cache": await asyncio.to_thread(llm_cache.stats)}
+
+
+@app.get("/admin/llm/scheduler")
+async def llm_scheduler_state():
+    """Per-backend slots, queues, shed counts and queue waits by priority class."""
+    return {
+        "ollama": llm_client.ollama.scheduler.stats(),
+        "openrouter": llm_client.openrouter.scheduler.stats(),
+    }
+
+
+@app.delete("/admin/cache/llm")
+async def purge_llm_cache():
+    """Drop every cached LLM response."""
+    removed = await asyncio.to_thread(llm_cache.purge)
+    return {"removed": removed}
+
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    transcription_executor.shutdown()
+
+
+@app.on_event("startup")
+async def start_ollama_monitor():
+    ollama_monitor.start()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await ollama_monitor.stop()
+    await llm_client.aclose()
+
+
+async def check_ollama_model(model_name: str = DEFAULT_LLM_MODEL) -> bool:
+    """Check the monitor's cached tag list for the model; no round-trip to Ollama."""
+    return await ollama_monitor.has_model(model_name)
 
 
 @app.post("/enhance")
-async def enhance_transcription(request: EnhanceRequest):
+async def enhance_transcription(request: EnhanceRequest, http_request: Request, stream: bool = False):
     """
     Enhance transcription text using LLM.
     Fixes grammar, punctuation, and improves readability.
     """
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available. Please run: ollama pull {DEFAULT_LLM_MODEL}"
         )
     
-    system_prompt = """You are a professional transcription editor. 
-Your task is to clean up and enhance lecture transcriptions while maintaining the original meaning and content.
-Fix grammar, add proper punctuation, correct obvious errors, but don't add new information.
-Keep the lecture's natural flow and conversational tone."""
-    
-    prompt = f"""Please enhance this lecture transcription by fixing grammar, punctuation, and clarity:
-
-{request.text}
-
-Return only the enhanced text, no explanations."""
+    # Only chunks that are new or changed since the client's last call go to the model
+    if wants_stream(http_request, stream):
+        return stream_enhance_response(
+            request.text, DEFAULT_LLM_MODEL, request.paragraphs, request.known_chunks
+        )
     
-    enhanced_text = call_ollama(prompt, system=system_prompt)
+    response = await cancel_on_disconnect(
+        http_request,
+        enhance_transcript(request.text, DEFAULT_LLM_MODEL, request.paragraphs, request.known_chunks)
+    )
     
-    return JSONResponse({
-        "original": request.text,
-        "enhanced": enhanced_text.strip()
-    })
+    return JSONResponse(response)
 
 
 @app.post("/summarize")
-async def summarize_lecture(request: SummarizeRequest):
+async def summarize_lecture(request: SummarizeRequest, http_request: Request, stream: bool = False):
     """
     Generate a comprehensive summary of the lecture.
     """
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available. Please run: ollama pull {DEFAULT_LLM_MODEL}"
         )
     
-    system_prompt = """You are an expert at summarizing educational content.
-Create clear, concise summaries that capture the main ideas and key points.
-Use bullet points for clarity and organize by topic."""
+    # Long lectures are condensed chunk by chunk first so the prompt fits the context
+    source = await cancel_on_disconnect(
+        http_request, condense_transcript(request.text, DEFAULT_LLM_MODEL, request.paragraphs)
+    )
     
-    prompt = f"""Summarize this lecture transcription. Include:
-1. Main topic and objectives
-2. Key concepts covered
-3. Important details and examples
-4. Conclusions or takeaways
-
-Transcription:
-{request.text}
-
-Format as a clear, structured summary."""
+    system_prompt, prompt = summary_prompt(source.text)
+    
+    def build_response(summary: str) -> dict:
+        return source.annotate({
+            "summary": summary.strip(),
+            "word_count": len(request.text.split()),
+            "paragraph_count": len(request.paragraphs)
+        })
+    
+    if wants_stream(http_request, stream):
+        return stream_llm_response(
+            "summarize", stream_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt), build_response
+        )
     
-    summary = call_ollama(prompt, system=system_prompt)
+    summary = await cancel_on_disconnect(
+        http_request, call_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt)
+    )
     
-    return JSONResponse({
-        "summary": summary.strip(),
-        "word_count": len(request.text.split()),
-        "paragraph_count": len(request.paragraphs)
-    })
+    return JSONResponse(build_response(summary))
 
 
 @app.post("/key-points")
-async def extract_key_points(request: EnhanceRequest):
+async def extract_key_points(request: EnhanceRequest, http_request: Request, stream: bool = False):
     """
     Extract key points and concepts from the lecture.
     """
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available. Please run: ollama pull {DEFAULT_LLM_MODEL}"
         )
     
-    system_prompt = """You are an educational content analyst.
-Extract the most important points from lectures in a clear, organized manner."""
+    # Long lectures are condensed chunk by chunk first so the prompt fits the context
+    source = await cancel_on_disconnect(
+        http_request, condense_transcript(request.text, DEFAULT_LLM_MODEL)
+    )
     
-    prompt = f"""Extract the key points from this lecture. Format as a numbered list.
-Focus on main concepts, important facts, and critical information students should remember.
-
-Lecture:
-{request.text}
-
-Return only the key points list, no introduction."""
+    system_prompt, prompt = key_points_prompt(source.text)
     
-    key_points = call_ollama(prompt, system=system_prompt)
+    def build_response(key_points: str) -> dict:
+        points = parse_key_points(key_points)
+        return source.annotate({
+            "key_points": points,
+            "count": len(points)
+        })
+    
+    if wants_stream(http_request, stream):
+        return stream_llm_response(
+            "key-points", stream_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt), build_response
+        )
     
-    # Parse the response into a list
-    points = [line.strip() for line in key_points.strip().split('\n') if line.strip()]
+    key_points = await cancel_on_disconnect(
+        http_request, call_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt)
+    )
     
-    return JSONResponse({
-        "key_points": points,
-        "count": len(points)
-    })
+    return JSONResponse(build_response(key_points))
 
 
 @app.post("/study-guide")
-async def generate_study_guide(request: StudyGuideRequest):
+async def generate_study_guide(request: StudyGuideRequest, http_request: Request, stream: bool = False):
     """
     Generate a comprehensive study guide from the lecture.
     """
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available. Please run: ollama pull {DEFAULT_LLM_MODEL}"
         )
     
-    system_prompt = """You are an expert educator creating study materials.
-Generate comprehensive study guides that help students learn and retain information."""
+    # Long lectures are condensed chunk by chunk first so the prompt fits the context
+    source = await cancel_on_disconnect(
+        http_request, condense_transcript(request.text, DEFAULT_LLM_MODEL)
+    )
     
-    prompt = f"""Create a study guide for this lecture titled "{request.title}".
-
-Include:
-1. **Overview**: Brief summary of the topic
-2. **Key Concepts**: Main ideas with explanations
-3. **Important Terms**: Definitions of key terms
-4. **Practice Questions**: 5-7 questions to test understanding
-5. **Study Tips**: How to best learn this material
-
-Lecture Content:
-{request.text}
-
-Format as a well-structured study guide."""
+    system_prompt, prompt = study_guide_prompt(source.text, request.title)
     
-    study_guide = call_ollama(prompt, system=system_prompt)
+    def build_response(study_guide: str) -> dict:
+        return source.annotate({
+            "study_guide": study_guide.strip(),
+            "title": request.title
+        })
     
-    return JSONResponse({
-        "study_guide": study_guide.strip(),
-        "title": request.title
-    })
+    if wants_stream(http_request, stream):
+        return stream_llm_response(
+            "study-guide", stream_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt), build_response
+        )
+    
+    study_guide = await cancel_on_disconnect(
+        http_request, call_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt)
+    )
+    
+    return JSONResponse(build_response(study_guide))
 
 
 @app.post("/quiz")
-async def generate_quiz(request: StudyGuideRequest):
+async def generate_quiz(request: QuizRequest, http_request: Request, stream: bool = False):
     """
     Generate quiz questions from the lecture content.
     """
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available. Please run: ollama pull {DEFAULT_LLM_MODEL}"
         )
     
-    system_prompt = """You are an expert at creating educational assessments.
-Generate clear, fair quiz questions that test understanding of key concepts."""
+    if request.sharded and not wants_stream(http_request, stream):
+        # Each shard sees one section of the raw transcript, so nothing needs condensing
+        questions, report = await cancel_on_disconnect(
+            http_request,
+            generate_sharded_quiz(request.text, request.count, ollama_complete(DEFAULT_LLM_MODEL), title=request.title),
+        )
+        return JSONResponse({
+            "quiz": format_quiz(questions),
+            "questions": questions,
+            "title": request.title,
+            "generation": report,
+        })
+    
+    started = time.monotonic()
+    # Long lectures are condensed chunk by chunk first so the prompt fits the context
+    source = await cancel_on_disconnect(
+        http_request, condense_transcript(request.text, DEFAULT_LLM_MODEL)
+    )
     
-    prompt = f"""Create a quiz with 10 multiple-choice questions based on this lecture: "{request.title}"
-
-For each question:
-- Write a clear question
-- Provide 4 options (A, B, C, D)
-- Mark the correct answer
-- Add a brief explanation
+    system_prompt, prompt = quiz_prompt(source.text, request.title, request.count)
+    
+    def build_response(quiz: str) -> dict:
+        return source.annotate({
+            "quiz": quiz.strip(),
+            "title": request.title
+        })
+    
+    if wants_stream(http_request, stream):
+        return stream_llm_response(
+            "quiz", stream_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt), build_response
+        )
+    
+    quiz = await cancel_on_disconnect(
+        http_request, call_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt)
+    )
+    
+    response = build_response(quiz)
+    response["generation"] = {"wall_seconds": round(time.monotonic() - started, 2)}
+    return JSONResponse(response)
 
-Lecture:
-{request.text}
 
-Format as:
-Q1: [question]
-A) [option]
-B) [option]
-C) [option]
-D) [option]
-Correct: [letter]
-Explanation: [brief explanation]"""
+@app.post("/lecture-pack")
+async def generate_lecture_pack(request: LecturePackRequest, http_request: Request):
+    """
+    Generate the enhanced text, summary, key points, study guide and quiz in
+    one request. The transcript is condensed once and the generations run
+    concurrently; the response includes per-artifact timings.
+    """
+    if not await check_ollama_model():
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model {DEFAULT_LLM_MODEL} not available. Please run: ollama pull {DEFAULT_LLM_MODEL}"
+        )
     
-    quiz = call_ollama(prompt, system=system_prompt)
+    pack = await cancel_on_disconnect(
+        http_request,
+        build_lecture_pack(request.text, request.title, DEFAULT_LLM_MODEL, request.paragraphs),
+    )
     
-    return JSONResponse({
-        "quiz": quiz.strip(),
-        "title": request.title
-    })
+    return JSONResponse(pack)
 
 
 if __name__ == "__main__":
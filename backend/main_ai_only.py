@@ -2,15 +2,49 @@
 ClassNote AI - AI Features Only (No Whisper)
 This version works immediately while you set up Python 3.11 for Whisper
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import json
+import asyncio
 import os
 import logging
-import requests
-from typing import Optional
+import time
+from typing import Optional, Union
+
+from chat_sessions import CHAT_SESSION_TTL_DAYS, ChatMemory, ChatSessionStore
+from incremental_enhance import enhance_transcript, stream_enhance_response
+from lecture_index import LECTURE_RETRIEVAL_TOP_K, LectureIndexStore, retrieval_message
+from lecture_pack import build_lecture_pack
+from lecture_prompts import (
+    NOTES_QUIZ_COUNT,
+    format_quiz,
+    key_points_prompt,
+    notes_prompt,
+    parse_key_points,
+    quiz_prompt,
+    study_guide_prompt,
+    summary_prompt,
+)
+from llm_cache import LLMCacheBypassMiddleware, llm_cache
+from llm_client import (
+    OLLAMA_GENERATE_URL,
+    OPENROUTER_MAX_CONCURRENCY,
+    call_ollama,
+    call_openrouter,
+    cancel_on_disconnect,
+    llm_client,
+    stream_ollama,
+    stream_openrouter,
+)
+from llm_providers import OllamaProvider, OpenRouterProvider, ProviderPool
+from llm_scheduler import LLMPriorityMiddleware
+from llm_streaming import stream_llm_response, wants_stream
+from long_transcript import condense_transcript, estimate_tokens
+from notes_stream import parse_notes, stream_notes_response
+from ollama_monitor import ollama_monitor
+from quiz_engine import ShardedQuiz, generate_sharded_quiz, ollama_complete
+from quiz_grading import grade_locally, grade_quiz
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -32,14 +66,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Honour "X-LLM-Cache: bypass" on any request that reaches an LLM
+app.add_middleware(LLMCacheBypassMiddleware)
+# Chat turns and answer checks go ahead of long generations for LLM slots
+app.add_middleware(LLMPriorityMiddleware, interactive_paths={"/chat", "/quiz/validate", "/quiz/grade"})
+
 # Ollama configuration
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/chat")
-OLLAMA_GENERATE_URL = "http://localhost:11434/api/generate"
-OLLAMA_TAGS_URL = "http://localhost:11434/api/tags"
 DEFAULT_LLM_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
 
 # OpenRouter configuration
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 # Keep chat key (original)
 CHAT_OPENROUTER_API_KEY = os.getenv("CHAT_OPENROUTER_API_KEY", "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")
 # NEW: Primary key for all app features (notes, summary, quiz)
@@ -47,9 +83,32 @@ PRIMARY_OPENROUTER_API_KEY = "sk-or-v1-f0d4872e4c5a60c545a6796405c30b045a01a7f3b
 # Backup key if primary fails
 BACKUP_OPENROUTER_API_KEY = os.getenv("APP_OPENROUTER_API_KEY", "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")
 
+# Notes and answer checks fail over between the keys and, last, the local model
+openrouter_pool = ProviderPool([
+    OpenRouterProvider("openrouter-primary", PRIMARY_OPENROUTER_API_KEY),
+    OpenRouterProvider("openrouter-backup", BACKUP_OPENROUTER_API_KEY),
+    OllamaProvider("ollama", DEFAULT_LLM_MODEL),
+])
+
+
+async def pool_complete(system_prompt: str, prompt: str) -> str:
+    """One prompt through the provider pool, for quiz shards, grading and chat summaries."""
+    return await openrouter_pool.complete([{"role": "user", "content": prompt}], system_prompt)
+
+
+# Server-held chat sessions, compacted into rolling summaries
+chat_store = ChatSessionStore()
+chat_memory = ChatMemory(chat_store, pool_complete)
+# Per-lecture passage indexes that /chat retrieves from
+lecture_indexes = LectureIndexStore()
+
 # Pydantic models
 class EnhanceRequest(BaseModel):
     text: str
+    # Chunk on these (e.g. /transcribe paragraphs) instead of the text's own paragraphs or sentences
+    paragraphs: list[str] = []
+    # Chunk ids from an earlier response whose enhanced text the client still has
+    known_chunks: list[str] = []
 
 class SummarizeRequest(BaseModel):
     text: str
@@ -59,66 +118,63 @@ class StudyGuideRequest(BaseModel):
     text: str
     title: str
 
+class QuizRequest(BaseModel):
+    text: str
+    title: str
+    count: int = 10
+    # Generate in concurrent shards per lecture section; False asks for the whole quiz in one call
+    sharded: bool = True
+
+class LecturePackRequest(BaseModel):
+    text: str
+    title: str
+    paragraphs: list[str] = []
+
 class ChatRequest(BaseModel):
     message: str
+    # Leave out to use a server-held session; omit session_id too to start a new one
     conversation_history: Optional[list[dict]] = None
+    session_id: Optional[str] = None
+    # Answer from this indexed lecture's most relevant passages
+    lecture_id: Optional[str] = None
+    top_k: int = LECTURE_RETRIEVAL_TOP_K
 
 class NotesRequest(BaseModel):
     transcript: str
     topic: Optional[str] = None
+    # Generate the quiz in concurrent shards instead of inside the notes completion
+    sharded_quiz: bool = True
+    quiz_count: int = NOTES_QUIZ_COUNT
 
 class QuizValidateRequest(BaseModel):
     question: str
     answer: str
     reference_text: str
+    options: Optional[dict[str, str]] = None
+    # The generated quiz item's answer key; lets a multiple-choice answer be graded without the model
+    correct_answer: Optional[str] = None
 
+class QuizAnswer(BaseModel):
+    question: str
+    answer: str
+    options: Optional[dict[str, str]] = None
+    correct_answer: Optional[str] = None
+    explanation: Optional[str] = None
 
-def check_ollama_model(model_name: str = DEFAULT_LLM_MODEL) -> bool:
-    """Check if specified Ollama model is available via API."""
-    try:
-        response = requests.get(OLLAMA_TAGS_URL, timeout=2)
-        if response.status_code == 200:
-            models_data = response.json()
-            available_models = [m['name'] for m in models_data.get('models', [])]
-            return any(model_name in model or model in model_name for model in available_models)
-        return False
-    except Exception as e:
-        logger.error(f"Ollama model check failed: {e}")
-        return False
+class QuizGradeRequest(BaseModel):
+    answers: list[QuizAnswer]
+    reference_text: str = ""
 
+class LectureIndexRequest(BaseModel):
+    title: str = "Lecture"
+    # /transcribe segments, as a list of objects or in the columnar format
+    segments: Optional[Union[list[dict], dict[str, list]]] = None
+    paragraphs: list[str] = []
 
-def call_ollama(prompt: str, model: str = DEFAULT_LLM_MODEL, system: Optional[str] = None) -> str:
-    """Call Ollama API directly and return the response."""
-    try:
-        full_prompt = prompt
-        if system:
-            full_prompt = f"System: {system}\n\nUser: {prompt}"
-        
-        payload = {
-            "model": model,
-            "prompt": full_prompt,
-            "stream": False,
-            "options": {"temperature": 0.7}
-        }
-        
-        response = requests.post(OLLAMA_GENERATE_URL, json=payload, timeout=120)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Ollama API error: {response.text}"
-            )
-        
-        result = response.json()
-        return result.get('response', '').strip()
-        
-    except requests.exceptions.Timeout:
-        raise HTTPException(status_code=504, detail="LLM processing timed out")
-    except requests.exceptions.ConnectionError:
-        raise HTTPException(status_code=503, detail="Ollama service unavailable")
-    except Exception as e:
-        logger.error(f"Ollama error: {e}")
-        raise HTTPException(status_code=500, detail=f"LLM processing failed: {str(e)}")
+
+async def check_ollama_model(model_name: str = DEFAULT_LLM_MODEL) -> bool:
+    """Check the monitor's cached tag list for the model; no round-trip to Ollama."""
+    return await ollama_monitor.has_model(model_name)
 
 
 @app.get("/")
@@ -128,252 +184,215 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    ollama_status = "unavailable"
-    ollama_models = []
-    
-    try:
-        response = requests.get(OLLAMA_TAGS_URL, timeout=2)
-        if response.status_code == 200:
-            models_data = response.json()
-            ollama_models = [m['name'] for m in models_data.get('models', [])]
-            ollama_status = "available" if ollama_models else "no_models"
-        else:
-            ollama_status = "error"
-    except Exception as e:
-        logger.warning(f"Ollama check failed: {e}")
-        ollama_status = "unavailable"
-    
     return {
         "status": "healthy",
         "ollama": {
-            "status": ollama_status,
-            "models": ollama_models,
+            **ollama_monitor.snapshot(),
             "url": OLLAMA_GENERATE_URL
         }
     }
 
 
 @app.post("/enhance")
-async def enhance_transcription(request: EnhanceRequest):
+async def enhance_transcription(request: EnhanceRequest, http_request: Request, stream: bool = False):
     """Enhance transcription text using LLM."""
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available. Please run: ollama pull {DEFAULT_LLM_MODEL}"
         )
     
-    system_prompt = """You are a professional transcription editor. 
-Fix grammar, add proper punctuation, correct obvious errors, but don't add new information.
-Keep the lecture's natural flow and conversational tone."""
-    
-    prompt = f"""Please enhance this lecture transcription by fixing grammar, punctuation, and clarity:
-
-{request.text}
-
-Return only the enhanced text, no explanations."""
+    # Only chunks that are new or changed since the client's last call go to the model
+    if wants_stream(http_request, stream):
+        return stream_enhance_response(
+            request.text, DEFAULT_LLM_MODEL, request.paragraphs, request.known_chunks
+        )
     
-    enhanced_text = call_ollama(prompt, system=system_prompt)
+    response = await cancel_on_disconnect(
+        http_request,
+        enhance_transcript(request.text, DEFAULT_LLM_MODEL, request.paragraphs, request.known_chunks)
+    )
     
-    return JSONResponse({
-        "original": request.text,
-        "enhanced": enhanced_text.strip()
-    })
+    return JSONResponse(response)
 
 
 @app.post("/summarize")
-async def summarize_lecture(request: SummarizeRequest):
+async def summarize_lecture(request: SummarizeRequest, http_request: Request, stream: bool = False):
     """Generate a comprehensive summary of the lecture."""
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available"
         )
     
-    system_prompt = """You are an expert at summarizing educational content.
-Create clear, concise summaries that capture the main ideas and key points.
-Use bullet points for clarity and organize by topic."""
+    # Long lectures are condensed chunk by chunk first so the prompt fits the context
+    source = await cancel_on_disconnect(
+        http_request, condense_transcript(request.text, DEFAULT_LLM_MODEL, request.paragraphs)
+    )
     
-    prompt = f"""Summarize this lecture transcription. Include:
-1. Main topic and objectives
-2. Key concepts covered
-3. Important details and examples
-4. Conclusions or takeaways
-
-Transcription:
-{request.text}
-
-Format as a clear, structured summary."""
+    system_prompt, prompt = summary_prompt(source.text)
     
-    summary = call_ollama(prompt, system=system_prompt)
+    def build_response(summary: str) -> dict:
+        return source.annotate({
+            "summary": summary.strip(),
+            "word_count": len(request.text.split()),
+            "paragraph_count": len(request.paragraphs)
+        })
     
-    return JSONResponse({
-        "summary": summary.strip(),
-        "word_count": len(request.text.split()),
-        "paragraph_count": len(request.paragraphs)
-    })
+    if wants_stream(http_request, stream):
+        return stream_llm_response(
+            "summarize", stream_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt), build_response
+        )
+    
+    summary = await cancel_on_disconnect(
+        http_request, call_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt)
+    )
+    
+    return JSONResponse(build_response(summary))
 
 
 @app.post("/key-points")
-async def extract_key_points(request: EnhanceRequest):
+async def extract_key_points(request: EnhanceRequest, http_request: Request, stream: bool = False):
     """Extract key points and concepts from the lecture."""
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available"
         )
     
-    system_prompt = """You are an educational content analyst.
-Extract the most important points from lectures in a clear, organized manner."""
+    # Long lectures are condensed chunk by chunk first so the prompt fits the context
+    source = await cancel_on_disconnect(
+        http_request, condense_transcript(request.text, DEFAULT_LLM_MODEL)
+    )
     
-    prompt = f"""Extract the key points from this lecture. Format as a numbered list.
-Focus on main concepts, important facts, and critical information students should remember.
-
-Lecture:
-{request.text}
-
-Return only the key points list, no introduction."""
+    system_prompt, prompt = key_points_prompt(source.text)
     
-    key_points = call_ollama(prompt, system=system_prompt)
+    def build_response(key_points: str) -> dict:
+        points = parse_key_points(key_points)
+        return source.annotate({
+            "key_points": points,
+            "count": len(points)
+        })
+    
+    if wants_stream(http_request, stream):
+        return stream_llm_response(
+            "key-points", stream_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt), build_response
+        )
     
-    points = [line.strip() for line in key_points.strip().split('\n') if line.strip()]
+    key_points = await cancel_on_disconnect(
+        http_request, call_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt)
+    )
     
-    return JSONResponse({
-        "key_points": points,
-        "count": len(points)
-    })
+    return JSONResponse(build_response(key_points))
 
 
 @app.post("/study-guide")
-async def generate_study_guide(request: StudyGuideRequest):
+async def generate_study_guide(request: StudyGuideRequest, http_request: Request, stream: bool = False):
     """Generate a comprehensive study guide from the lecture."""
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available"
         )
     
-    system_prompt = """You are an expert educator creating study materials.
-Generate comprehensive study guides that help students learn and retain information."""
+    # Long lectures are condensed chunk by chunk first so the prompt fits the context
+    source = await cancel_on_disconnect(
+        http_request, condense_transcript(request.text, DEFAULT_LLM_MODEL)
+    )
     
-    prompt = f"""Create a study guide for this lecture titled "{request.title}".
-
-Include:
-1. **Overview**: Brief summary of the topic
-2. **Key Concepts**: Main ideas with explanations
-3. **Important Terms**: Definitions of key terms
-4. **Practice Questions**: 5-7 questions to test understanding
-5. **Study Tips**: How to best learn this material
-
-Lecture Content:
-{request.text}
-
-Format as a well-structured study guide."""
+    system_prompt, prompt = study_guide_prompt(source.text, request.title)
+    
+    def build_response(study_guide: str) -> dict:
+        return source.annotate({
+            "study_guide": study_guide.strip(),
+            "title": request.title
+        })
     
-    study_guide = call_ollama(prompt, system=system_prompt)
+    if wants_stream(http_request, stream):
+        return stream_llm_response(
+            "study-guide", stream_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt), build_response
+        )
+    
+    study_guide = await cancel_on_disconnect(
+        http_request, call_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt)
+    )
     
-    return JSONResponse({
-        "study_guide": study_guide.strip(),
-        "title": request.title
-    })
+    return JSONResponse(build_response(study_guide))
 
 
 @app.post("/quiz")
-async def generate_quiz(request: StudyGuideRequest):
+async def generate_quiz(request: QuizRequest, http_request: Request, stream: bool = False):
     """Generate quiz questions from the lecture content."""
-    if not check_ollama_model():
+    if not await check_ollama_model():
         raise HTTPException(
             status_code=503,
             detail=f"Model {DEFAULT_LLM_MODEL} not available"
         )
     
-    system_prompt = """You are an expert at creating educational assessments.
-Generate clear, fair quiz questions that test understanding of key concepts."""
+    if request.sharded and not wants_stream(http_request, stream):
+        # Each shard sees one section of the raw transcript, so nothing needs condensing
+        questions, report = await cancel_on_disconnect(
+            http_request,
+            generate_sharded_quiz(request.text, request.count, ollama_complete(DEFAULT_LLM_MODEL), title=request.title),
+        )
+        return JSONResponse({
+            "quiz": format_quiz(questions),
+            "questions": questions,
+            "title": request.title,
+            "generation": report,
+        })
     
-    prompt = f"""Create a quiz with 10 multiple-choice questions based on this lecture: "{request.title}"
-
-For each question:
-- Write a clear question
-- Provide 4 options (A, B, C, D)
-- Mark the correct answer
-- Add a brief explanation
-
-Lecture:
-{request.text}
-
-Format as:
-Q1: [question]
-A) [option]
-B) [option]
-C) [option]
-D) [option]
-Correct: [letter]
-Explanation: [brief explanation]"""
+    started = time.monotonic()
+    # Long lectures are condensed chunk by chunk first so the prompt fits the context
+    source = await cancel_on_disconnect(
+        http_request, condense_transcript(request.text, DEFAULT_LLM_MODEL)
+    )
     
-    quiz = call_ollama(prompt, system=system_prompt)
+    system_prompt, prompt = quiz_prompt(source.text, request.title, request.count)
     
-    return JSONResponse({
-        "quiz": quiz.strip(),
-        "title": request.title
-    })
+    def build_response(quiz: str) -> dict:
+        return source.annotate({
+            "quiz": quiz.strip(),
+            "title": request.title
+        })
+    
+    if wants_stream(http_request, stream):
+        return stream_llm_response(
+            "quiz", stream_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt), build_response
+        )
+    
+    quiz = await cancel_on_disconnect(
+        http_request, call_ollama(prompt, DEFAULT_LLM_MODEL, system=system_prompt)
+    )
+    
+    response = build_response(quiz)
+    response["generation"] = {"wall_seconds": round(time.monotonic() - started, 2)}
+    return JSONResponse(response)
 
 
-def call_openrouter(messages: list[dict], system_prompt: str, api_key: str | None = None) -> str:
-    """Call OpenRouter API for chat completions."""
-    try:
-        # Prepare messages with system prompt
-        full_messages = [{"role": "system", "content": system_prompt}] + messages
-        
-        payload = {
-            "model": "anthropic/claude-3.5-sonnet",  # Using Claude for better educational responses
-            "messages": full_messages,
-            "temperature": 0.7,
-            "max_tokens": 4000,  # Allow for detailed, long responses
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {api_key or CHAT_OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "http://localhost:4000",
-            "X-Title": "ClassNote AI"
-        }
-        
-        response = requests.post(
-            OPENROUTER_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=120
+@app.post("/lecture-pack")
+async def generate_lecture_pack(request: LecturePackRequest, http_request: Request):
+    """
+    Generate the enhanced text, summary, key points, study guide and quiz in
+    one request. The transcript is condensed once and the generations run
+    concurrently; the response includes per-artifact timings.
+    """
+    if not await check_ollama_model():
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model {DEFAULT_LLM_MODEL} not available"
         )
-        
-        if response.status_code != 200:
-            logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Chat API error: {response.text}"
-            )
-        
-        result = response.json()
-        
-        if "choices" not in result or len(result["choices"]) == 0:
-            raise HTTPException(
-                status_code=500,
-                detail="No response from chat API"
-            )
-        
-        return result["choices"][0]["message"]["content"].strip()
-        
-    except requests.exceptions.Timeout:
-        logger.error("OpenRouter request timed out")
-        raise HTTPException(status_code=504, detail="Chat request timed out")
-    except requests.exceptions.ConnectionError:
-        logger.error("Could not connect to OpenRouter")
-        raise HTTPException(status_code=503, detail="Chat service unavailable")
-    except Exception as e:
-        logger.error(f"OpenRouter error: {e}")
-        raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
+    
+    pack = await cancel_on_disconnect(
+        http_request,
+        build_lecture_pack(request.text, request.title, DEFAULT_LLM_MODEL, request.paragraphs),
+    )
+    
+    return JSONResponse(pack)
 
 
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, stream: bool = False):
     """
     Chat endpoint for educational assistance.
     Focuses on university studies, provides detailed answers with sources.
@@ -483,23 +502,62 @@ RESPONSE LENGTH:
 
 REMEMBER: Structure is KEY - follow the format above exactly. Make it look like well-organized class notes that are easy to read and understand!"""
 
-    # Prepare conversation history
-    messages = []
-    if request.conversation_history:
-        messages = request.conversation_history
+    if request.conversation_history is not None:
+        # Client-held history, sent in full every turn
+        session_id = None
+        messages = list(request.conversation_history)
+        messages.append({"role": "user", "content": request.message})
     else:
-        messages = []
+        # Server-held session: a rolling summary plus the recent turns
+        session_id = await chat_memory.open(request.session_id)
+        messages, context = await chat_memory.messages(session_id, system_prompt, request.message)
+
+    citations = None
+    if request.lecture_id:
+        # Only the passages relevant to this message, just ahead of it; they aren't kept in the session
+        index, hits = await lecture_indexes.search(request.lecture_id, request.message, request.top_k)
+        if hits:
+            excerpts = retrieval_message(index.meta["title"], hits)
+            messages.insert(len(messages) - 1, {"role": "system", "content": excerpts})
+            if session_id is not None:
+                context["retrieval_tokens"] = estimate_tokens(excerpts)
+                context["prompt_tokens"] += context["retrieval_tokens"]
+        citations = [
+            {key: hit[key] for key in ("citation", "start", "end", "score", "passage")} for hit in hits
+        ]
+    started = time.monotonic()
+    
+    def build_response(response_text: str) -> dict:
+        response_text = response_text.strip()
+        response = {
+            "message": response_text,
+            "sources_included": "sources" in response_text.lower() or "reference" in response_text.lower()
+        }
+        if citations is not None:
+            response["citations"] = citations
+        if session_id is not None:
+            response.update(session_id=session_id, context={**context, "latency": round(time.monotonic() - started, 3)})
+        return response
+    
+    async def remembered(tokens):
+        parts = []
+        async for token in tokens:
+            parts.append(token)
+            yield token
+        await chat_memory.record(session_id, request.message, "".join(parts).strip(), context, time.monotonic() - started)
     
-    # Add current user message
-    messages.append({"role": "user", "content": request.message})
+    if wants_stream(http_request, stream):
+        tokens = stream_openrouter(messages, system_prompt, api_key=CHAT_OPENROUTER_API_KEY)
+        return stream_llm_response("chat", remembered(tokens) if session_id is not None else tokens, build_response)
     
     try:
-        response_text = call_openrouter(messages, system_prompt)
+        response_text = await cancel_on_disconnect(
+            http_request, call_openrouter(messages, system_prompt, api_key=CHAT_OPENROUTER_API_KEY)
+        )
         
-        return JSONResponse({
-            "message": response_text,
-            "sources_included": "sources" in response_text.lower() or "reference" in response_text.lower()
-        })
+        if session_id is not None:
+            await chat_memory.record(session_id, request.message, response_text.strip(), context, time.monotonic() - started)
+        return JSONResponse(build_response(response_text))
     except HTTPException:
         raise
     except Exception as e:
@@ -507,124 +565,176 @@ REMEMBER: Structure is KEY - follow the format above exactly. Make it look like
         raise HTTPException(status_code=500, detail=f"Failed to generate response: {str(e)}")
 
 
+@app.get("/chat/sessions/{session_id}")
+async def get_chat_session(session_id: str):
+    """A session's messages, rolling summary and per-turn prompt size and latency."""
+    session = await asyncio.to_thread(chat_store.session, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return session
+
+
+@app.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str):
+    if not await asyncio.to_thread(chat_store.delete, session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return {"deleted": session_id}
+
+
+@app.post("/lectures/{lecture_id}/index")
+async def index_lecture(lecture_id: str, request: LectureIndexRequest):
+    """
+    Build (or rebuild) the retrieval index /chat uses for a lecture, from the
+    segments and paragraphs /transcribe returned.
+    """
+    return await lecture_indexes.build(lecture_id, request.title, request.segments, request.paragraphs)
+
+
+@app.get("/lectures/{lecture_id}/search")
+async def search_lecture(lecture_id: str, q: str, k: int = LECTURE_RETRIEVAL_TOP_K):
+    """The passages of an indexed lecture most relevant to q, with their timestamps."""
+    started = time.monotonic()
+    _, hits = await lecture_indexes.search(lecture_id, q, k)
+    return {"lecture_id": lecture_id, "query": q, "hits": hits, "seconds": round(time.monotonic() - started, 4)}
+
+
+@app.delete("/lectures/{lecture_id}/index")
+async def delete_lecture_index(lecture_id: str):
+    if not await asyncio.to_thread(lecture_indexes.delete, lecture_id):
+        raise HTTPException(status_code=404, detail=f"Lecture {lecture_id} has not been indexed")
+    return {"deleted": lecture_id}
+
+
 @app.post("/notes")
-async def generate_notes(request: NotesRequest):
+async def generate_notes(request: NotesRequest, http_request: Request, stream: bool = False):
     """
     Generate comprehensive notes, summary bullets, and embedded chart/table instructions
     from a long transcript. Output uses the strict structure requested by the frontend.
-    """
-    system_prompt = """You are an expert academic note generator. Given a lecture transcript, you MUST return a single, valid JSON object with these exact keys:
-{
-  "notes_markdown": (string, strict markdown with ALL sections below),
-  "summary_bullets": (array of 10-20 concise English summary points),
-  "charts_embedded": (boolean, true if any chart JSON is present),
-  "web_links": (array of at least 5 real .edu/.gov/journal URLs),
-  "quiz": (array of EXACTLY 50 unique quiz objects, each with: question, options {A,B,C,D}, answer, explanation)
-}
-
-CRITICAL RULES:
-- ALWAYS return exactly 50 quiz questions, never fewer
-- If transcript lacks 50 distinct points, create additional relevant questions
-- Return ONLY valid JSON, no prose, no extra text
-- Never repeat quiz questions
-
-notes_markdown structure (use markdown):
-## 1. INTRODUCTION
-- Clear overview of topic
-
-## 2. EXPLANATION WITH SIDE HEADINGS
-Break into numbered sections (e.g., "### 2.1 Topic Name"):
-- **Definition:** Clear definition with key terms **bolded**
-- **Explanation:** Detailed explanation
-- Bullet points with examples
-- **Example:** Real-world example
-
-## 3. SHORT NOTES
-- Concise bullet points of key facts
-
-## 4. IMPORTANT TOPICS
-- **Topic 1:** Brief explanation
-- **Topic 2:** Brief explanation
-
-## 5. REAL-LIFE EXAMPLE
-- Comprehensive scenario with bullets
-
-## 6. TABLES
-Use markdown tables for comparisons (| Header 1 | Header 2 |)
-
-## 7. CHARTS
-Include at least one chart as JSON code block:
-```json
-{
-  "type": "bar|line|pie",
-  "title": "Chart Title",
-  "data": [{"name": "Label", "value": 100}],
-  "xKey": "name",
-  "yKey": "value"
-}
-```
-
-## 8. WEB LINKS
-- List 5-10 high-quality academic URLs
-
-Return ONLY this JSON object, fully filled out."""
 
+    With ?stream=true (or Accept: text/event-stream) each part is sent as soon as
+    it has been generated: the notes, then each summary bullet and quiz question.
+    """
     topic_hint = request.topic or "Lecture"
-    user_prompt = f"""Topic: {topic_hint}
-
-Transcript:
-{request.transcript}
+    system_prompt, user_prompt = notes_prompt(request.transcript, topic_hint, include_quiz=not request.sharded_quiz)
+    messages = [{"role": "user", "content": user_prompt}]
+    # The quiz is generated in concurrent shards rather than as part of the notes completion,
+    # as many at once as the pool's OpenRouter backend allows
+    quiz = None
+    if request.sharded_quiz:
+        quiz = ShardedQuiz(
+            request.transcript, request.quiz_count, pool_complete,
+            title=topic_hint, concurrency=OPENROUTER_MAX_CONCURRENCY,
+        )
 
-Return a JSON object with keys: notes_markdown, summary_bullets (array of strings), charts_embedded (boolean), web_links (array of url strings), quiz (array of objects with fields: question, options (A-D), answer, explanation).
-Ensure notes_markdown includes tables and chart JSON blocks when relevant.
-"""
+    if wants_stream(http_request, stream):
+        return stream_notes_response(openrouter_pool.stream(messages, system_prompt), quiz)
 
-    # Try primary key first, fallback to backup if it fails
-    response_text = None
-    try:
-        logger.info("Attempting notes generation with PRIMARY key...")
-        response_text = call_openrouter([
-            {"role": "user", "content": user_prompt}
-        ], system_prompt, api_key=PRIMARY_OPENROUTER_API_KEY)
-        logger.info("PRIMARY key succeeded for notes generation")
-    except Exception as e1:
-        logger.error(f"Primary OpenRouter key failed: {e1}. Trying backup key...")
+    async def generate() -> tuple[str, Optional[list[dict]]]:
+        quiz_task = asyncio.create_task(quiz.collect()) if quiz is not None else None
         try:
-            response_text = call_openrouter([
-                {"role": "user", "content": user_prompt}
-            ], system_prompt, api_key=BACKUP_OPENROUTER_API_KEY)
-            logger.info("BACKUP key succeeded for notes generation")
-        except Exception as e2:
-            logger.error(f"Backup OpenRouter key also failed: {e2}")
-            raise HTTPException(status_code=500, detail=f"Both API keys failed. Primary: {str(e1)}, Backup: {str(e2)}")
-
-    # Parse JSON response
-    try:
-        payload = json.loads(response_text)
-        logger.info(f"Notes generated successfully. Quiz count: {len(payload.get('quiz', []))}")
-    except Exception as parse_err:
-        logger.warning(f"Failed to parse as JSON: {parse_err}. Using fallback structure.")
-        payload = {"notes_markdown": response_text, "summary_bullets": [], "charts_embedded": False, "web_links": [], "quiz": []}
+            # Primary key, then backup key, then local Ollama, skipping any that are down
+            response_text = await openrouter_pool.complete(messages, system_prompt)
+            return response_text, (await quiz_task if quiz_task is not None else None)
+        finally:
+            if quiz_task is not None:
+                quiz_task.cancel()
+
+    response_text, questions = await cancel_on_disconnect(http_request, generate())
+
+    # Parse JSON response, keeping whatever parsed if it is malformed or truncated
+    payload = parse_notes(response_text)
+    if "recovered" in payload:
+        logger.warning(f"Notes output was not valid JSON, recovered: {payload['recovered']}")
+    if quiz is not None:
+        payload["quiz"] = questions
+        payload["quiz_generation"] = quiz.report()
+    logger.info(f"Notes generated successfully. Quiz count: {len(payload.get('quiz', []))}")
 
     return JSONResponse(payload)
 
 
 @app.post("/quiz/validate")
-async def quiz_validate(request: QuizValidateRequest):
+async def quiz_validate(request: QuizValidateRequest, http_request: Request):
     """Validate a user's answer against the reference text."""
+    correct = grade_locally(request.answer, request.correct_answer, request.options)
+    if correct is not None:
+        return JSONResponse({"verdict": "correct" if correct else f"incorrect. The correct answer is {request.correct_answer}."})
+
     system_prompt = "You are a precise quiz validator. Respond only with 'correct' or 'incorrect' and one concise sentence explanation."
     prompt = f"""Question: {request.question}
 User Answer: {request.answer}
 Reference Text:
 {request.reference_text}
 """
-    try:
-        verdict = call_openrouter([{"role": "user", "content": prompt}], system_prompt, api_key=PRIMARY_OPENROUTER_API_KEY)
-    except Exception:
-        verdict = call_openrouter([{"role": "user", "content": prompt}], system_prompt, api_key=BACKUP_OPENROUTER_API_KEY)
+    messages = [{"role": "user", "content": prompt}]
+    verdict = await cancel_on_disconnect(http_request, openrouter_pool.complete(messages, system_prompt))
     return JSONResponse({"verdict": verdict.strip()})
 
 
+@app.post("/quiz/grade")
+async def quiz_grade(request: QuizGradeRequest, http_request: Request):
+    """
+    Grade a whole quiz submission. Answers matching a known answer key are
+    graded locally; the rest go to the model in as few batched prompts as possible.
+    """
+    items = [answer.model_dump() for answer in request.answers]
+    result = await cancel_on_disconnect(http_request, grade_quiz(items, request.reference_text, pool_complete))
+    return JSONResponse(result)
+
+
+@app.get("/metrics/llm")
+async def llm_metrics():
+    """In-flight and queued LLM calls per backend, and response cache hit ratio."""
+    return {**llm_client.stats(), "cache": await asyncio.to_thread(llm_cache.stats)}
+
+
+@app.get("/metrics/providers")
+async def provider_metrics():
+    """Circuit state, latency percentiles and error rate per OpenRouter key and the Ollama fallback."""
+    return openrouter_pool.stats()
+
+
+@app.get("/metrics/chat")
+async def chat_metrics():
+    """Chat sessions, compactions, prompt size and latency over recent session turns, and lecture retrieval."""
+    return {**await asyncio.to_thread(chat_memory.stats), "retrieval": await asyncio.to_thread(lecture_indexes.stats)}
+
+
+@app.get("/admin/llm/scheduler")
+async def llm_scheduler_state():
+    """Per-backend slots, queues, shed counts and queue waits by priority class."""
+    return {
+        "ollama": llm_client.ollama.scheduler.stats(),
+        "openrouter": llm_client.openrouter.scheduler.stats(),
+    }
+
+
+@app.delete("/admin/cache/llm")
+async def purge_llm_cache():
+    """Drop every cached LLM response."""
+    removed = await asyncio.to_thread(llm_cache.purge)
+    return {"removed": removed}
+
+
+@app.on_event("startup")
+async def start_ollama_monitor():
+    ollama_monitor.start()
+
+
+@app.on_event("startup")
+async def purge_idle_chat_sessions():
+    removed = await asyncio.to_thread(chat_store.purge_idle, CHAT_SESSION_TTL_DAYS * 86400)
+    if removed:
+        logger.info(f"Deleted {removed} idle chat sessions")
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await ollama_monitor.stop()
+    await chat_memory.aclose()
+    await llm_client.aclose()
+
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("🚀 Starting ClassNote AI - AI Features Server on port 8001")
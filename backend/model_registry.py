@@ -0,0 +1,231 @@
+"""
+Whisper model registry.
+
+Models are loaded lazily on first use (or warmed in the background after
+startup) and several sizes / compute types can be resident at once. The sum
+of their estimated footprints is kept under a memory budget by unloading the
+least recently used models that no transcription currently holds.
+
+Jobs lease a model with `with registry.acquire("small", "int8") as model:`.
+Replicas of the same configuration (used by long-audio mode to transcribe
+chunks in parallel) are separate registry entries and count against the same
+budget.
+
+Configuration (environment variables):
+    WHISPER_MODEL                  default model size (default "small")
+    WHISPER_COMPUTE_TYPE           default compute type (default "int8")
+    WHISPER_ALLOWED_MODELS         sizes a request may ask for (default "tiny,base,small,medium")
+    WHISPER_ALLOWED_COMPUTE_TYPES  compute types a request may ask for (default "int8,float32")
+    WHISPER_MEMORY_BUDGET_MB       budget for resident models (default 4096)
+    WHISPER_WARM_MODELS            "size:compute_type" list loaded after startup
+                                   (default: the default model; "" for fully lazy)
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from faster_whisper import WhisperModel
+
+logger = logging.getLogger(__name__)
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "small")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_ALLOWED_MODELS = [m for m in os.getenv("WHISPER_ALLOWED_MODELS", "tiny,base,small,medium").split(",") if m]
+WHISPER_ALLOWED_COMPUTE_TYPES = [c for c in os.getenv("WHISPER_ALLOWED_COMPUTE_TYPES", "int8,float32").split(",") if c]
+WHISPER_MEMORY_BUDGET_MB = float(os.getenv("WHISPER_MEMORY_BUDGET_MB", "4096"))
+WHISPER_WARM_MODELS = os.getenv("WHISPER_WARM_MODELS", f"{WHISPER_MODEL}:{WHISPER_COMPUTE_TYPE}")
+
+# Approximate parameter counts (millions) for footprint estimates
+_MODEL_PARAMS_M = {
+    "tiny": 39, "tiny.en": 39,
+    "base": 74, "base.en": 74,
+    "small": 244, "small.en": 244,
+    "medium": 769, "medium.en": 769,
+    "distil-small.en": 166, "distil-medium.en": 394,
+    "large-v1": 1550, "large-v2": 1550, "large-v3": 1550, "large": 1550,
+    "distil-large-v2": 756, "distil-large-v3": 756,
+}
+_BYTES_PER_PARAM = {
+    "int8": 1, "int8_float16": 1, "int8_float32": 1, "int8_bfloat16": 1,
+    "float16": 2, "bfloat16": 2, "float32": 4, "default": 4,
+}
+# Runtime buffers on top of the weights
+_OVERHEAD = 1.3
+
+
+def estimate_model_mb(model_size: str, compute_type: str) -> float:
+    params = _MODEL_PARAMS_M.get(model_size, 1550)
+    return params * _BYTES_PER_PARAM.get(compute_type, 4) * _OVERHEAD
+
+
+def parse_model_list(spec: str) -> list[tuple[str, str]]:
+    """Parse "small:int8,tiny" into [("small", "int8"), ("tiny", WHISPER_COMPUTE_TYPE)]."""
+    models = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        size, _, compute_type = item.partition(":")
+        models.append((size, compute_type or WHISPER_COMPUTE_TYPE))
+    return models
+
+
+def validate_model_choice(model_size: Optional[str], compute_type: Optional[str]) -> tuple[str, str]:
+    """Resolve a per-request model choice, raising ValueError if it isn't allowed."""
+    model_size = model_size or WHISPER_MODEL
+    compute_type = compute_type or WHISPER_COMPUTE_TYPE
+    if model_size not in WHISPER_ALLOWED_MODELS and model_size != WHISPER_MODEL:
+        raise ValueError(f"model must be one of {', '.join(WHISPER_ALLOWED_MODELS)}")
+    if compute_type not in WHISPER_ALLOWED_COMPUTE_TYPES and compute_type != WHISPER_COMPUTE_TYPE:
+        raise ValueError(f"compute_type must be one of {', '.join(WHISPER_ALLOWED_COMPUTE_TYPES)}")
+    return model_size, compute_type
+
+
+class _Entry:
+    def __init__(self, key: tuple[str, str, int]):
+        self.key = key
+        self.model: Optional[WhisperModel] = None
+        self.leases = 0
+        self.last_used = 0.0
+        self.load_seconds: Optional[float] = None
+        self.loaded = threading.Event()
+        self.error: Optional[Exception] = None
+
+
+class ModelRegistry:
+    """Lazily loaded, memory-budgeted set of WhisperModel instances."""
+
+    def __init__(
+        self,
+        budget_mb: float = WHISPER_MEMORY_BUDGET_MB,
+        num_workers: int = 1,
+        replica_threads: int = 0,
+    ):
+        self.budget_mb = budget_mb
+        self.default_model = WHISPER_MODEL
+        self.default_compute_type = WHISPER_COMPUTE_TYPE
+        # Parallel transcribe() calls on the primary replica (thread executor)
+        self._num_workers = num_workers
+        # CPU threads for extra replicas, which run side by side
+        self._replica_threads = replica_threads
+        self._entries: dict[tuple[str, str, int], _Entry] = {}
+        self._lock = threading.Lock()
+        self._unloads = 0
+
+    def max_replicas(self, model_size: str, compute_type: str) -> int:
+        """How many copies of a model fit in the budget at once."""
+        return max(1, int(self.budget_mb // estimate_model_mb(model_size, compute_type)))
+
+    @contextmanager
+    def acquire(self, model_size: Optional[str] = None, compute_type: Optional[str] = None, replica: int = 0):
+        """Lease a model, loading it first if needed. Leased models are never unloaded."""
+        key = (model_size or self.default_model, compute_type or self.default_compute_type, replica)
+        entry = self._lease(key)
+        try:
+            yield entry.model
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                entry.last_used = time.monotonic()
+
+    def warm(self, models: list[tuple[str, str]]):
+        """Load models ahead of the first request. Blocking; run in a thread."""
+        for model_size, compute_type in models:
+            try:
+                with self.acquire(model_size, compute_type):
+                    pass
+            except Exception as e:
+                logger.error(f"Failed to warm Whisper model {model_size}/{compute_type}: {e}")
+
+    def state(self, model_size: Optional[str] = None, compute_type: Optional[str] = None) -> str:
+        """"ready", "loading" or "not_loaded" for a model's primary replica."""
+        key = (model_size or self.default_model, compute_type or self.default_compute_type, 0)
+        entry = self._entries.get(key)
+        if entry is None:
+            return "not_loaded"
+        return "ready" if entry.model is not None else "loading"
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = [
+                {
+                    "model": size,
+                    "compute_type": compute_type,
+                    "replica": replica,
+                    "state": "ready" if entry.model is not None else "loading",
+                    "leases": entry.leases,
+                    "estimated_mb": round(estimate_model_mb(size, compute_type)),
+                    "load_seconds": round(entry.load_seconds, 2) if entry.load_seconds else None,
+                }
+                for (size, compute_type, replica), entry in self._entries.items()
+            ]
+        return {
+            "default": {"model": self.default_model, "compute_type": self.default_compute_type},
+            "budget_mb": self.budget_mb,
+            "resident_mb": round(sum(m["estimated_mb"] for m in models)),
+            "unloads": self._unloads,
+            "models": models,
+        }
+
+    def _lease(self, key: tuple[str, str, int]) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                self._make_room(estimate_model_mb(key[0], key[1]))
+                entry = _Entry(key)
+                self._entries[key] = entry
+            entry.leases += 1
+
+        if owner:
+            self._load(entry)
+        else:
+            entry.loaded.wait()
+
+        if entry.error is not None:
+            with self._lock:
+                entry.leases -= 1
+            raise entry.error
+        return entry
+
+    def _load(self, entry: _Entry):
+        model_size, compute_type, replica = entry.key
+        logger.info(f"Loading Whisper model {model_size}/{compute_type} (replica {replica})...")
+        started = time.monotonic()
+        try:
+            if replica == 0:
+                entry.model = WhisperModel(model_size, compute_type=compute_type, num_workers=self._num_workers)
+            else:
+                entry.model = WhisperModel(model_size, compute_type=compute_type, cpu_threads=self._replica_threads)
+            entry.load_seconds = time.monotonic() - started
+            logger.info(f"Whisper model {model_size}/{compute_type} loaded in {entry.load_seconds:.1f}s")
+        except Exception as e:
+            entry.error = e
+            with self._lock:
+                self._entries.pop(entry.key, None)
+        finally:
+            entry.loaded.set()
+
+    def _make_room(self, needed_mb: float):
+        """Unload idle models, least recently used first, until needed_mb fits. Caller holds the lock."""
+        resident = sum(estimate_model_mb(k[0], k[1]) for k in self._entries)
+        if resident + needed_mb <= self.budget_mb:
+            return
+        idle = sorted(
+            (e for e in self._entries.values() if e.leases == 0 and e.model is not None),
+            key=lambda e: e.last_used,
+        )
+        for entry in idle:
+            if resident + needed_mb <= self.budget_mb:
+                break
+            del self._entries[entry.key]
+            resident -= estimate_model_mb(entry.key[0], entry.key[1])
+            self._unloads += 1
+            logger.info(f"Unloaded Whisper model {entry.key[0]}/{entry.key[1]} (replica {entry.key[2]})")
+        if resident + needed_mb > self.budget_mb:
+            logger.warning(
+                f"Whisper models exceed the {self.budget_mb:.0f} MB budget; all resident models are in use"
+            )
@@ -0,0 +1,309 @@
+"""
+Incremental parser for the /notes JSON object.
+
+/notes asks the model for one JSON object with notes_markdown,
+summary_bullets, charts_embedded, web_links and a 50-question quiz. Parsing
+it with json.loads only once the whole generation has arrived meant nothing
+could be shown for a minute or more, and a single malformed or truncated
+character sent the entire output into notes_markdown, losing the quiz.
+
+NotesStreamParser scans the output as tokens arrive and reports each
+top-level value as soon as it is complete. Array members are reported one by
+one: each summary bullet, web link and quiz question. finish() builds the
+payload from everything that parsed. It keeps the completed items of a
+truncated generation, and the text so far of a notes_markdown string that
+was cut off.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from llm_client import llm_client
+from llm_streaming import sse_event
+
+logger = logging.getLogger(__name__)
+
+# Top-level arrays whose members are reported individually
+ARRAY_KEYS = ("summary_bullets", "web_links", "quiz")
+# SSE event name for one member of each array
+ITEM_EVENTS = {"summary_bullets": "summary_bullet", "web_links": "web_link", "quiz": "quiz_item"}
+
+
+class _Frame:
+    """An object or array the scanner is inside."""
+
+    __slots__ = ("kind", "start", "path", "state", "key", "index", "literal_start")
+
+    def __init__(self, kind: str, start: int, path: tuple):
+        self.kind = kind
+        self.start = start
+        self.path = path
+        # object: "key" -> "colon" -> "value" -> "after"; array: "value" -> "after"
+        self.state = "key" if kind == "{" else "value"
+        self.key: Optional[str] = None
+        self.index = 0
+        self.literal_start: Optional[int] = None
+
+    def child_path(self) -> tuple:
+        return self.path + ((self.key,) if self.kind == "{" else (self.index,))
+
+
+class NotesStreamParser:
+    """Feed model output in pieces; get (event, data) pairs for every value that completed."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.payload: dict = {key: [] for key in ARRAY_KEYS}
+        self.skipped = 0
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._root_closed = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._events: list[tuple[str, dict]] = []
+
+    @property
+    def complete(self) -> bool:
+        return self._root_closed
+
+    def feed(self, text: str) -> list[tuple[str, dict]]:
+        self.buffer += text
+        self._scan()
+        events, self._events = self._events, []
+        return events
+
+    def finish(self) -> dict:
+        """The payload recovered from everything fed so far."""
+        if not self._stack and not self._root_closed:
+            # No JSON object at all; keep the old behaviour of using the text as notes
+            return self._with_defaults({"notes_markdown": self.buffer.strip()}, partial=True)
+
+        payload = {key: list(value) if key in ARRAY_KEYS else value for key, value in self.payload.items()}
+        if not self._root_closed:
+            top = self._stack[0]
+            if (
+                self._in_string
+                and not self._string_is_key
+                and len(self._stack) == 1
+                and top.key == "notes_markdown"
+            ):
+                payload["notes_markdown"] = self._decode_partial_string(self.buffer[self._string_start:])
+        return self._with_defaults(payload, partial=not self._root_closed)
+
+    def _with_defaults(self, payload: dict, partial: bool) -> dict:
+        payload.setdefault("notes_markdown", "")
+        for key in ARRAY_KEYS:
+            payload.setdefault(key, [])
+        payload.setdefault("charts_embedded", "```json" in payload["notes_markdown"])
+        if partial or self.skipped:
+            payload["recovered"] = {
+                "truncated": partial,
+                "skipped_values": self.skipped,
+                "quiz_count": len(payload["quiz"]),
+            }
+        return payload
+
+    @staticmethod
+    def _decode_partial_string(raw: str) -> str:
+        """Decode an unterminated JSON string (starting at its opening quote) as far as it goes."""
+        body = raw[1:]
+        # Drop a dangling escape sequence cut off mid-way
+        for cut in range(0, 6):
+            candidate = body[:len(body) - cut] if cut else body
+            try:
+                return json.loads(f'"{candidate}"')
+            except json.JSONDecodeError:
+                continue
+        return body
+
+    def _scan(self):
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            if self._root_closed:
+                break
+            c = buffer[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._end_string(i)
+                continue
+
+            if not self._stack:
+                # Skip prose or a ```json fence before the object
+                if c == "{":
+                    self._stack.append(_Frame("{", i, ()))
+                continue
+
+            frame = self._stack[-1]
+            if frame.literal_start is not None and (c.isspace() or c in ",]}"):
+                self._end_value(frame, frame.literal_start, i)
+                frame.literal_start = None
+            if c.isspace():
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = frame.kind == "{" and frame.state == "key"
+            elif c in "{[":
+                self._stack.append(_Frame(c, i, frame.child_path()))
+            elif c in "}]":
+                closed = self._stack.pop()
+                if not self._stack:
+                    self._root_closed = True
+                else:
+                    self._end_value(self._stack[-1], closed.start, i + 1)
+            elif c == ",":
+                if frame.kind == "{":
+                    frame.state = "key"
+                else:
+                    frame.index += 1
+                    frame.state = "value"
+            elif c == ":":
+                frame.state = "value"
+            elif frame.literal_start is None and frame.state == "value":
+                frame.literal_start = i
+        self._pos = len(buffer)
+
+    def _end_string(self, end: int):
+        frame = self._stack[-1]
+        raw = self.buffer[self._string_start:end + 1]
+        if self._string_is_key:
+            try:
+                frame.key = json.loads(raw)
+            except json.JSONDecodeError:
+                frame.key = raw.strip('"')
+            frame.state = "colon"
+        else:
+            self._end_value(frame, self._string_start, end + 1)
+
+    def _end_value(self, frame: _Frame, start: int, end: int):
+        path = frame.child_path()
+        frame.state = "after"
+        if len(path) == 1 and path[0] not in ARRAY_KEYS:
+            value = self._load(start, end)
+            if value is not None:
+                self.payload[path[0]] = value
+                self._events.append((path[0], {"value": value}))
+        elif len(path) == 2 and path[0] in ARRAY_KEYS:
+            value = self._load(start, end)
+            if value is not None:
+                items = self.payload[path[0]]
+                items.append(value)
+                self._events.append((ITEM_EVENTS[path[0]], {"index": len(items) - 1, "value": value}))
+
+    def _load(self, start: int, end: int):
+        try:
+            return json.loads(self.buffer[start:end])
+        except json.JSONDecodeError:
+            self.skipped += 1
+            logger.warning(f"Skipping malformed value in notes output: {self.buffer[start:end][:80]!r}")
+            return None
+
+
+def parse_notes(text: str) -> dict:
+    """Parse a complete /notes generation, recovering what it can from malformed output."""
+    try:
+        payload = json.loads(text)
+        if isinstance(payload, dict):
+            return payload
+    except json.JSONDecodeError:
+        pass
+    parser = NotesStreamParser()
+    parser.feed(text)
+    return parser.finish()
+
+
+def stream_notes_response(tokens: AsyncIterator[str], quiz=None) -> StreamingResponse:
+    """
+    Relay /notes over SSE as its parts complete:
+
+        event: notes_markdown   data: {"value": "..."}
+        event: summary_bullet   data: {"index": 0, "value": "..."}
+        event: quiz_item        data: {"index": 0, "value": {...}}
+        event: done             data: {...the /notes payload...}
+
+    plus web_link and charts_embedded. If the generation fails part-way, done
+    carries whatever was recovered; an error event is sent only when nothing
+    arrived at all.
+
+    quiz, a quiz_engine.ShardedQuiz, generates the questions alongside the
+    notes; its questions are sent as they are accepted and replace any quiz in
+    the notes output.
+    """
+    async def events():
+        parser = NotesStreamParser()
+        started = time.monotonic()
+        received = False
+        questions: list[dict] = []
+        queue: asyncio.Queue = asyncio.Queue()
+        producers = [asyncio.create_task(_drain("notes", tokens, queue))]
+        if quiz is not None:
+            producers.append(asyncio.create_task(_drain("quiz", quiz.questions(), queue)))
+        running = len(producers)
+        try:
+            while running:
+                source, kind, value = await queue.get()
+                if kind == "end":
+                    running -= 1
+                elif kind == "error":
+                    detail = value.detail if isinstance(value, HTTPException) else str(value)
+                    if source == "quiz":
+                        logger.warning(f"Quiz generation failed alongside notes stream: {detail}")
+                    elif not received:
+                        status = value.status_code if isinstance(value, HTTPException) else 500
+                        yield sse_event("error", {"status": status, "detail": detail})
+                        return
+                    else:
+                        logger.warning(f"Notes stream failed part-way, sending recovered output: {detail}")
+                elif source == "quiz":
+                    questions.append(value)
+                    yield sse_event("quiz_item", {"index": len(questions) - 1, "value": value})
+                else:
+                    if not received:
+                        received = True
+                        llm_client.record_first_token("notes", time.monotonic() - started)
+                    for event, data in parser.feed(value):
+                        if quiz is None or event != "quiz_item":
+                            yield sse_event(event, data)
+        finally:
+            for producer in producers:
+                producer.cancel()
+
+        payload = parser.finish()
+        if quiz is not None:
+            payload["quiz"] = questions
+            payload["quiz_generation"] = quiz.report()
+            if "recovered" in payload:
+                payload["recovered"]["quiz_count"] = len(questions)
+        logger.info(f"Notes streamed. Quiz count: {len(payload['quiz'])}")
+        yield sse_event("done", payload)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _drain(source: str, items: AsyncIterator, queue: asyncio.Queue):
+    """Move one producer's items onto the shared queue, then an error (if any) and an end marker."""
+    try:
+        async for item in items:
+            await queue.put((source, "item", item))
+    except Exception as e:
+        await queue.put((source, "error", e))
+    finally:
+        queue.put_nowait((source, "end", None))
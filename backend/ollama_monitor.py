@@ -0,0 +1,141 @@
+"""
+Background Ollama availability monitor.
+
+LLM endpoints used to GET /api/tags before every call to check the model was
+pulled, adding a round-trip (and up to a 2 s stall when Ollama was down) to
+each request. The monitor refreshes the tag list in the background instead and
+endpoints read its cached snapshot. It refreshes every OLLAMA_REFRESH_INTERVAL
+seconds while Ollama is healthy, every OLLAMA_RETRY_INTERVAL seconds while it
+isn't, and immediately after an Ollama call fails.
+
+Configuration (environment variables):
+    OLLAMA_REFRESH_INTERVAL  seconds between refreshes while available (default 30)
+    OLLAMA_RETRY_INTERVAL    seconds between refreshes while unavailable (default 5)
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+
+import httpx
+
+from llm_client import list_ollama_models, llm_client
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_REFRESH_INTERVAL = float(os.getenv("OLLAMA_REFRESH_INTERVAL", "30"))
+OLLAMA_RETRY_INTERVAL = float(os.getenv("OLLAMA_RETRY_INTERVAL", "5"))
+
+# How long a request waits for the very first refresh after startup
+_FIRST_REFRESH_TIMEOUT = 2.0
+# Failure-triggered refreshes are coalesced to at most one per this many seconds
+_MIN_REFRESH_GAP = 1.0
+
+
+class OllamaMonitor:
+    """Cached snapshot of Ollama's state and pulled models."""
+
+    def __init__(
+        self,
+        refresh_interval: float = OLLAMA_REFRESH_INTERVAL,
+        retry_interval: float = OLLAMA_RETRY_INTERVAL,
+    ):
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        # "unknown" until the first refresh, then "available", "no_models",
+        # "error" (Ollama answered with an HTTP error) or "unavailable"
+        self.status = "unknown"
+        self.models: list[str] = []
+        self.last_refresh: Optional[float] = None
+        self.last_success: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.refreshes = 0
+        self.transitions: deque = deque(maxlen=20)
+        self._first_refresh = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            llm_client.on_ollama_failure = self.request_refresh
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def request_refresh(self):
+        """Refresh as soon as possible, e.g. after an Ollama call failed."""
+        self._wake.set()
+
+    async def has_model(self, model_name: str) -> bool:
+        """Whether the cached tag list has the model (exact or partial match, e.g. llama3.1:latest)."""
+        if not self._first_refresh.is_set():
+            try:
+                await asyncio.wait_for(self._first_refresh.wait(), _FIRST_REFRESH_TIMEOUT)
+            except asyncio.TimeoutError:
+                return False
+        found = any(model_name in model or model in model_name for model in self.models)
+        if not found:
+            # The model may have been pulled since the last refresh
+            self.request_refresh()
+        return found
+
+    def snapshot(self) -> dict:
+        return {
+            "status": self.status,
+            "models": self.models,
+            "last_refresh": self.last_refresh,
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+            "refreshes": self.refreshes,
+            "transitions": list(self.transitions),
+        }
+
+    async def refresh(self):
+        try:
+            models = await list_ollama_models()
+            status = "available" if models else "no_models"
+            self.models = models
+            self.last_success = time.time()
+            self.last_error = None
+        except httpx.HTTPStatusError as e:
+            status = "error"
+            self.last_error = str(e)
+        except Exception as e:
+            status = "unavailable"
+            self.last_error = str(e) or type(e).__name__
+        if status not in ("available", "no_models"):
+            self.models = []
+        self.refreshes += 1
+        self.last_refresh = time.time()
+        self._set_status(status)
+        self._first_refresh.set()
+
+    def _set_status(self, status: str):
+        if status == self.status:
+            return
+        logger.info(f"Ollama status {self.status} -> {status}")
+        self.transitions.append({"from": self.status, "to": status, "at": time.time()})
+        self.status = status
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            interval = self.refresh_interval if self.status == "available" else self.retry_interval
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+                await asyncio.sleep(_MIN_REFRESH_GAP)
+            except asyncio.TimeoutError:
+                pass
+
+
+ollama_monitor = OllamaMonitor()
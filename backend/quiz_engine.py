@@ -0,0 +1,322 @@
+"""
+Sharded quiz generation.
+
+Asking one completion for 50 quiz questions was the slowest part of /notes:
+the questions come out one after another, the reply often hit max_tokens
+before the quiz was done, and long quizzes repeated themselves. ShardedQuiz
+splits the quiz instead:
+
+- The transcript is cut into sections (long_transcript.chunk_paragraphs) and
+  each shard asks for QUIZ_SHARD_QUESTIONS questions about one section. The
+  shards run concurrently. When there are more shards than sections, the
+  shards sharing a section are each given a different focus (definitions,
+  examples, ...).
+- Questions are accepted as shards finish, skipping malformed items and
+  near-duplicates. Two questions are duplicates when their normalised text is
+  equal or their word 3-shingles overlap by QUIZ_DUPLICATE_SIMILARITY or more
+  (Jaccard).
+- If duplicates or failed shards leave the quiz short, up to QUIZ_TOPUP_ROUNDS
+  further rounds ask the sections that have contributed least for the
+  shortfall, listing the questions they already have.
+
+The generator only needs a `complete(system_prompt, prompt)` coroutine, so
+/quiz runs it on Ollama and /notes on the OpenRouter provider pool.
+
+Configuration (environment variables):
+    QUIZ_SHARD_QUESTIONS       questions asked of each shard (default 5)
+    QUIZ_SHARD_CONCURRENCY     shards in flight per Ollama quiz (default OLLAMA_MAX_CONCURRENCY);
+                               /notes quizzes go through OpenRouter and use OPENROUTER_MAX_CONCURRENCY
+    QUIZ_SECTION_TOKENS        largest section a shard is given (default LLM_CHUNK_TOKENS)
+    QUIZ_DUPLICATE_SIMILARITY  shingle overlap at which questions are duplicates (default 0.6)
+    QUIZ_TOPUP_ROUNDS          extra rounds to make up a shortfall (default 2)
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+
+from lecture_prompts import quiz_shard_prompt
+from llm_client import OLLAMA_MAX_CONCURRENCY, call_ollama
+from long_transcript import LLM_CHUNK_TOKENS, chunk_paragraphs, estimate_tokens
+from notes_stream import parse_notes
+from segmentation import paragraphize_text
+
+logger = logging.getLogger(__name__)
+
+QUIZ_SHARD_QUESTIONS = int(os.getenv("QUIZ_SHARD_QUESTIONS", "5"))
+QUIZ_SHARD_CONCURRENCY = int(os.getenv("QUIZ_SHARD_CONCURRENCY", str(OLLAMA_MAX_CONCURRENCY)))
+QUIZ_SECTION_TOKENS = int(os.getenv("QUIZ_SECTION_TOKENS", str(LLM_CHUNK_TOKENS)))
+QUIZ_DUPLICATE_SIMILARITY = float(os.getenv("QUIZ_DUPLICATE_SIMILARITY", "0.6"))
+QUIZ_TOPUP_ROUNDS = int(os.getenv("QUIZ_TOPUP_ROUNDS", "2"))
+
+# Given in turn to shards that share a section, so they don't all ask the same things
+FOCUSES = (
+    "the key concepts and their definitions",
+    "how and why things work (mechanisms, causes, reasoning)",
+    "examples, applications and worked problems",
+    "comparisons, differences and relationships between ideas",
+    "specific facts, numbers, names and results",
+)
+
+# Existing questions listed in a top-up prompt, per section
+_MAX_AVOID = 25
+# Sections aren't cut smaller than this, so a short lecture isn't split mid-paragraph
+_MIN_SECTION_TOKENS = 400
+
+# (system_prompt, prompt) -> reply text
+Complete = Callable[[str, str], Awaitable[str]]
+
+
+def normalise_question(question: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", question.lower()).split())
+
+
+def _shingles(normalised: str) -> frozenset:
+    words = normalised.split()
+    if len(words) < 3:
+        return frozenset([tuple(words)])
+    return frozenset(tuple(words[i:i + 3]) for i in range(len(words) - 2))
+
+
+class QuestionSet:
+    """Accepted questions, rejecting exact and near duplicates."""
+
+    def __init__(self, similarity: float = QUIZ_DUPLICATE_SIMILARITY):
+        self.similarity = similarity
+        self.questions: list[dict] = []
+        self._seen: set[int] = set()
+        self._shingles: list[frozenset] = []
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def add(self, item: dict) -> bool:
+        normalised = normalise_question(item["question"])
+        digest = hash(normalised)
+        shingles = _shingles(normalised)
+        if digest in self._seen or any(
+            len(shingles & other) / len(shingles | other) >= self.similarity for other in self._shingles
+        ):
+            self.duplicates += 1
+            return False
+        self._seen.add(digest)
+        self._shingles.append(shingles)
+        self.questions.append(item)
+        return True
+
+
+def clean_question(item) -> Optional[dict]:
+    """A quiz object in the shape the frontend expects, or None if it can't be used."""
+    if not isinstance(item, dict):
+        return None
+    question = item.get("question")
+    options = item.get("options")
+    answer = item.get("answer")
+    if isinstance(options, list):
+        options = {letter: option for letter, option in zip("ABCD", options)}
+    if not isinstance(question, str) or not question.strip() or not isinstance(options, dict) or len(options) < 2:
+        return None
+    if not isinstance(answer, str) or not answer.strip():
+        return None
+    answer = answer.strip()
+    # "B) Carnot cycle" or "b" -> "B"
+    if answer[:1].upper() in options and (len(answer) == 1 or not answer[1:2].isalnum()):
+        answer = answer[:1].upper()
+    return {
+        "question": question.strip(),
+        "options": {str(letter): str(option) for letter, option in options.items()},
+        "answer": answer,
+        "explanation": str(item.get("explanation") or "").strip(),
+    }
+
+
+def parse_shard(text: str) -> list:
+    """Quiz items from a shard reply: a {"quiz": [...]} object, a bare array, or whatever of either parsed."""
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        value = None
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        return value.get("quiz") or []
+    start = text.find("[")
+    if start != -1 and (text.find("{") == -1 or start < text.find("{")):
+        # A bare array that didn't parse; let the object parser recover its items
+        text = '{"quiz": ' + text[start:]
+    return parse_notes(text)["quiz"]
+
+
+def quiz_sections(text: str, count: int, paragraphs: Optional[list[str]] = None) -> list[str]:
+    """Split the transcript into about one section per shard, none over QUIZ_SECTION_TOKENS."""
+    shards = max(1, math.ceil(count / max(1, QUIZ_SHARD_QUESTIONS)))
+    target = min(QUIZ_SECTION_TOKENS, max(_MIN_SECTION_TOKENS, math.ceil(estimate_tokens(text) / shards)))
+    return chunk_paragraphs(paragraphs or paragraphize_text(text), max_tokens=target) or [text]
+
+
+class ShardedQuiz:
+    """One quiz request: iterate questions() for unique questions as the shards produce them."""
+
+    def __init__(
+        self,
+        text: str,
+        count: int,
+        complete: Complete,
+        title: str = "Lecture",
+        paragraphs: Optional[list[str]] = None,
+        concurrency: int = QUIZ_SHARD_CONCURRENCY,
+    ):
+        self.count = max(1, count)
+        self.complete = complete
+        self.title = title
+        self.sections = quiz_sections(text, self.count, paragraphs)
+        self.slots = asyncio.Semaphore(max(1, concurrency))
+        self.accepted = QuestionSet()
+        # Section each accepted question came from
+        self._origin: list[int] = []
+        self.shards = 0
+        self.failed_shards = 0
+        self.invalid = 0
+        self.rounds = 0
+        self.shard_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.last_error: Optional[Exception] = None
+
+    async def questions(self) -> AsyncIterator[dict]:
+        started = time.monotonic()
+        try:
+            plan = self._plan(self.count, top_up=False)
+            while plan:
+                self.rounds += 1
+                round_items = self._run_round(plan)
+                try:
+                    async for item in round_items:
+                        yield item
+                        if len(self.accepted) >= self.count:
+                            return
+                finally:
+                    await round_items.aclose()
+                if self.rounds > QUIZ_TOPUP_ROUNDS:
+                    break
+                plan = self._plan(self.count - len(self.accepted), top_up=True)
+        finally:
+            self.wall_seconds = time.monotonic() - started
+
+        if len(self.accepted) >= self.count:
+            return
+        if not self.accepted.questions and self.last_error is not None:
+            if isinstance(self.last_error, HTTPException):
+                raise self.last_error
+            raise HTTPException(status_code=502, detail=f"Quiz generation failed: {self.last_error}")
+        logger.warning(f"Sharded quiz came up short: {len(self.accepted)}/{self.count} after {self.rounds} round(s)")
+
+    async def collect(self) -> list[dict]:
+        questions = [item async for item in self.questions()]
+        logger.info(f"Sharded quiz for '{self.title}': {self.report()}")
+        return questions
+
+    def _plan(self, shortfall: int, top_up: bool) -> list[tuple[int, int, str]]:
+        """(section index, questions, focus) for each shard of a round."""
+        sections = len(self.sections)
+        shards = math.ceil(shortfall / max(1, QUIZ_SHARD_QUESTIONS))
+        if top_up:
+            # Sections that have contributed least first
+            contributed = [self._origin.count(index) for index in range(sections)]
+            order = sorted(range(sections), key=lambda index: (contributed[index], index))
+        else:
+            # Every section gets a shard, as long as there are questions to go round
+            shards = max(shards, min(sections, shortfall))
+            if shards >= sections:
+                order = list(range(sections))
+            else:
+                order = [index * sections // shards for index in range(shards)]
+
+        plan = []
+        for shard in range(shards):
+            section = order[shard % len(order)]
+            questions = shortfall // shards + (1 if shard < shortfall % shards else 0)
+            if top_up:
+                # Top-ups run into duplicates more often; one spare each saves another round
+                questions += 1
+            focus = FOCUSES[(shard // len(order) + self.rounds) % len(FOCUSES)]
+            if questions:
+                plan.append((section, questions, focus))
+        return plan
+
+    async def _run_round(self, plan: list[tuple[int, int, str]]) -> AsyncIterator[dict]:
+        tasks = [asyncio.create_task(self._shard(section, questions, focus)) for section, questions, focus in plan]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    section, items = await next_done
+                except Exception as e:
+                    self.failed_shards += 1
+                    self.last_error = e
+                    logger.warning(f"Quiz shard failed: {e.detail if isinstance(e, HTTPException) else e}")
+                    continue
+                for raw in items:
+                    item = clean_question(raw)
+                    if item is None:
+                        self.invalid += 1
+                    elif self.accepted.add(item):
+                        self._origin.append(section)
+                        yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _shard(self, section: int, questions: int, focus: str) -> tuple[int, list]:
+        avoid = [
+            item["question"] for item, origin in zip(self.accepted.questions, self._origin) if origin == section
+        ][-_MAX_AVOID:]
+        system_prompt, prompt = quiz_shard_prompt(self.sections[section], self.title, questions, focus, avoid)
+        async with self.slots:
+            self.shards += 1
+            started = time.monotonic()
+            try:
+                reply = await self.complete(system_prompt, prompt)
+            finally:
+                self.shard_seconds += time.monotonic() - started
+        return section, parse_shard(reply)
+
+    def report(self) -> dict:
+        return {
+            "requested": self.count,
+            "generated": len(self.accepted),
+            "sections": len(self.sections),
+            "shards": self.shards,
+            "failed_shards": self.failed_shards,
+            "rounds": self.rounds,
+            "duplicates_removed": self.accepted.duplicates,
+            "invalid_removed": self.invalid,
+            "wall_seconds": round(self.wall_seconds, 2),
+            # Summed shard call time, i.e. the wall-clock time of running the shards one at a time
+            "sequential_seconds": round(self.shard_seconds, 2),
+        }
+
+
+def ollama_complete(model: str) -> Complete:
+    """Shard calls through call_ollama, for /quiz."""
+    async def complete(system_prompt: str, prompt: str) -> str:
+        return await call_ollama(prompt, model, system=system_prompt)
+    return complete
+
+
+async def generate_sharded_quiz(
+    text: str,
+    count: int,
+    complete: Complete,
+    title: str = "Lecture",
+    paragraphs: Optional[list[str]] = None,
+) -> tuple[list[dict], dict]:
+    """Run a sharded quiz to the end; returns the questions and the generation report."""
+    quiz = ShardedQuiz(text, count, complete, title=title, paragraphs=paragraphs)
+    questions = await quiz.collect()
+    return questions, quiz.report()
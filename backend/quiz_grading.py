@@ -0,0 +1,223 @@
+"""
+Grading a whole quiz submission at once.
+
+/quiz/validate checks one answer per request with a full model round-trip,
+sending the reference text every time, so a 50-question quiz cost 50 remote
+calls. grade_quiz() takes the whole submission:
+
+- A multiple-choice answer is graded locally, with no model call, when the
+  question carries its answer key (the "answer" of a generated quiz item).
+  The answer may be given as the option letter ("B", "b)", "B) text") or as
+  the option's text.
+- Everything else (free-text answers, or answers that can't be matched to an
+  option) is graded by the model. Those are packed into as few prompts as
+  possible, each holding up to QUIZ_GRADE_BATCH_SIZE answers and about
+  QUIZ_GRADE_BATCH_TOKENS tokens, with the reference text included once per
+  prompt. The batches run concurrently.
+
+Answers missing from a batch reply are sent once more in a batch of their
+own. Any still missing are returned ungraded ("correct": null).
+
+Configuration (environment variables):
+    QUIZ_GRADE_BATCH_SIZE    answers per grading prompt at most (default 25)
+    QUIZ_GRADE_BATCH_TOKENS  target prompt size, reference text included (default LLM_SINGLE_PROMPT_TOKENS)
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Optional
+
+from fastapi import HTTPException
+
+from long_transcript import LLM_SINGLE_PROMPT_TOKENS, estimate_tokens
+from quiz_engine import Complete, normalise_question
+
+logger = logging.getLogger(__name__)
+
+QUIZ_GRADE_BATCH_SIZE = int(os.getenv("QUIZ_GRADE_BATCH_SIZE", "25"))
+QUIZ_GRADE_BATCH_TOKENS = int(os.getenv("QUIZ_GRADE_BATCH_TOKENS", str(LLM_SINGLE_PROMPT_TOKENS)))
+
+GRADE_SYSTEM_PROMPT = """You are a precise quiz validator.
+You grade students' answers against the reference text and, where given, the expected answer.
+Accept answers that are correct in substance even if worded differently.
+Return ONLY valid JSON, no prose, no extra text."""
+
+# "B", "b)", "(B)", "B." or "B: text", but not "A cat"
+_LETTER = re.compile(r"^\(?([A-Za-z])(?:\)|\.|:|$)")
+
+
+def _choice(answer: str, options: Optional[dict[str, str]]) -> Optional[str]:
+    """The option key an answer picks, or None if it doesn't pick one."""
+    text = answer.strip()
+    if not options:
+        # Without the options only a bare letter can be matched
+        letter = text.strip("().:")
+        return letter.upper() if len(letter) == 1 and letter.isalpha() else None
+    keys = {str(key).strip().upper(): key for key in options}
+    match = _LETTER.match(text)
+    if match and match.group(1).upper() in keys:
+        return keys[match.group(1).upper()]
+    normalised = normalise_question(text)
+    for key, option in options.items():
+        if normalised and normalised == normalise_question(str(option)):
+            return key
+    return None
+
+
+def grade_locally(answer: str, correct_answer: Optional[str], options: Optional[dict[str, str]]) -> Optional[bool]:
+    """True or False when the answer key settles it, None when the model has to judge."""
+    if not correct_answer or not answer.strip():
+        return None
+    expected = _choice(correct_answer, options)
+    chosen = _choice(answer, options)
+    if expected is not None and chosen is not None:
+        return chosen == expected
+    expected_text = options.get(expected) if options and expected is not None else correct_answer
+    if normalise_question(answer) in (normalise_question(correct_answer), normalise_question(str(expected_text))):
+        return True
+    return None
+
+
+def _expected(item: dict) -> Optional[str]:
+    correct_answer = item.get("correct_answer")
+    options = item.get("options") or {}
+    if not correct_answer:
+        return None
+    key = _choice(correct_answer, options)
+    return f"{key}) {options[key]}" if key in options else correct_answer
+
+
+def _batches(pending: list[int], items: list[dict], reference_text: str) -> list[list[int]]:
+    """Split the answers needing the model into as few prompts as the size limits allow."""
+    budget = QUIZ_GRADE_BATCH_TOKENS - estimate_tokens(reference_text)
+    batches: list[list[int]] = []
+    current: list[int] = []
+    size = 0
+    for index in pending:
+        item_size = estimate_tokens(_describe(index, items[index]))
+        if current and (len(current) >= QUIZ_GRADE_BATCH_SIZE or size + item_size > budget):
+            batches.append(current)
+            current, size = [], 0
+        current.append(index)
+        size += item_size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _describe(index: int, item: dict) -> str:
+    lines = [f"[{index}] Question: {item['question']}"]
+    if item.get("options"):
+        lines += [f"    {key}) {option}" for key, option in item["options"].items()]
+    expected = _expected(item)
+    if expected:
+        lines.append(f"    Expected answer: {expected}")
+    lines.append(f"    Student answer: {item['answer']}")
+    return "\n".join(lines)
+
+
+def grade_prompt(indices: list[int], items: list[dict], reference_text: str) -> str:
+    answers = "\n\n".join(_describe(index, items[index]) for index in indices)
+    reference = f"Reference Text:\n{reference_text}\n\n" if reference_text.strip() else ""
+    return f"""{reference}Grade each student answer below.
+
+{answers}
+
+Return a JSON array with one object per answer, in any order:
+[{{"id": <number in brackets>, "verdict": "correct" or "incorrect", "explanation": "one concise sentence"}}]"""
+
+
+def _parse_verdicts(text: str) -> dict[int, dict]:
+    """id -> {"correct", "explanation"} from a grading reply; unparseable entries are left out."""
+    start, end = text.find("["), text.rfind("]")
+    entries = []
+    if start != -1 and end > start:
+        try:
+            entries = json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            # Salvage whole objects from a truncated or malformed array
+            for match in re.finditer(r"\{[^{}]*\}", text[start:]):
+                try:
+                    entries.append(json.loads(match.group(0)))
+                except json.JSONDecodeError:
+                    continue
+    verdicts = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.get("id"))
+        except (TypeError, ValueError):
+            continue
+        verdict = str(entry.get("verdict", "")).strip().lower()
+        if verdict not in ("correct", "incorrect"):
+            continue
+        verdicts[index] = {"correct": verdict == "correct", "explanation": str(entry.get("explanation") or "").strip()}
+    return verdicts
+
+
+async def grade_quiz(items: list[dict], reference_text: str, complete: Complete) -> dict:
+    """
+    Grade every answer. items are dicts with question, answer and optionally
+    options and correct_answer; results come back in the same order.
+    """
+    started = time.monotonic()
+    results: list[dict] = []
+    pending: list[int] = []
+    for index, item in enumerate(items):
+        correct = grade_locally(item["answer"], item.get("correct_answer"), item.get("options"))
+        if correct is None:
+            pending.append(index)
+            results.append({"index": index, "correct": None, "explanation": "", "graded_by": None})
+        else:
+            expected = _expected(item)
+            results.append({
+                "index": index,
+                "correct": correct,
+                "explanation": item.get("explanation") or (f"The correct answer is {expected}." if expected else ""),
+                "graded_by": "answer_key",
+            })
+
+    sent_to_model = len(pending)
+    calls = 0
+    errors: list[str] = []
+
+    async def grade_batch(indices: list[int]) -> dict[int, dict]:
+        nonlocal calls
+        calls += 1
+        try:
+            reply = await complete(GRADE_SYSTEM_PROMPT, grade_prompt(indices, items, reference_text))
+        except HTTPException as e:
+            errors.append(str(e.detail))
+            logger.warning(f"Quiz grading batch of {len(indices)} failed: {e.detail}")
+            return {}
+        return {index: verdict for index, verdict in _parse_verdicts(reply).items() if index in indices}
+
+    for attempt in range(2):
+        if not pending:
+            break
+        graded: dict[int, dict] = {}
+        for verdicts in await asyncio.gather(*(grade_batch(batch) for batch in _batches(pending, items, reference_text))):
+            graded.update(verdicts)
+        for index, verdict in graded.items():
+            results[index].update(verdict, graded_by="model")
+        pending = [index for index in pending if index not in graded]
+
+    if pending and len(pending) == sent_to_model and errors:
+        # The model graded nothing at all
+        raise HTTPException(status_code=502, detail=f"Quiz grading failed: {errors[-1]}")
+
+    report = {
+        "score": sum(1 for result in results if result["correct"]),
+        "total": len(results),
+        "graded_locally": len(results) - sent_to_model,
+        "graded_by_model": sent_to_model - len(pending),
+        "ungraded": len(pending),
+        "llm_calls": calls,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    logger.info(f"Graded quiz submission: {report}")
+    return {"results": results, **report}
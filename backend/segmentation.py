@@ -0,0 +1,170 @@
+"""
+Text segmentation helpers shared by the transcription and AI servers.
+Kept free of Whisper imports so main_ai_only.py can use it too.
+
+paragraphize_text() groups plain text into runs of a fixed number of
+sentences. Transcripts are paragraphed by ParagraphSegmenter instead, which
+takes Whisper segments one at a time as they are decoded, so the paragraphs
+are ready as soon as the last segment is (and live transcription can send
+each paragraph as it closes). It breaks at a sentence boundary when the
+signals for a new paragraph add up:
+
+- a pause: a gap of PARAGRAPH_PAUSE_S or more between segments counts fully,
+  half of that counts half;
+- a discourse marker opening the sentence ("Now, ...", "Next ...",
+  "Moving on ...", "Okay so ...");
+- a topic shift: fewer than PARAGRAPH_TOPIC_OVERLAP of the sentence's content
+  words were already used in the open paragraph.
+
+A paragraph is cut below PARAGRAPH_MIN_SENTENCES sentences only when two
+signals agree, and always cut at PARAGRAPH_MAX_SENTENCES.
+
+Configuration (environment variables):
+    PARAGRAPH_PAUSE_S          pause that on its own starts a paragraph (default 1.5)
+    PARAGRAPH_MIN_SENTENCES    fewest sentences in a paragraph (default 2)
+    PARAGRAPH_MAX_SENTENCES    most sentences in a paragraph (default 6)
+    PARAGRAPH_TOPIC_OVERLAP    content-word overlap below which a sentence is a topic shift (default 0.15)
+"""
+import os
+import re
+from typing import Optional
+
+PARAGRAPH_PAUSE_S = float(os.getenv("PARAGRAPH_PAUSE_S", "1.5"))
+PARAGRAPH_MIN_SENTENCES = int(os.getenv("PARAGRAPH_MIN_SENTENCES", "2"))
+PARAGRAPH_MAX_SENTENCES = int(os.getenv("PARAGRAPH_MAX_SENTENCES", "6"))
+PARAGRAPH_TOPIC_OVERLAP = float(os.getenv("PARAGRAPH_TOPIC_OVERLAP", "0.15"))
+
+# Common English and filler words, left out of keyword matching
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being between both but by
+can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or
+other our ours out over own same she should so some such than that the their theirs them then there these
+they this those through to too under until up very was we were what when where which while who whom why
+will with would you your yours um uh like okay so yeah right gonna
+""".split())
+
+_SPACE_BEFORE_PUNCTUATION = re.compile(r"\s+(?=[.,!?;:])")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+_CONTENT_WORD = re.compile(r"[a-z][a-z'-]{2,}")
+_DISCOURSE_MARKER = re.compile(
+    r"^(?:now|next|so now|okay so|ok so|alright|all right|moving on|let's move on|let's turn|"
+    r"turning to|another thing|the next|finally|to summarize|in summary|so far)\b",
+    re.IGNORECASE,
+)
+_SENTENCE_END = (".", "!", "?")
+# Text without sentence punctuation is cut at a segment boundary past this many words
+_MAX_UNPUNCTUATED_WORDS = 80
+
+
+def split_sentences(text: str) -> list[str]:
+    """Sentences of text, with stray spaces before punctuation removed."""
+    text = _SPACE_BEFORE_PUNCTUATION.sub("", text)
+    return [sentence.strip() for sentence in _SENTENCE_BREAK.split(text) if sentence.strip()]
+
+
+def paragraphize_text(text: str, sentences_per_paragraph: int = 4) -> list[str]:
+    """
+    Split transcribed text into paragraphs.
+    Groups sentences together for better readability.
+    """
+    sentences = split_sentences(text)
+    return [
+        " ".join(sentences[i:i + sentences_per_paragraph])
+        for i in range(0, len(sentences), sentences_per_paragraph)
+    ]
+
+
+class ParagraphSegmenter:
+    """Paragraph breaks placed incrementally from a stream of transcript segments."""
+
+    def __init__(
+        self,
+        pause: float = PARAGRAPH_PAUSE_S,
+        min_sentences: int = PARAGRAPH_MIN_SENTENCES,
+        max_sentences: int = PARAGRAPH_MAX_SENTENCES,
+        topic_overlap: float = PARAGRAPH_TOPIC_OVERLAP,
+    ):
+        self.pause = pause
+        self.min_sentences = max(1, min_sentences)
+        self.max_sentences = max(self.min_sentences, max_sentences)
+        self.topic_overlap = topic_overlap
+        self.paragraphs: list[str] = []
+        self._sentences: list[str] = []
+        self._vocabulary: set[str] = set()  # content words of the open paragraph
+        # Start of a sentence that hasn't ended yet, and the pause before it
+        self._pending = ""
+        self._pending_pause = 0.0
+        self._last_end: Optional[float] = None
+
+    def feed(self, text: str, start: Optional[float] = None, end: Optional[float] = None) -> list[str]:
+        """Add the next segment; returns the paragraphs it completed."""
+        pause = start - self._last_end if start is not None and self._last_end is not None else 0.0
+        if end is not None:
+            self._last_end = end
+        text = text.strip()
+        if not text:
+            return []
+        completed = len(self.paragraphs)
+
+        if self._pending:
+            text = f"{self._pending} {text}"
+        else:
+            self._pending_pause = pause
+        sentences = _SENTENCE_BREAK.split(_SPACE_BEFORE_PUNCTUATION.sub("", text))
+        self._pending = sentences.pop()
+        if self._pending.endswith(_SENTENCE_END) or len(self._pending.split()) > _MAX_UNPUNCTUATED_WORDS:
+            sentences.append(self._pending)
+            self._pending = ""
+        for sentence in sentences:
+            if sentence:
+                self._add_sentence(sentence, self._pending_pause)
+                # Later sentences started inside this segment, not after a pause
+                self._pending_pause = 0.0
+        return self.paragraphs[completed:]
+
+    def flush(self) -> list[str]:
+        """End of the transcript: close the last paragraph and return what that completed."""
+        completed = len(self.paragraphs)
+        if self._pending:
+            self._add_sentence(self._pending, self._pending_pause)
+            self._pending = ""
+        if self._sentences:
+            self._close()
+        return self.paragraphs[completed:]
+
+    def _add_sentence(self, sentence: str, pause: float):
+        words = {word for word in _CONTENT_WORD.findall(sentence.lower()) if word not in STOPWORDS}
+        if self._sentences and self._breaks_before(sentence, words, pause):
+            self._close()
+        self._sentences.append(sentence)
+        self._vocabulary |= words
+        if len(self._sentences) >= self.max_sentences:
+            self._close()
+
+    def _breaks_before(self, sentence: str, words: set[str], pause: float) -> bool:
+        score = 0.0
+        if pause >= self.pause:
+            score += 1.0
+        elif pause >= self.pause / 2:
+            score += 0.5
+        if _DISCOURSE_MARKER.match(sentence):
+            score += 0.6
+        if len(words) >= 3:
+            if len(words & self._vocabulary) / len(words) < self.topic_overlap:
+                score += 0.5
+        return score >= (1.0 if len(self._sentences) >= self.min_sentences else 1.5)
+
+    def _close(self):
+        self.paragraphs.append(" ".join(self._sentences))
+        self._sentences = []
+        self._vocabulary = set()
+
+
+def paragraphize_segments(segments: list[dict]) -> list[str]:
+    """Paragraphs for a finished list of segments (start, end, text)."""
+    segmenter = ParagraphSegmenter()
+    for segment in segments:
+        segmenter.feed(segment["text"], segment.get("start"), segment.get("end"))
+    segmenter.flush()
+    return segmenter.paragraphs
@@ -0,0 +1,140 @@
+"""
+Single-flight deduplication of identical LLM generations.
+
+When a class opens the same shared lecture, dozens of identical /notes or
+/summarize requests arrive before the first generation could fill the
+response cache. The first caller for a key starts the generation in a task of
+its own; callers arriving while it runs attach to it instead of starting
+another. Streaming consumers replay the tokens produced so far and then
+follow the live stream; non-streaming consumers wait for the full text. A
+consumer that leaves (e.g. its client disconnected) detaches without
+affecting the others, and the generation is cancelled once nobody is left.
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One generation in progress and the consumers attached to it."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.tokens: list[str] = []
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.consumers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def append(self, token: str):
+        self.tokens.append(token)
+        self._notify()
+
+    def finish(self, text: Optional[str] = None, error: Optional[BaseException] = None):
+        if not self.result.done():
+            if error is None:
+                self.result.set_result(text)
+            elif isinstance(error, asyncio.CancelledError):
+                self.result.cancel()
+            else:
+                self.result.set_exception(error)
+                # Consumers re-raise it; don't also log it as never retrieved
+                self.result.exception()
+        self._notify()
+
+    async def changed(self):
+        await self._changed.wait()
+
+    def _notify(self):
+        # Wake everyone waiting on the current event and start a fresh one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class SingleFlight:
+    """Registry of in-progress generations keyed by the response cache key."""
+
+    def __init__(self):
+        self._flights: dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def call(self, key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """Return the text of the generation for key, starting it if none is in flight."""
+        flight = self._join(key, lambda flight: self._run(flight, generate))
+        try:
+            return await asyncio.shield(flight.result)
+        finally:
+            self._leave(flight)
+
+    async def stream(self, key: str, generate: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Yield the tokens of the generation for key, starting it if none is in flight."""
+        flight = self._join(key, lambda flight: self._pump(flight, generate()))
+        try:
+            sent = 0
+            while True:
+                while sent < len(flight.tokens):
+                    yield flight.tokens[sent]
+                    sent += 1
+                if flight.result.done():
+                    # Raises the generation's error, or CancelledError if it was abandoned
+                    flight.result.result()
+                    return
+                await flight.changed()
+        finally:
+            self._leave(flight)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "consumers": sum(flight.consumers for flight in self._flights.values()),
+        }
+
+    def _join(self, key: str, start: Callable[[_Flight], Awaitable[None]]) -> _Flight:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(key)
+            flight.task = asyncio.create_task(start(flight))
+            self._flights[key] = flight
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced LLM call onto in-flight generation {key[:12]} ({flight.consumers + 1} consumers)")
+        flight.consumers += 1
+        return flight
+
+    def _leave(self, flight: _Flight):
+        flight.consumers -= 1
+        if flight.consumers == 0 and not flight.task.done():
+            # Nobody is waiting any more; free the backend slot
+            self._forget(flight)
+            flight.task.cancel()
+
+    def _forget(self, flight: _Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    async def _run(self, flight: _Flight, generate: Callable[[], Awaitable[str]]):
+        try:
+            text = await generate()
+            flight.append(text)
+            flight.finish(text)
+        except BaseException as e:
+            flight.finish(error=e)
+        finally:
+            self._forget(flight)
+
+    async def _pump(self, flight: _Flight, tokens: AsyncIterator[str]):
+        try:
+            async for token in tokens:
+                flight.append(token)
+            flight.finish("".join(flight.tokens).strip())
+        except BaseException as e:
+            flight.finish(error=e)
+        finally:
+            self._forget(flight)
+            await tokens.aclose()
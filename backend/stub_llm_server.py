@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Stub LLM server standing in for Ollama and OpenRouter during tests.
+
+It serves Ollama's /api/tags, /api/generate and /api/embed and OpenRouter's
+/v1/chat/completions (streaming and non-streaming) with canned text, and lets
+you make individual API keys fail or hang, so failover, circuit breakers,
+hedging and scheduling can be exercised without a model or network access.
+
+Run it, then point the backend at it:
+    python stub_llm_server.py
+    OLLAMA_HOST=http://localhost:8090 \\
+    OPENROUTER_API_URL=http://localhost:8090/v1/chat/completions \\
+    python main_ai_only.py
+
+Behaviour, including the canned "reply" text, can be changed while it runs:
+    curl -X POST localhost:8090/stub/config -H 'Content-Type: application/json' \\
+         -d '{"fail_keys": ["*"], "slow_keys": [], "latency": 0.2}'
+
+Configuration (environment variables, initial values):
+    STUB_PORT          port to listen on (default 8090)
+    STUB_LATENCY       seconds before each answer (default 0.5)
+    STUB_SLOW_LATENCY  seconds before answering a slow key (default 60)
+    STUB_FAIL_KEYS     comma-separated OpenRouter keys answered with 503, "*" for all
+    STUB_SLOW_KEYS     comma-separated OpenRouter keys answered after STUB_SLOW_LATENCY
+    STUB_OLLAMA_DOWN   "1" to answer Ollama calls with 503
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+
+REPLY = "1. First key point of the lecture.\n2. Second key point of the lecture."
+# Width of the stub's embedding vectors
+EMBED_DIMENSIONS = 64
+
+
+def _keys(name: str) -> list[str]:
+    return [key.strip() for key in os.getenv(name, "").split(",") if key.strip()]
+
+
+class StubConfig(BaseModel):
+    latency: float = float(os.getenv("STUB_LATENCY", "0.5"))
+    slow_latency: float = float(os.getenv("STUB_SLOW_LATENCY", "60"))
+    fail_keys: list[str] = _keys("STUB_FAIL_KEYS")
+    slow_keys: list[str] = _keys("STUB_SLOW_KEYS")
+    ollama_down: bool = os.getenv("STUB_OLLAMA_DOWN", "0") == "1"
+    models: list[str] = ["llama3.1:latest"]
+    reply: str = REPLY
+
+
+class StubConfigUpdate(BaseModel):
+    latency: Optional[float] = None
+    slow_latency: Optional[float] = None
+    fail_keys: Optional[list[str]] = None
+    slow_keys: Optional[list[str]] = None
+    ollama_down: Optional[bool] = None
+    models: Optional[list[str]] = None
+    reply: Optional[str] = None
+
+
+app = FastAPI(title="ClassNote AI - Stub LLM Server")
+config = StubConfig()
+calls = {"ollama": 0, "openrouter": 0}
+
+def _matches(key: str, keys: list[str]) -> bool:
+    return "*" in keys or key in keys
+
+
+def _tokens(text: str) -> list[str]:
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+
+@app.get("/stub/config")
+def get_config():
+    return {**config.model_dump(), "calls": calls}
+
+
+@app.post("/stub/config")
+def update_config(update: StubConfigUpdate):
+    global config
+    config = config.model_copy(update=update.model_dump(exclude_none=True))
+    return config
+
+
+@app.get("/api/tags")
+def ollama_tags():
+    if config.ollama_down:
+        return JSONResponse(status_code=503, content={"error": "stub: ollama down"})
+    return {"models": [{"name": name} for name in config.models]}
+
+
+@app.post("/api/generate")
+async def ollama_generate(body: dict):
+    calls["ollama"] += 1
+    if config.ollama_down:
+        return JSONResponse(status_code=503, content={"error": "stub: ollama down"})
+    if body.get("stream"):
+        async def ndjson():
+            for token in _tokens(config.reply):
+                await asyncio.sleep(config.latency / 10)
+                yield json.dumps({"response": token, "done": False}) + "\n"
+            yield json.dumps({"response": "", "done": True}) + "\n"
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    await asyncio.sleep(config.latency)
+    return {"model": body.get("model"), "response": config.reply, "done": True}
+
+
+def _embedding(text: str) -> list[float]:
+    """Hashed bag of words, so texts sharing words get similar vectors."""
+    vector = [0.0] * EMBED_DIMENSIONS
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % EMBED_DIMENSIONS] += 1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+@app.post("/api/embed")
+async def ollama_embed(body: dict):
+    calls["ollama"] += 1
+    if config.ollama_down:
+        return JSONResponse(status_code=503, content={"error": "stub: ollama down"})
+    texts = body.get("input") or []
+    if isinstance(texts, str):
+        texts = [texts]
+    return {"model": body.get("model"), "embeddings": [_embedding(text) for text in texts]}
+
+
+@app.post("/v1/chat/completions")
+async def openrouter_chat(body: dict, request: Request):
+    calls["openrouter"] += 1
+    key = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if _matches(key, config.fail_keys):
+        await asyncio.sleep(config.latency)
+        return JSONResponse(status_code=503, content={"error": {"message": "stub: provider unavailable"}})
+    delay = config.slow_latency if _matches(key, config.slow_keys) else config.latency
+
+    if body.get("stream"):
+        async def sse():
+            yield ": OPENROUTER PROCESSING\n\n"
+            await asyncio.sleep(delay)
+            for token in _tokens(config.reply):
+                yield "data: " + json.dumps({"choices": [{"delta": {"content": token}}]}) + "\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(sse(), media_type="text/event-stream")
+    await asyncio.sleep(delay)
+    return {"model": body.get("model"), "choices": [{"message": {"role": "assistant", "content": config.reply}}]}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.getenv("STUB_PORT", "8090"))
+    print(f"🧪 Starting stub LLM server on port {port}...")
+    uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,171 @@
+"""
+Content-addressed cache of /transcribe responses.
+
+Entries are keyed by a hash of the decoded PCM plus everything that changes
+the output (model, compute type, VAD and decoding options), so re-uploading
+the same recording, even re-encoded in another container, skips Whisper
+entirely. Responses are stored zlib-compressed in SQLite with least-recently-
+used eviction once the total exceeds the size budget. Hit/miss counters live
+in the same database so they stay correct when transcription runs in worker
+processes.
+
+Configuration (environment variables):
+    TRANSCRIPT_CACHE_DIR     directory for cache.db (default data/cache)
+    TRANSCRIPT_CACHE_MAX_MB  size budget for stored responses (default 512, 0 disables)
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_CACHE_DIR = os.getenv(
+    "TRANSCRIPT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache")
+)
+TRANSCRIPT_CACHE_MAX_MB = float(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "512"))
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS transcripts (
+        key TEXT PRIMARY KEY,
+        payload BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS transcripts_lru ON transcripts (last_access)",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+]
+
+
+def transcript_cache_key(audio: np.ndarray, settings: dict) -> str:
+    """Hash of the decoded audio and the settings that shape the transcript."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """Size-bounded LRU store of transcription responses."""
+
+    def __init__(self, cache_dir: str = TRANSCRIPT_CACHE_DIR, max_bytes: int = int(TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)):
+        self.db_path = os.path.join(cache_dir, "cache.db")
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM transcripts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            data = zlib.decompress(row[0])
+            conn.execute("UPDATE transcripts SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._count(conn, "hits")
+            self._count(conn, "bytes_served", len(data))
+        return json.loads(data)
+
+    def put(self, key: str, result: dict):
+        payload = zlib.compress(json.dumps(result).encode("utf-8"))
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts (key, payload, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._evict(conn)
+
+    def purge(self, key: Optional[str] = None) -> int:
+        """Delete one entry, or everything when key is None. Returns entries removed."""
+        with self._connect() as conn:
+            if key is None:
+                cursor = conn.execute("DELETE FROM transcripts")
+            else:
+                cursor = conn.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            removed = cursor.rowcount
+        if key is None:
+            with self._connect() as conn:
+                conn.execute("VACUUM")
+        return removed
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        hits = counters.get("hits", 0)
+        misses = counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "bytes_served": counters.get("bytes_served", 0),
+        }
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM transcripts ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._count(conn, "evictions", evicted)
+        logger.info(f"Transcript cache evicted {evicted} entries")
+
+    @staticmethod
+    def _count(conn, name: str, amount: int = 1):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+
+_cache: Optional[TranscriptCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_transcript_cache() -> Optional[TranscriptCache]:
+    """Process-wide cache instance, or None when caching is disabled."""
+    global _cache
+    if TRANSCRIPT_CACHE_MAX_MB <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranscriptCache()
+        return _cache
@@ -0,0 +1,96 @@
+"""
+Transcript encodings.
+
+Transcripts are built with segments as a list of dicts (the original
+/transcribe shape) and, when word timestamps are requested, words as parallel
+arrays: one list each for start, end, text and probability plus the index of
+the segment every word belongs to. A 90-minute lecture has ~15k words, and
+parallel arrays avoid both a Python dict per word while transcribing and the
+repeated keys in the JSON payload.
+
+Response formats (?response_format= on /transcribe and /jobs/{id}/result):
+    json      segments as a list of objects (default, unchanged)
+    columnar  segments as parallel arrays too
+    msgpack   the columnar layout as application/msgpack
+"""
+import json
+
+import msgpack
+
+TRANSCRIPT_FORMATS = ("json", "columnar", "msgpack")
+
+_MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+class WordColumns:
+    """Word timestamps accumulated straight into parallel arrays."""
+
+    __slots__ = ("start", "end", "text", "probability", "segment")
+
+    def __init__(self):
+        self.start: list[float] = []
+        self.end: list[float] = []
+        self.text: list[str] = []
+        self.probability: list[float] = []
+        self.segment: list[int] = []
+
+    def add(self, words, segment: int, offset: float = 0.0, not_before: float = 0.0):
+        """
+        Append faster-whisper Word objects of one segment, shifted by offset
+        seconds. Words starting before not_before (audio already covered by
+        the previous segment) are skipped.
+        """
+        if words and offset + words[0].start < not_before:
+            words = [w for w in words if offset + w.start >= not_before]
+        if not words:
+            return
+        if offset:
+            # faster-whisper rounds to 10 ms; keep that after shifting
+            self.start.extend(round(offset + w.start, 2) for w in words)
+            self.end.extend(round(offset + w.end, 2) for w in words)
+        else:
+            self.start.extend(w.start for w in words)
+            self.end.extend(w.end for w in words)
+        self.text.extend(w.word.strip() for w in words)
+        self.probability.extend(round(w.probability, 3) for w in words)
+        self.segment.extend([segment] * len(words))
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def to_dict(self) -> dict:
+        return {
+            "start": self.start,
+            "end": self.end,
+            "text": self.text,
+            "probability": self.probability,
+            "segment": self.segment,
+        }
+
+
+def segments_to_columns(seg_list: list[dict]) -> dict:
+    """List-of-dicts segments as parallel start/end/text arrays."""
+    return {
+        "start": [s["start"] for s in seg_list],
+        "end": [s["end"] for s in seg_list],
+        "text": [s["text"] for s in seg_list],
+    }
+
+
+def encode_transcript(result: dict, fmt: str = "json") -> tuple[bytes, str]:
+    """Encode a /transcribe result; returns (body, media_type)."""
+    if fmt not in TRANSCRIPT_FORMATS:
+        raise ValueError(f"response_format must be one of {', '.join(TRANSCRIPT_FORMATS)}")
+    if fmt != "json" and isinstance(result["segments"], list):
+        result = {**result, "segments": segments_to_columns(result["segments"])}
+    if fmt == "msgpack":
+        # 32-bit floats are plenty for 10 ms timestamps and halve the float payload
+        body = msgpack.packb(result, use_bin_type=True, use_single_float=True)
+    else:
+        # Same compact separators as JSONResponse
+        body = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, _MEDIA_TYPES[fmt]
@@ -0,0 +1,365 @@
+"""
+Full-text search across every transcribed lecture.
+
+Transcripts used to be returned by /transcribe and forgotten, so there was
+nothing to search a semester of lectures with. Each finished transcript is
+now added to a persistent inverted index in SQLite, segment by segment, and
+GET /search returns the best-matching segments of all lectures with their
+lecture id, timestamps and a highlighted snippet (escaped HTML).
+
+Ranking is BM25, but the index is laid out so that query time doesn't grow
+with the corpus. SQLite FTS5 scores every matching row before it can sort,
+which for a common word over thousands of lecture-hours is hundreds of
+thousands of rows per query. Instead:
+
+- Each posting stores the term's BM25 term-frequency component for its
+  segment (quantised to 0-255), and the postings table is clustered by
+  (term, impact descending). The best postings of a term are therefore the
+  first rows of its range.
+- A query reads at most SEARCH_CANDIDATES postings per term, weights them by
+  the term's current IDF, and sums them per segment. When every term's list
+  is shorter than that, the ranking is exact BM25 (reported as
+  "exhaustive"); otherwise the segments scoring highest on some term are
+  ranked, which for top-k is what matters.
+- Segment length is normalised against the lecture's own average, so a
+  lecture's postings depend only on that lecture. That keeps ingest
+  incremental: adding, replacing or deleting a lecture touches its own rows
+  and the document frequencies of its terms, nothing else.
+
+Configuration (environment variables):
+    SEARCH_DB_PATH            SQLite file for the index (default data/search/search.db)
+    SEARCH_INDEX_TRANSCRIPTS  "0" stops /transcribe and jobs feeding the index (default "1")
+    SEARCH_CANDIDATES         postings read per query term (default 2000)
+    SEARCH_SNIPPET_WORDS      words of context in a snippet (default 24)
+    SEARCH_MMAP_MB            index read through a memory map up to this size (default 4096, 0 disables)
+"""
+import heapq
+import html
+import logging
+import math
+import os
+import re
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Optional
+
+from lecture_index import check_lecture_id, format_timestamp, segment_rows, tokenize
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DB_PATH = os.getenv(
+    "SEARCH_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "search", "search.db")
+)
+SEARCH_INDEX_TRANSCRIPTS = os.getenv("SEARCH_INDEX_TRANSCRIPTS", "1") == "1"
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "2000"))
+SEARCH_SNIPPET_WORDS = int(os.getenv("SEARCH_SNIPPET_WORDS", "24"))
+SEARCH_MMAP_MB = int(os.getenv("SEARCH_MMAP_MB", "4096"))
+
+# BM25 parameters (the usual defaults)
+_K1 = 1.2
+_B = 0.75
+# Impacts are stored as tf-component / (k1 + 1) scaled to a byte
+_IMPACT_SCALE = 255
+# Terms per IN (...) lookup, well under SQLite's variable limit
+_LOOKUP_CHUNK = 500
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS lectures (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        duration REAL,
+        segments INTEGER NOT NULL,
+        indexed_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS segments (
+        id INTEGER PRIMARY KEY,
+        lecture_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        start REAL,
+        end REAL,
+        text TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS segments_lecture ON segments (lecture_id, seq)",
+    """
+    CREATE TABLE IF NOT EXISTS terms (
+        id INTEGER PRIMARY KEY,
+        term TEXT NOT NULL UNIQUE,
+        df INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS postings (
+        term_id INTEGER NOT NULL,
+        impact INTEGER NOT NULL,
+        segment_id INTEGER NOT NULL,
+        PRIMARY KEY (term_id, impact DESC, segment_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO counters (name, value) VALUES ('segments', 0)",
+]
+
+_WORD = re.compile(r"\S+")
+_TERM = re.compile(r"[a-z0-9]+")
+
+
+def _impacts(texts: list[str]) -> list[dict[str, int]]:
+    """Quantised BM25 term-frequency components per segment, normalised by the lecture's average length."""
+    counts = [Counter(tokenize(text)) for text in texts]
+    lengths = [sum(count.values()) for count in counts]
+    avgdl = max(1.0, sum(lengths) / max(1, len(lengths)))
+    impacts = []
+    for count, length in zip(counts, lengths):
+        norm = _K1 * (1 - _B + _B * length / avgdl)
+        impacts.append({
+            term: max(1, round(tf / (tf + norm) * _IMPACT_SCALE)) for term, tf in count.items()
+        })
+    return impacts
+
+
+def highlight(text: str, terms: set[str], words: int = SEARCH_SNIPPET_WORDS) -> str:
+    """
+    The text around its first matching word as escaped HTML, with matching
+    words wrapped in <mark>.
+    """
+    tokens = _WORD.findall(text)
+    marked = []
+    first = None
+    for i, token in enumerate(tokens):
+        if terms.intersection(_TERM.findall(token.lower())):
+            marked.append(f"<mark>{html.escape(token)}</mark>")
+            if first is None:
+                first = i
+        else:
+            marked.append(html.escape(token))
+    if len(marked) <= words:
+        return " ".join(marked)
+    start = max(0, min((first or 0) - words // 3, len(marked) - words))
+    snippet = " ".join(marked[start:start + words])
+    return ("… " if start else "") + snippet + (" …" if start + words < len(marked) else "")
+
+
+class TranscriptSearchIndex:
+    """Persistent impact-ordered inverted index over the segments of every indexed lecture."""
+
+    def __init__(self, db_path: str = SEARCH_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Queries read pages straight from the OS page cache instead of copying them into a fresh connection's cache
+        conn.execute(f"PRAGMA mmap_size={SEARCH_MMAP_MB * 1024 * 1024}")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_lecture(self, lecture_id: str, title: str, segments, duration: Optional[float] = None) -> dict:
+        """Index a lecture's segments, replacing the lecture if it was indexed before."""
+        check_lecture_id(lecture_id)
+        started = time.monotonic()
+        rows = [row for row in segment_rows(segments) if str(row.get("text") or "").strip()]
+        texts = [str(row["text"]).strip() for row in rows]
+        impacts = _impacts(texts)
+        with self._connect() as conn:
+            replaced = self._remove(conn, lecture_id)
+            conn.execute(
+                "INSERT INTO lectures (id, title, duration, segments, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (lecture_id, title, duration, len(rows), time.time()),
+            )
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'segments'", (len(rows),))
+            segment_ids = []
+            for seq, (row, text) in enumerate(zip(rows, texts)):
+                cursor = conn.execute(
+                    "INSERT INTO segments (lecture_id, seq, start, end, text) VALUES (?, ?, ?, ?, ?)",
+                    (lecture_id, seq, row.get("start"), row.get("end"), text),
+                )
+                segment_ids.append(cursor.lastrowid)
+
+            df = Counter(term for segment in impacts for term in segment)
+            conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", ((term,) for term in df))
+            term_ids = self._term_ids(conn, list(df))
+            conn.executemany("UPDATE terms SET df = df + ? WHERE id = ?", ((df[term], term_ids[term]) for term in df))
+            # In key order, so the inserts walk the postings B-tree instead of jumping around it
+            conn.executemany(
+                "INSERT INTO postings (term_id, impact, segment_id) VALUES (?, ?, ?)",
+                sorted(
+                    (
+                        (term_ids[term], impact, segment_id)
+                        for segment_id, segment in zip(segment_ids, impacts)
+                        for term, impact in segment.items()
+                    ),
+                    key=lambda posting: (posting[0], -posting[1], posting[2]),
+                ),
+            )
+        report = {
+            "lecture_id": lecture_id,
+            "title": title,
+            "segments": len(rows),
+            "terms": len(df),
+            "postings": sum(len(segment) for segment in impacts),
+            "replaced": replaced,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        logger.info(f"Search index: added lecture {lecture_id} ({len(rows)} segments) in {report['seconds']}s")
+        return report
+
+    def delete_lecture(self, lecture_id: str) -> bool:
+        check_lecture_id(lecture_id)
+        with self._connect() as conn:
+            return self._remove(conn, lecture_id)
+
+    def _remove(self, conn: sqlite3.Connection, lecture_id: str) -> bool:
+        """Delete a lecture's rows; its postings are recomputed from its stored segments to find them."""
+        if conn.execute("DELETE FROM lectures WHERE id = ?", (lecture_id,)).rowcount == 0:
+            return False
+        stored = conn.execute(
+            "SELECT id, text FROM segments WHERE lecture_id = ? ORDER BY seq", (lecture_id,)
+        ).fetchall()
+        impacts = _impacts([row["text"] for row in stored])
+        df = Counter(term for segment in impacts for term in segment)
+        term_ids = self._term_ids(conn, list(df))
+        conn.executemany(
+            "DELETE FROM postings WHERE term_id = ? AND impact = ? AND segment_id = ?",
+            (
+                (term_ids[term], impact, row["id"])
+                for row, segment in zip(stored, impacts)
+                for term, impact in segment.items()
+            ),
+        )
+        conn.executemany("UPDATE terms SET df = df - ? WHERE id = ?", ((df[term], term_ids[term]) for term in df))
+        conn.execute("DELETE FROM segments WHERE lecture_id = ?", (lecture_id,))
+        conn.execute("UPDATE counters SET value = value - ? WHERE name = 'segments'", (len(stored),))
+        return True
+
+    @staticmethod
+    def _term_ids(conn: sqlite3.Connection, terms: list[str]) -> dict[str, int]:
+        ids = {}
+        for i in range(0, len(terms), _LOOKUP_CHUNK):
+            chunk = terms[i:i + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            for row in conn.execute(f"SELECT id, term FROM terms WHERE term IN ({placeholders})", chunk):
+                ids[row["term"]] = row["id"]
+        return ids
+
+    def search(self, query: str, k: int = 10, lecture_id: Optional[str] = None) -> dict:
+        """The k best segments for the query across all lectures, or within one."""
+        started = time.monotonic()
+        if lecture_id is not None:
+            check_lecture_id(lecture_id)
+        terms = set(tokenize(query))
+        k = max(1, min(k, 100))
+        with self._connect() as conn:
+            total = conn.execute("SELECT value FROM counters WHERE name = 'segments'").fetchone()[0]
+            found = {}
+            for i in range(0, len(terms), _LOOKUP_CHUNK):
+                chunk = list(terms)[i:i + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                for row in conn.execute(
+                    f"SELECT id, term, df FROM terms WHERE term IN ({placeholders}) AND df > 0", chunk
+                ):
+                    found[row["term"]] = (row["id"], row["df"])
+
+            lecture_postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+            if lecture_id is not None:
+                # One lecture is small enough to score in full from its own segments
+                stored = conn.execute(
+                    "SELECT id, text FROM segments WHERE lecture_id = ? ORDER BY seq", (lecture_id,)
+                ).fetchall()
+                for row, segment in zip(stored, _impacts([row["text"] for row in stored])):
+                    for term in terms.intersection(segment):
+                        lecture_postings[term].append((row["id"], segment[term]))
+
+            scores: dict[int, float] = defaultdict(float)
+            exhaustive = True
+            for term, (term_id, df) in found.items():
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                weight = idf * (_K1 + 1) / _IMPACT_SCALE
+                if lecture_id is None:
+                    postings = conn.execute(
+                        "SELECT segment_id, impact FROM postings WHERE term_id = ? "
+                        "ORDER BY impact DESC, segment_id LIMIT ?",
+                        (term_id, SEARCH_CANDIDATES),
+                    ).fetchall()
+                    if len(postings) >= SEARCH_CANDIDATES:
+                        exhaustive = False
+                else:
+                    postings = lecture_postings.get(term, [])
+                for segment_id, impact in postings:
+                    scores[segment_id] += weight * impact
+
+            best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+            rows = {}
+            if best:
+                placeholders = ",".join("?" * len(best))
+                for row in conn.execute(
+                    "SELECT s.id, s.lecture_id, s.seq, s.start, s.end, s.text, l.title FROM segments s "
+                    f"JOIN lectures l ON l.id = s.lecture_id WHERE s.id IN ({placeholders})",
+                    [segment_id for segment_id, _ in best],
+                ):
+                    rows[row["id"]] = row
+
+        hits = []
+        for segment_id, score in best:
+            row = rows.get(segment_id)
+            if row is None:
+                continue
+            hits.append({
+                "lecture_id": row["lecture_id"],
+                "title": row["title"],
+                "segment": row["seq"],
+                "start": row["start"],
+                "end": row["end"],
+                "timestamp": format_timestamp(row["start"]) if row["start"] is not None else None,
+                "score": round(score, 4),
+                "snippet": highlight(row["text"], terms),
+            })
+        seconds = time.monotonic() - started
+        self.queries += 1
+        self.query_seconds += seconds
+        return {
+            "query": query,
+            "hits": hits,
+            "candidates": len(scores),
+            "exhaustive": exhaustive,
+            "seconds": round(seconds, 4),
+        }
+
+    def lectures(self) -> list[dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM lectures ORDER BY indexed_at DESC").fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            lectures, segments, hours = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(segments), 0), COALESCE(SUM(duration), 0) / 3600 FROM lectures"
+            ).fetchone()
+            terms = conn.execute("SELECT COUNT(*) FROM terms WHERE df > 0").fetchone()[0]
+        return {
+            "lectures": lectures,
+            "segments": segments,
+            "lecture_hours": round(hours, 1),
+            "terms": terms,
+            "db_bytes": os.path.getsize(self.db_path),
+            "queries": self.queries,
+            "avg_query_ms": round(1000 * self.query_seconds / self.queries, 2) if self.queries else None,
+        }
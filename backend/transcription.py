@@ -0,0 +1,212 @@
+"""
+Transcription pipeline: upload bytes in, /transcribe response payload out.
+
+These are plain module-level functions taking the model registry as their
+first argument so they can run on the executor's thread pool or be pickled
+into a worker process by transcription_executor.
+"""
+import logging
+from typing import Callable, Optional
+
+from audio_ingest import SAMPLE_RATE, decode_audio_bytes
+from long_audio import (
+    LONG_AUDIO_CHUNK_S,
+    LONG_AUDIO_MAX_CHUNK_S,
+    lease_model_pool,
+    transcribe_long_audio,
+    use_parallel,
+)
+from segmentation import ParagraphSegmenter, paragraphize_segments
+from transcript_cache import get_transcript_cache, transcript_cache_key
+from transcript_format import WordColumns
+
+logger = logging.getLogger(__name__)
+
+# Options passed to WhisperModel.transcribe for uploads; part of the cache key
+WHISPER_OPTIONS = {
+    "vad_filter": True,  # Voice Activity Detection for better segmentation
+    "word_timestamps": False,
+}
+
+
+ProgressCallback = Callable[[float, float], None]
+
+
+def build_transcript(
+    segments,
+    info,
+    on_progress: Optional[ProgressCallback] = None,
+    word_timestamps: bool = False,
+) -> dict:
+    """
+    Collect Whisper segments into the /transcribe JSON response.
+    Segments are generated lazily, so on_progress(processed_seconds, duration)
+    fires as decoding actually advances through the audio, and paragraph
+    breaks are placed as each segment arrives.
+    """
+    seg_list = []
+    segmenter = ParagraphSegmenter()
+    
+    if on_progress:
+        on_progress(0.0, float(info.duration))
+    
+    for s in segments:
+        seg = {
+            "start": float(s.start),
+            "end": float(s.end),
+            "text": s.text.strip()
+        }
+        if s.words:
+            seg["_words"] = (0.0, s.words)
+        seg_list.append(seg)
+        segmenter.feed(seg["text"], seg["start"], seg["end"])
+        if on_progress:
+            on_progress(float(s.end), float(info.duration))
+    segmenter.flush()
+    
+    return assemble_transcript(
+        seg_list,
+        language=info.language,
+        language_probability=float(info.language_probability),
+        duration=float(info.duration),
+        word_timestamps=word_timestamps,
+        paragraphs=segmenter.paragraphs
+    )
+
+
+def assemble_transcript(
+    seg_list: list[dict],
+    language: str,
+    language_probability: float,
+    duration: float,
+    word_timestamps: bool = False,
+    paragraphs: Optional[list[str]] = None,
+) -> dict:
+    """
+    Build the /transcribe response from already-collected segment dicts.
+    Segments may carry Whisper's words as "_words": (offset, words); those are
+    moved into columnar "words" arrays. Paragraphs are segmented from seg_list
+    unless the caller already did so while decoding.
+    """
+    words = WordColumns()
+    for i, seg in enumerate(seg_list):
+        raw_words = seg.pop("_words", None)
+        if raw_words is not None:
+            offset, word_list = raw_words
+            words.add(word_list, i, offset, not_before=seg["start"])
+    
+    # Join and format text
+    full_text = " ".join(s["text"] for s in seg_list)
+    
+    # Create paragraphs
+    if paragraphs is None:
+        paragraphs = paragraphize_segments(seg_list)
+    
+    logger.info(f"Transcription complete: {len(seg_list)} segments, {len(paragraphs)} paragraphs")
+    
+    result = {
+        "text": full_text.strip(),
+        "paragraphs": paragraphs,
+        "segments": seg_list,
+        "metadata": {
+            "language": language,
+            "language_probability": language_probability,
+            "duration": duration
+        }
+    }
+    if word_timestamps:
+        result["words"] = words.to_dict()
+    return result
+
+
+def transcribe_upload(
+    registry,
+    raw: bytes,
+    on_progress: Optional[ProgressCallback] = None,
+    mode: str = "auto",
+    model_size: Optional[str] = None,
+    compute_type: Optional[str] = None,
+    word_timestamps: bool = False,
+) -> dict:
+    """
+    Decode an upload and transcribe it. Blocking; run it off the event loop.
+    mode is "single", "parallel" (long-audio chunking) or "auto" (by duration).
+    model_size/compute_type default to the registry's default model.
+    word_timestamps adds a columnar "words" section (see transcript_format).
+    """
+    model_size = model_size or registry.default_model
+    compute_type = compute_type or registry.default_compute_type
+    
+    # Decode any container format to 16 kHz mono PCM in memory
+    audio = decode_audio_bytes(raw)
+    duration = len(audio) / SAMPLE_RATE
+    parallel = use_parallel(mode, duration)
+    
+    whisper_options = {**WHISPER_OPTIONS, "word_timestamps": word_timestamps}
+    settings = {"model": model_size, "compute_type": compute_type, **whisper_options}
+    if parallel:
+        settings["chunking"] = {"chunk_s": LONG_AUDIO_CHUNK_S, "max_chunk_s": LONG_AUDIO_MAX_CHUNK_S}
+    
+    cache = get_transcript_cache()
+    cache_key = transcript_cache_key(audio, settings) if cache else None
+    if cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Transcript cache hit {cache_key}")
+            if on_progress:
+                on_progress(duration, duration)
+            return cached
+    
+    if parallel:
+        with lease_model_pool(registry, model_size, compute_type) as pool:
+            seg_list, language, probability = transcribe_long_audio(
+                audio, pool, on_progress, word_timestamps=word_timestamps
+            )
+        result = assemble_transcript(seg_list, language, probability, duration, word_timestamps)
+    else:
+        with registry.acquire(model_size, compute_type) as model:
+            logger.info(f"Starting transcription with {model_size}/{compute_type}...")
+            segments, info = model.transcribe(audio, **whisper_options)
+            # Segments are decoded lazily, so keep the lease while consuming them
+            result = build_transcript(segments, info, on_progress, word_timestamps)
+    
+    if cache:
+        result["metadata"]["cache_key"] = cache_key
+        cache.put(cache_key, result)
+    
+    return result
+
+
+def transcribe_window(
+    registry,
+    audio,
+    offset: float,
+    model_size: Optional[str] = None,
+    compute_type: Optional[str] = None,
+) -> dict:
+    """
+    Transcribe one window of a live recording.
+    Segment times are shifted by offset (seconds) onto the recording's timeline.
+    """
+    seg_list = []
+    with registry.acquire(model_size, compute_type) as model:
+        segments, info = model.transcribe(
+            audio,
+            vad_filter=True,
+            word_timestamps=False
+        )
+        
+        for s in segments:
+            text = s.text.strip()
+            if text:
+                seg_list.append({
+                    "start": offset + float(s.start),
+                    "end": offset + float(s.end),
+                    "text": text
+                })
+    
+    return {
+        "segments": seg_list,
+        "language": info.language,
+        "language_probability": float(info.language_probability)
+    }
@@ -0,0 +1,173 @@
+"""
+Transcription executor.
+
+Runs audio decoding and Whisper inference off the event loop in a thread or
+process pool, behind a bounded queue. When the queue is full, submit() raises
+QueueFullError with a Retry-After estimate instead of letting work pile up.
+
+Configuration (environment variables):
+    TRANSCRIBE_EXECUTOR    "thread" (default) or "process"
+    TRANSCRIBE_WORKERS     number of concurrent transcriptions (default 1)
+    TRANSCRIBE_QUEUE_SIZE  jobs allowed to wait for a worker (default 8)
+"""
+import asyncio
+import functools
+import logging
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KIND = os.getenv("TRANSCRIBE_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "1"))
+EXECUTOR_QUEUE_SIZE = int(os.getenv("TRANSCRIBE_QUEUE_SIZE", "8"))
+
+# Model registry owned by each worker process (process mode only)
+_worker_registry = None
+
+
+def _init_process_worker(warm_models: list[tuple[str, str]], registry_options: dict):
+    """Create a private model registry per worker process and warm it."""
+    global _worker_registry
+    from model_registry import ModelRegistry
+    _worker_registry = ModelRegistry(**registry_options)
+    _worker_registry.warm(warm_models)
+    logger.info(f"Worker {os.getpid()} ready")
+
+
+def _run_in_worker(fn: Callable, *args, **kwargs):
+    return fn(_worker_registry, *args, **kwargs)
+
+
+class QueueFullError(Exception):
+    """Raised when the transcription queue has no room for another job."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Transcription queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TranscriptionExecutor:
+    """
+    Bounded executor for blocking transcription work.
+
+    Jobs are callables taking a ModelRegistry as their first argument. In
+    thread mode they share the registry passed in here; in process mode each
+    worker has its own registry, so jobs must be picklable module-level
+    functions.
+    """
+
+    def __init__(
+        self,
+        registry=None,
+        kind: str = EXECUTOR_KIND,
+        workers: int = EXECUTOR_WORKERS,
+        max_queue: int = EXECUTOR_QUEUE_SIZE,
+        warm_models: Optional[list[tuple[str, str]]] = None,
+        registry_options: Optional[dict] = None,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        if kind == "thread" and registry is None:
+            raise ValueError("Thread executor needs a model registry")
+
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._registry = registry
+
+        if kind == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+                initargs=(warm_models or [], registry_options or {}),
+            )
+        else:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="transcribe",
+            )
+
+        # All counters below are only touched from the event loop thread
+        self._slots = asyncio.Semaphore(self.workers)
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+        self._avg_job_seconds: Optional[float] = None
+        self._started_at = time.monotonic()
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending - self._running
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up, from the average job time."""
+        avg = self._avg_job_seconds or 30.0
+        waves = (self.queue_depth + 1) / self.workers
+        return max(1, math.ceil(avg * waves))
+
+    async def submit(self, fn: Callable, *args, **kwargs):
+        """Run fn(registry, *args, **kwargs) on a worker and return its result."""
+        if self._pending >= self.capacity:
+            self._rejected += 1
+            raise QueueFullError(self.retry_after())
+
+        self._pending += 1
+        try:
+            async with self._slots:
+                self._running += 1
+                started = time.monotonic()
+                try:
+                    loop = asyncio.get_running_loop()
+                    if self.kind == "process":
+                        call = functools.partial(_run_in_worker, fn, *args, **kwargs)
+                    else:
+                        call = functools.partial(fn, self._registry, *args, **kwargs)
+                    result = await loop.run_in_executor(self._pool, call)
+                    self._completed += 1
+                    return result
+                except Exception:
+                    self._failed += 1
+                    raise
+                finally:
+                    elapsed = time.monotonic() - started
+                    self._running -= 1
+                    self._busy_seconds += elapsed
+                    if self._avg_job_seconds is None:
+                        self._avg_job_seconds = elapsed
+                    else:
+                        self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        """Queue depth and worker utilisation, for sizing nodes."""
+        uptime = time.monotonic() - self._started_at
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "queue_depth": self.queue_depth,
+            "utilization": round(self._running / self.workers, 3),
+            "busy_ratio": round(self._busy_seconds / (uptime * self.workers), 3) if uptime > 0 else 0.0,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "avg_job_seconds": round(self._avg_job_seconds, 3) if self._avg_job_seconds is not None else None,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -24,16 +24,75 @@ export interface TranscriptionMetadata {
   duration: number;
 }
 
+/** Word timestamps as parallel arrays; segment[i] indexes into segments. */
+export interface TranscriptionWords {
+  start: number[];
+  end: number[];
+  text: string[];
+  probability: number[];
+  segment: number[];
+}
+
 export interface TranscriptionResponse {
   text: string;
   paragraphs: string[];
   segments: TranscriptionSegment[];
+  words?: TranscriptionWords;
   metadata: TranscriptionMetadata;
+  /** Id the transcript is filed under in searchTranscripts */
+  lecture_id?: string;
+}
+
+export type LiveTranscriptionMessage =
+  | { type: "partial"; segments: TranscriptionSegment[] }
+  | { type: "final"; segments: TranscriptionSegment[]; paragraphs: string[] }
+  | ({ type: "done" } & TranscriptionResponse)
+  | { type: "error"; detail: string };
+
+export interface LiveTranscription {
+  sendChunk: (chunk: Blob) => void;
+  stop: () => void;
+  close: () => void;
+}
+
+export interface TranscriptionJob {
+  id: string;
+  status: "queued" | "running" | "completed" | "failed";
+  filename: string | null;
+  progress: {
+    processed_seconds: number;
+    duration: number | null;
+    percent: number;
+  };
+  error: string | null;
+  created_at: number;
+  updated_at: number;
+}
+
+export interface EnhancedChunk {
+  id: string;
+  /** "known": listed in knownChunks, so no text is sent back */
+  status: "known" | "cached" | "enhanced" | "failed";
+  enhanced?: string;
+  error?: string;
 }
 
 export interface EnhancedTextResponse {
-  original: string;
-  enhanced: string;
+  /** In transcript order; join their enhanced text with separator */
+  chunks: EnhancedChunk[];
+  separator: string;
+  /** Known chunk ids no longer in the transcript */
+  removed: string[];
+  /** Full enhanced text, present when no chunk was known */
+  enhanced?: string;
+  stats: {
+    chunks: number;
+    known: number;
+    cached: number;
+    enhanced: number;
+    failed: number;
+    seconds: number;
+  };
 }
 
 export interface SummaryResponse {
@@ -52,9 +111,44 @@ export interface StudyGuideResponse {
   title: string;
 }
 
+export interface QuizQuestion {
+  question: string;
+  options?: Record<string, string>;
+  answer?: string;
+  explanation?: string;
+}
+
+export interface QuizGeneration {
+  requested: number;
+  generated: number;
+  sections: number;
+  shards: number;
+  failed_shards: number;
+  rounds: number;
+  duplicates_removed: number;
+  invalid_removed: number;
+  wall_seconds: number;
+  sequential_seconds: number;
+}
+
 export interface QuizResponse {
   quiz: string;
   title: string;
+  questions?: QuizQuestion[];
+  generation?: QuizGeneration | { wall_seconds: number };
+}
+
+export interface LecturePackResponse {
+  title: string;
+  enhanced: string | null;
+  summary: string | null;
+  key_points: string[] | null;
+  study_guide: string | null;
+  quiz: string | null;
+  word_count: number;
+  paragraph_count: number;
+  timings: Record<string, number>;
+  errors: Record<string, string>;
 }
 
 export interface NotesPayload {
@@ -62,12 +156,13 @@ export interface NotesPayload {
   summary_bullets: string[];
   charts_embedded?: boolean;
   web_links?: string[];
-  quiz?: Array<{
-    question: string;
-    options?: Record<string, string>;
-    answer?: string;
-    explanation?: string;
-  }>;
+  quiz?: QuizQuestion[];
+  quiz_generation?: QuizGeneration;
+  recovered?: {
+    truncated: boolean;
+    skipped_values: number;
+    quiz_count: number;
+  };
 }
 
 export interface HealthResponse {
@@ -106,11 +201,13 @@ export async function checkApiHealth(): Promise<boolean> {
  * Transcribe audio file using the backend API
  * @param audioFile - Audio file to transcribe (Blob or File)
  * @param onProgress - Optional callback for upload progress
+ * @param lecture - Optional id and title to file the transcript under for search
  * @returns Transcription result with text, paragraphs, and segments
  */
 export async function transcribeAudio(
   audioFile: Blob | File,
-  onProgress?: (progress: number) => void
+  onProgress?: (progress: number) => void,
+  lecture?: { id?: string; title?: string }
 ): Promise<TranscriptionResponse> {
   const formData = new FormData();
   
@@ -163,11 +260,54 @@ export async function transcribeAudio(
     });
 
     // Send request
-    xhr.open("POST", `${API_URL}/transcribe`);
+    const params = new URLSearchParams();
+    if (lecture?.id) params.set("lecture_id", lecture.id);
+    if (lecture?.title) params.set("title", lecture.title);
+    const query = params.toString();
+    xhr.open("POST", `${API_URL}/transcribe${query ? `?${query}` : ""}`);
     xhr.send(formData);
   });
 }
 
+export interface TranscriptSearchHit {
+  lecture_id: string;
+  title: string;
+  segment: number;
+  start: number | null;
+  end: number | null;
+  timestamp: string | null;
+  score: number;
+  /** Segment text around the match as escaped HTML, matching words wrapped in <mark> */
+  snippet: string;
+}
+
+export interface TranscriptSearchResponse {
+  query: string;
+  hits: TranscriptSearchHit[];
+  candidates: number;
+  exhaustive: boolean;
+  seconds: number;
+}
+
+/**
+ * Search every transcribed lecture, or only lectureId, for the query.
+ */
+export async function searchTranscripts(
+  query: string,
+  options: { k?: number; lectureId?: string } = {}
+): Promise<TranscriptSearchResponse> {
+  const params = new URLSearchParams({ q: query, k: String(options.k ?? 10) });
+  if (options.lectureId) params.set("lecture_id", options.lectureId);
+  const response = await fetch(`${API_URL}/search?${params}`);
+
+  if (!response.ok) {
+    const error: ApiError = await response.json();
+    throw new Error(error.detail || error.error || "Search failed");
+  }
+
+  return response.json();
+}
+
 /**
  * Alternative fetch-based transcription (simpler but no progress tracking)
  */
@@ -195,6 +335,107 @@ export async function transcribeAudioSimple(
   return response.json();
 }
 
+/**
+ * Transcribe via the asynchronous jobs API.
+ * Uploads once, then polls the job for server-side progress instead of
+ * holding one HTTP connection open for the whole transcription.
+ * @param onProgress - Called with percent of audio processed (0-100)
+ */
+export async function transcribeAudioAsJob(
+  audioFile: Blob | File,
+  onProgress?: (progress: number) => void,
+  pollIntervalMs: number = 2000
+): Promise<TranscriptionResponse> {
+  const formData = new FormData();
+  
+  const fileName = audioFile instanceof File 
+    ? audioFile.name 
+    : "recording.webm";
+  
+  formData.append("file", audioFile, fileName);
+
+  const createResponse = await fetch(`${API_URL}/jobs/transcribe`, {
+    method: "POST",
+    body: formData,
+  });
+
+  if (!createResponse.ok) {
+    const error: ApiError = await createResponse.json();
+    throw new Error(error.detail || error.error || "Failed to start transcription");
+  }
+
+  let job: TranscriptionJob = await createResponse.json();
+
+  while (job.status === "queued" || job.status === "running") {
+    await new Promise((resolve) => setTimeout(resolve, pollIntervalMs));
+    const statusResponse = await fetch(`${API_URL}/jobs/${job.id}`);
+    if (!statusResponse.ok) {
+      throw new Error(`Failed to check transcription status (${statusResponse.status})`);
+    }
+    job = await statusResponse.json();
+    onProgress?.(job.progress.percent);
+  }
+
+  if (job.status === "failed") {
+    throw new Error(job.error || "Transcription failed");
+  }
+
+  const resultResponse = await fetch(`${API_URL}/jobs/${job.id}/result`);
+  if (!resultResponse.ok) {
+    const error: ApiError = await resultResponse.json();
+    throw new Error(error.detail || error.error || "Failed to fetch transcription");
+  }
+
+  return resultResponse.json();
+}
+
+/**
+ * Stream audio to the backend while recording.
+ * Pass MediaRecorder timeslice chunks to sendChunk(); the server pushes back
+ * partial and final segments as each VAD window finishes, and a "done"
+ * message with the full transcript after stop().
+ */
+export function startLiveTranscription(
+  onMessage: (message: LiveTranscriptionMessage) => void
+): LiveTranscription {
+  const wsUrl = API_URL.replace(/^http/, "ws") + "/ws/transcribe";
+  const socket = new WebSocket(wsUrl);
+  socket.binaryType = "arraybuffer";
+  const pending: Blob[] = [];
+
+  socket.addEventListener("open", () => {
+    pending.splice(0).forEach((chunk) => socket.send(chunk));
+  });
+
+  socket.addEventListener("message", (event) => {
+    try {
+      onMessage(JSON.parse(event.data));
+    } catch (error) {
+      console.error("Invalid live transcription message:", error);
+    }
+  });
+
+  socket.addEventListener("error", () => {
+    onMessage({ type: "error", detail: "Live transcription connection failed" });
+  });
+
+  return {
+    sendChunk: (chunk: Blob) => {
+      if (socket.readyState === WebSocket.OPEN) {
+        socket.send(chunk);
+      } else if (socket.readyState === WebSocket.CONNECTING) {
+        pending.push(chunk);
+      }
+    },
+    stop: () => {
+      if (socket.readyState === WebSocket.OPEN) {
+        socket.send(JSON.stringify({ type: "stop" }));
+      }
+    },
+    close: () => socket.close(),
+  };
+}
+
 /**
  * Generate comprehensive notes + summary + quiz from transcript (app-level API key)
  * Now calls OpenRouter directly from frontend for Vercel deployment
@@ -375,15 +616,24 @@ export async function getHealthStatus(): Promise<HealthResponse> {
 
 /**
  * Enhance transcription text using AI
- * Fixes grammar, punctuation, and improves readability
+ * Fixes grammar, punctuation, and improves readability. Pass the ids of chunks
+ * from an earlier response as knownChunks to have only new or edited chunks
+ * enhanced and sent back.
  */
-export async function enhanceTranscription(text: string): Promise<EnhancedTextResponse> {
+export async function enhanceTranscription(
+  text: string,
+  options: { paragraphs?: string[]; knownChunks?: string[] } = {}
+): Promise<EnhancedTextResponse> {
   const response = await fetch(`${API_URL}/enhance`, {
     method: "POST",
     headers: {
       "Content-Type": "application/json",
     },
-    body: JSON.stringify({ text }),
+    body: JSON.stringify({
+      text,
+      paragraphs: options.paragraphs ?? [],
+      known_chunks: options.knownChunks ?? [],
+    }),
   });
 
   if (!response.ok) {
@@ -417,6 +667,98 @@ export async function summarizeLecture(
   return response.json();
 }
 
+/**
+ * Call an LLM endpoint in streaming mode (Server-Sent Events).
+ * onToken receives text as it is generated; resolves with the same JSON the
+ * endpoint returns without streaming. Other named events (such as the parts
+ * sent by /notes) go to onEvent.
+ */
+export async function streamLLMEndpoint<T>(
+  path: string,
+  body: unknown,
+  onToken: (text: string) => void,
+  signal?: AbortSignal,
+  onEvent?: (event: string, data: any) => void
+): Promise<T> {
+  const response = await fetch(`${API_URL}${path}?stream=true`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      Accept: "text/event-stream",
+    },
+    body: JSON.stringify(body),
+    signal,
+  });
+
+  if (!response.ok || !response.body) {
+    const error: ApiError = await response.json();
+    throw new Error(error.detail || error.error || "Generation failed");
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary: number;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+
+      if (event === "token") {
+        onToken(JSON.parse(data).text);
+      } else if (event === "done") {
+        return JSON.parse(data) as T;
+      } else if (event === "error") {
+        throw new Error(JSON.parse(data).detail || "Generation failed");
+      } else if (onEvent && data) {
+        onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+
+  throw new Error("Stream ended before the response was complete");
+}
+
+export type NotesStreamEvent =
+  | { event: "notes_markdown"; value: string }
+  | { event: "summary_bullet"; index: number; value: string }
+  | { event: "web_link"; index: number; value: string }
+  | { event: "quiz_item"; index: number; value: QuizQuestion }
+  | { event: "charts_embedded"; value: boolean };
+
+/**
+ * Generate notes from the backend /notes endpoint, receiving the notes, each
+ * summary bullet and each quiz question as soon as it has been generated.
+ * Resolves with the full payload; if the generation was cut short it holds
+ * what was recovered, described by `recovered`.
+ */
+export async function streamNotes(
+  transcript: string,
+  topic: string | undefined,
+  onPart: (part: NotesStreamEvent) => void,
+  signal?: AbortSignal
+): Promise<NotesPayload> {
+  return streamLLMEndpoint<NotesPayload>(
+    "/notes",
+    { transcript, topic },
+    () => {},
+    signal,
+    (event, data) => onPart({ event, ...data } as NotesStreamEvent)
+  );
+}
+
 /**
  * Extract key points from the lecture
  */
@@ -465,14 +807,15 @@ export async function generateStudyGuide(
  */
 export async function generateQuiz(
   text: string,
-  title: string
+  title: string,
+  count: number = 10
 ): Promise<QuizResponse> {
   const response = await fetch(`${API_URL}/quiz`, {
     method: "POST",
     headers: {
       "Content-Type": "application/json",
     },
-    body: JSON.stringify({ text, title }),
+    body: JSON.stringify({ text, title, count }),
   });
 
   if (!response.ok) {
@@ -483,12 +826,166 @@ export async function generateQuiz(
   return response.json();
 }
 
+/**
+ * Generate the enhanced text, summary, key points, study guide and quiz in one
+ * request. Artifacts that failed are null and listed in `errors`.
+ */
+export async function generateLecturePack(
+  text: string,
+  title: string,
+  paragraphs: string[] = []
+): Promise<LecturePackResponse> {
+  const response = await fetch(`${API_URL}/lecture-pack`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ text, title, paragraphs }),
+  });
+
+  if (!response.ok) {
+    const error: ApiError = await response.json();
+    throw new Error(error.detail || error.error || "Lecture pack generation failed");
+  }
+
+  return response.json();
+}
+
 /**
  * Chat with the academic AI assistant
  */
+export interface QuizSubmissionAnswer {
+  question: string;
+  answer: string;
+  options?: Record<string, string>;
+  correct_answer?: string;
+  explanation?: string;
+}
+
+export interface QuizGradeResponse {
+  results: Array<{
+    index: number;
+    correct: boolean | null;
+    explanation: string;
+    graded_by: "answer_key" | "model" | null;
+  }>;
+  score: number;
+  total: number;
+  graded_locally: number;
+  graded_by_model: number;
+  ungraded: number;
+  llm_calls: number;
+  seconds: number;
+}
+
+/**
+ * Grade a whole quiz submission in one request. Multiple-choice answers with
+ * a known correct_answer are graded without an LLM call; free-text answers
+ * are graded in batches.
+ */
+export async function gradeQuiz(
+  answers: QuizSubmissionAnswer[],
+  referenceText: string = ""
+): Promise<QuizGradeResponse> {
+  const response = await fetch(`${API_URL}/quiz/grade`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ answers, reference_text: referenceText }),
+  });
+
+  if (!response.ok) {
+    const error: ApiError = await response.json();
+    throw new Error(error.detail || error.error || "Quiz grading failed");
+  }
+
+  return response.json();
+}
+
+/** A lecture passage used to answer a chat message; citation is its start time, e.g. "12:34". */
+export interface LectureCitation {
+  citation: string | null;
+  start: number | null;
+  end: number | null;
+  score: number;
+  passage: number;
+}
+
 export interface ChatResponse {
   message: string;
   sources_included: boolean;
+  session_id?: string;
+  context?: {
+    prompt_tokens: number;
+    summary_tokens: number;
+    history_tokens: number;
+    history_messages: number;
+    trimmed_messages: number;
+    retrieval_tokens?: number;
+    latency: number;
+  };
+  citations?: LectureCitation[];
+}
+
+export interface LectureIndexReport {
+  lecture_id: string;
+  title: string;
+  passages: number;
+  terms: number;
+  timestamps: boolean;
+  embed_model: string | null;
+  index_bytes: number;
+  embedding_error: string | null;
+  build_seconds: number;
+}
+
+/**
+ * Index a transcribed lecture so chat messages sent with its lectureId are
+ * answered from its most relevant passages. Re-indexing replaces the old index.
+ */
+export async function indexLecture(
+  lectureId: string,
+  title: string,
+  transcription: Pick<TranscriptionResponse, "segments" | "paragraphs">
+): Promise<LectureIndexReport> {
+  const response = await fetch(`${API_URL}/lectures/${encodeURIComponent(lectureId)}/index`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ title, segments: transcription.segments, paragraphs: transcription.paragraphs }),
+  });
+
+  if (!response.ok) {
+    const error: ApiError = await response.json();
+    throw new Error(error.detail || error.error || "Lecture indexing failed");
+  }
+
+  return response.json();
+}
+
+/**
+ * One turn of a server-held chat session. Only the new message is sent; the
+ * backend keeps the history, compacted into a rolling summary. Leave sessionId
+ * out on the first turn and reuse the session_id the response returns. With
+ * lectureId (see indexLecture) the answer draws on that lecture, with citations.
+ */
+export async function chatInSession(message: string, sessionId?: string, lectureId?: string): Promise<ChatResponse> {
+  const response = await fetch(`${API_URL}/chat`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ message, session_id: sessionId, lecture_id: lectureId }),
+  });
+
+  if (!response.ok) {
+    const error: ApiError = await response.json();
+    throw new Error(error.detail || error.error || "Chat failed");
+  }
+
+  return response.json();
 }
 
 export async function chatWithAI(